@@ -9,6 +9,7 @@ from .config import Settings
 _config = Settings.get_config(strict=False)
 
 from openg2p_fastapi_common.app import Initializer
+from openg2p_fastapi_common.health import get_health_prober, get_redis_check
 
 from .context import (
     queue_redis_async_pool,
@@ -26,6 +27,10 @@ class Initializer(Initializer):
     def initialize(self, **kwargs):
         # Initialize all Services, Controllers, any utils here.
         self.init_queue_redis_pools()
+        if _config.health_enabled:
+            get_health_prober().register_check(
+                "queue_redis", get_redis_check(queue_redis_async_pool.get)
+            )
 
         MapperResolveService()
         MapperLinkService()
@@ -43,6 +48,11 @@ class Initializer(Initializer):
             redis_asyncio.ConnectionPool.from_url(_config.queue_redis_source)
         )
 
+    def post_fork(self):
+        super().post_fork()
+        # Redis pools must not be shared with the supervisor process.
+        self.init_queue_redis_pools()
+
     async def fastapi_app_shutdown(self, app: FastAPI):
         if queue_redis_conn_pool.get():
             queue_redis_conn_pool.get().close()
@@ -10,7 +10,9 @@ import orjson
 import redis
 import redis.asyncio as redis_asyncio
 from openg2p_fastapi_common.errors.base_exception import BaseAppException
+from openg2p_fastapi_common.http_client import get_http_client, get_sync_http_client
 from openg2p_fastapi_common.service import BaseService
+from openg2p_fastapi_common.tasks import TaskRejected, get_task_supervisor
 
 from ..config import Settings
 from ..context import queue_redis_async_pool, queue_redis_conn_pool
@@ -53,10 +55,17 @@ class MapperResolveService(BaseService):
             return txn_status
 
         if not wait_for_response:
-            asyncio.create_task(
-                self.start_resolve_process(resolve_http_request, txn_status)
-            )
-            await queue.aclose()
+            try:
+                get_task_supervisor().submit(
+                    "mapper_resolve",
+                    self.start_resolve_process(resolve_http_request, txn_status),
+                )
+            except TaskRejected:
+                # The txn would never be processed.
+                await queue.delete(f"{_config.queue_resolve_name}{txn_status.txn_id}")
+                raise
+            finally:
+                await queue.aclose()
             return txn_status
 
         await self.start_resolve_process(resolve_http_request, txn_status)
@@ -128,14 +137,12 @@ class MapperResolveService(BaseService):
         self, resolve_http_request: ResolveHttpRequest, txn_status: TxnStatus
     ):
         try:
-            client = httpx.AsyncClient()
-            res = await client.post(
+            res = await get_http_client("mapper").post(
                 _config.mapper_resolve_url,
                 content=resolve_http_request.model_dump_json(),
                 headers={"content-type": "application/json"},
                 timeout=_config.mapper_api_timeout_secs,
             )
-            await client.aclose()
             res.raise_for_status()
             res = CommonResponseMessage.model_validate(res.json())
             if res.message.ack_status != Ack.ACK:
@@ -156,7 +163,7 @@ class MapperResolveService(BaseService):
         self, resolve_http_request: ResolveHttpRequest, txn_status: TxnStatus
     ):
         try:
-            res = httpx.post(
+            res = get_sync_http_client("mapper").post(
                 _config.mapper_resolve_url,
                 content=resolve_http_request.model_dump_json(),
                 headers={"content-type": "application/json"},
@@ -10,7 +10,9 @@ import orjson
 import redis
 import redis.asyncio as redis_asyncio
 from openg2p_fastapi_common.errors.base_exception import BaseAppException
+from openg2p_fastapi_common.http_client import get_http_client, get_sync_http_client
 from openg2p_fastapi_common.service import BaseService
+from openg2p_fastapi_common.tasks import TaskRejected, get_task_supervisor
 
 from ..config import Settings
 from ..context import queue_redis_async_pool, queue_redis_conn_pool
@@ -51,10 +53,17 @@ class MapperUpdateService(BaseService):
             return txn_status
 
         if not wait_for_response:
-            asyncio.create_task(
-                self.start_update_process(update_http_request, txn_status)
-            )
-            await queue.aclose()
+            try:
+                get_task_supervisor().submit(
+                    "mapper_update",
+                    self.start_update_process(update_http_request, txn_status),
+                )
+            except TaskRejected:
+                # The txn would never be processed.
+                await queue.delete(f"{_config.queue_update_name}{txn_status.txn_id}")
+                raise
+            finally:
+                await queue.aclose()
             return txn_status
 
         await self.start_update_process(update_http_request, txn_status)
@@ -124,14 +133,12 @@ class MapperUpdateService(BaseService):
         self, update_http_request: UpdateHttpRequest, txn_status: TxnStatus
     ):
         try:
-            client = httpx.AsyncClient()
-            res = await client.post(
+            res = await get_http_client("mapper").post(
                 _config.mapper_update_url,
                 content=update_http_request.model_dump_json(),
                 headers={"content-type": "application/json"},
                 timeout=_config.mapper_api_timeout_secs,
             )
-            await client.aclose()
             res.raise_for_status()
             res = CommonResponseMessage.model_validate(res.json())
             if res.message.ack_status != Ack.ACK:
@@ -152,7 +159,7 @@ class MapperUpdateService(BaseService):
         self, update_http_request: UpdateHttpRequest, txn_status: TxnStatus
     ):
         try:
-            res = httpx.post(
+            res = get_sync_http_client("mapper").post(
                 _config.mapper_update_url,
                 content=update_http_request.model_dump_json(),
                 headers={"content-type": "application/json"},
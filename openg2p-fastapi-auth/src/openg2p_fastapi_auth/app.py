@@ -22,9 +22,11 @@ class Initializer(Initializer):
         OAuthController().post_init()
 
     def migrate_database(self, args):
-        super().migrate_database(args)
-
         async def migrate():
             await LoginProvider.create_migrate()
 
-        asyncio.run(migrate())
+        # Tables are created before the versioned migrations, which may alter them.
+        if not args.dry_run:
+            asyncio.run(migrate())
+
+        super().migrate_database(args)
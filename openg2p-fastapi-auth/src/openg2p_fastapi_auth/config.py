@@ -20,6 +20,12 @@ class Settings(Settings):
     )
 
     login_providers_table_name: str = "login_providers"
+    # Seconds to cache login providers in process. 0 to disable.
+    # Changes made from one worker process are only seen by the others
+    # once their cached entries expire, so enable only if that is acceptable.
+    login_providers_cache_ttl_secs: float = 0
+    # Seconds to cache the getLoginProviders response. 0 to disable.
+    login_providers_response_cache_ttl_secs: float = 60
 
     auth_enabled: bool = True
 
@@ -3,13 +3,14 @@ import secrets
 import urllib.parse
 from typing import Annotated, List, Union
 
-import httpx
 import orjson
 from fastapi import Depends, Response
 from fastapi.responses import RedirectResponse
 from jose import jwt
 from openg2p_fastapi_common.controller import BaseController
 from openg2p_fastapi_common.errors.http_exceptions import InternalServerError
+from openg2p_fastapi_common.http_client import get_http_client
+from openg2p_fastapi_common.response_cache import cached_response
 
 from ..config import Settings
 from ..dependencies import JwtBearerAuth
@@ -85,6 +86,7 @@ class AuthController(BaseController):
         response.delete_cookie("X-Access-Token")
         response.delete_cookie("X-ID-Token")
 
+    @cached_response(ttl=_config.login_providers_response_cache_ttl_secs)
     async def get_login_providers(self):
         """
         Get available Login Providers List. Can also be used to display login providers on UI.
@@ -174,7 +176,7 @@ class AuthController(BaseController):
             provider.authorization_parameters
         )
         try:
-            response = httpx.get(
+            response = await get_http_client("auth").get(
                 auth_params.validate_endpoint,
                 headers={"Authorization": f"Bearer {access_token}"},
             )
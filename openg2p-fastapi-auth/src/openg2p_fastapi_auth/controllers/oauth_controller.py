@@ -1,13 +1,13 @@
 import logging
 from datetime import datetime, timedelta, timezone
 
-import httpx
 import orjson
 from fastapi import Request
 from fastapi.responses import RedirectResponse
 from jose import jwt
 from openg2p_fastapi_common.controller import BaseController
 from openg2p_fastapi_common.errors.http_exceptions import UnauthorizedError
+from openg2p_fastapi_common.http_client import get_http_client
 
 from ..config import Settings
 from ..models.orm.login_provider import LoginProviderTypes
@@ -98,7 +98,7 @@ class OAuthController(BaseController):
             ):
                 token_auth = (auth_parameters.client_id, auth_parameters.client_secret)
             try:
-                res = httpx.post(
+                res = await get_http_client("auth").post(
                     auth_parameters.token_endpoint,
                     auth=token_auth,
                     data=orjson.loads(orjson.dumps(token_request_data)),
@@ -117,7 +117,7 @@ class OAuthController(BaseController):
             access_token: str = res["access_token"]
             id_token: str = res["id_token"]
 
-            config_dict = _config.model_dump()
+            config_dict = _config.get_config_view()
             access_token_payload = jwt.get_unverified_claims(access_token)
             response = RedirectResponse(state.get("r", "/"))
             response.set_cookie(
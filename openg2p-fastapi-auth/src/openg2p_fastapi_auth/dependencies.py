@@ -1,6 +1,5 @@
 from typing import Optional
 
-import httpx
 from fastapi import Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt
@@ -9,6 +8,7 @@ from openg2p_fastapi_common.errors.http_exceptions import (
     InternalServerError,
     UnauthorizedError,
 )
+from openg2p_fastapi_common.http_client import get_http_client
 
 from .config import Settings
 from .context import jwks_cache
@@ -21,7 +21,7 @@ class JwtBearerAuth(HTTPBearer):
     async def __call__(
         self, request: Request
     ) -> Optional[HTTPAuthorizationCredentials]:
-        config_dict = _config.model_dump()
+        config_dict = _config.get_config_view()
         if not config_dict.get("auth_enabled", None):
             return None
 
@@ -85,7 +85,7 @@ class JwtBearerAuth(HTTPBearer):
                     else iss.rstrip("/") + "/.well-known/jwks.json"
                 )
 
-                res = httpx.get(jwks_url)
+                res = await get_http_client("auth").get(jwks_url)
                 res.raise_for_status()
                 jwks = res.json()
                 jwks_cache.get()[iss] = jwks
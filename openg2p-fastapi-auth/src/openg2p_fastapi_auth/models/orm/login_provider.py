@@ -17,6 +17,7 @@ class LoginProviderTypes(Enum):
 
 class LoginProvider(BaseORMModelWithTimes):
     __tablename__ = _config.login_providers_table_name
+    __cache_ttl__ = _config.login_providers_cache_ttl_secs
 
     name: Mapped[str] = mapped_column(String())
     type: Mapped[LoginProviderTypes] = mapped_column(SaEnum(LoginProviderTypes))
@@ -0,0 +1,74 @@
+"""Microbenchmark of BaseComponent.get_component against a linear registry scan.
+
+Usage: python benchmarks/bench_component_registry.py [--components N] [--lookups N]
+"""
+
+import argparse
+import timeit
+
+from openg2p_fastapi_common.component import BaseComponent
+from openg2p_fastapi_common.context import component_registry
+from openg2p_fastapi_common.utils.versioned_list import VersionedList
+
+
+def list_scan_get_component(cls, name="", strict=False):
+    # Linear scan, as get_component used to be implemented.
+    for component in component_registry.get():
+        result = None
+        if strict:
+            if cls is type(component):
+                result = component
+        else:
+            if isinstance(component, cls):
+                result = component
+
+        if result:
+            if name:
+                if name == result.name:
+                    return result
+            else:
+                return result
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--components", type=int, default=300)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    component_registry.set(VersionedList())
+    component_classes = [
+        type(f"Component{i}", (BaseComponent,), {}) for i in range(args.components)
+    ]
+    for component_class in component_classes:
+        component_class(name=component_class.__name__)
+
+    # Worst case for the scan: the last registered component.
+    target = component_classes[-1]
+    cases = {
+        "typed": {},
+        "strict": {"strict": True},
+        "named": {"name": target.__name__},
+    }
+    print(f"{args.components} components, {args.lookups} lookups per case")
+    for case, kwargs in cases.items():
+        assert target.get_component(**kwargs) is list_scan_get_component(
+            target, **kwargs
+        )
+        indexed = timeit.timeit(
+            lambda kwargs=kwargs: target.get_component(**kwargs), number=args.lookups
+        )
+        scanned = timeit.timeit(
+            lambda kwargs=kwargs: list_scan_get_component(target, **kwargs),
+            number=args.lookups,
+        )
+        print(
+            f"{case:>8}: indexed {indexed / args.lookups * 1e9:10.1f} ns/op, "
+            f"list scan {scanned / args.lookups * 1e9:10.1f} ns/op, "
+            f"speedup {scanned / indexed:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Benchmarks of the request path of openg2p_fastapi_common, written as JSON.
+
+Measures app startup (imports and Initializer construction separately),
+/ping and error path throughput with an in process ASGI client,
+BaseComponent.get_component and Settings.get_config. Needs no DB or network.
+
+Usage: python benchmarks/bench_request_path.py [--output results.json]
+           [--compare baseline.json] [--requests N] [--concurrency N] [--lookups N]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from contextlib import contextmanager
+
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+from openg2p_fastapi_common.ping import Initializer, PingInitializer
+imported = time.perf_counter()
+Initializer()
+PingInitializer()
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def bench_startup(runs: int) -> dict:
+    # In new interpreters, as imports are cached in this one.
+    durations = [
+        [
+            float(duration)
+            for duration in subprocess.run(
+                [sys.executable, "-c", STARTUP_CODE],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            .stdout.splitlines()[-1]
+            .split()
+        ]
+        for _ in range(runs)
+    ]
+    import_durations = [import_secs for import_secs, _ in durations]
+    init_durations = [init_secs for _, init_secs in durations]
+    return {
+        "runs": runs,
+        "import_min_secs": min(import_durations),
+        "import_median_secs": statistics.median(import_durations),
+        "init_min_secs": min(init_durations),
+        "init_median_secs": statistics.median(init_durations),
+    }
+
+
+def create_app():
+    from openg2p_fastapi_common.controller import BaseController
+    from openg2p_fastapi_common.errors.http_exceptions import UnauthorizedError
+    from openg2p_fastapi_common.ping import Initializer, PingInitializer
+
+    class BenchController(BaseController):
+        def __init__(self, name="", **kwargs):
+            super().__init__(name, **kwargs)
+            self.router.add_api_route("/bench/error", self.get_error, methods=["GET"])
+
+        async def get_error(self):
+            raise UnauthorizedError()
+
+    initializer = Initializer()
+    PingInitializer()
+    BenchController().post_init()
+    # Like the run command, so the request path includes the metrics middleware.
+    initializer.init_server()
+
+    from openg2p_fastapi_common.context import app_registry
+
+    return app_registry.get()
+
+
+@contextmanager
+def silence_logs():
+    # Logs are still formatted, so their cost is measured, but not written to the terminal.
+    import json_logging
+    from openg2p_fastapi_common.config import Settings
+
+    logger_name = Settings.get_config(strict=False).logging_default_logger_name
+    handlers = [
+        handler
+        for logger in (
+            logging.getLogger(logger_name),
+            json_logging.get_request_logger(),
+        )
+        for handler in logger.handlers
+        if isinstance(handler, logging.StreamHandler)
+    ]
+    with open(os.devnull, "w") as devnull:
+        streams = [handler.setStream(devnull) for handler in handlers]
+        try:
+            yield
+        finally:
+            for handler, stream in zip(handlers, streams):
+                handler.setStream(stream)
+
+
+async def bench_requests(app, path: str, requests: int, concurrency: int) -> dict:
+    import httpx
+
+    latencies = []
+
+    async def worker(client, count):
+        for _ in range(count):
+            start = time.perf_counter()
+            await client.get(path)
+            latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        response = await client.get(path)
+        await worker(client, min(requests, 100))
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(worker(client, requests // concurrency) for _ in range(concurrency))
+        )
+        duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "status": response.status_code,
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "requests_per_sec": len(latencies) / duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def bench_ns_per_op(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+
+def bench_get_component(lookups: int) -> dict:
+    from openg2p_fastapi_common.component import BaseComponent
+    from openg2p_fastapi_common.exception import BaseExceptionHandler
+
+    return {
+        "typed_ns_per_op": bench_ns_per_op(BaseExceptionHandler.get_component, lookups),
+        "named_ns_per_op": bench_ns_per_op(
+            lambda: BaseComponent.get_component(name="missing"), lookups
+        ),
+    }
+
+
+def bench_get_config(lookups: int) -> dict:
+    from openg2p_fastapi_common.config import Settings
+
+    return {
+        "ns_per_op": bench_ns_per_op(
+            lambda: Settings.get_config(strict=False), lookups
+        ),
+        "config_view_ns_per_op": bench_ns_per_op(
+            Settings.get_config(strict=False).get_config_view, lookups
+        ),
+    }
+
+
+def compare(results: dict, baseline: dict) -> list:
+    # Ratio of every numeric result to the baseline. Above 1 is slower for
+    # times, and faster for requests_per_sec.
+    lines = []
+    for bench, values in results.items():
+        for key, value in values.items():
+            if key in ("runs", "requests", "concurrency", "status"):
+                continue
+            base = baseline.get("results", {}).get(bench, {}).get(key)
+            if isinstance(value, (int, float)) and isinstance(base, (int, float)):
+                ratio = value / base if base else float("inf")
+                lines.append(f"{bench}.{key}: {base:.4g} -> {value:.4g} ({ratio:.2f}x)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="File to write the JSON results to.")
+    parser.add_argument("--compare", help="JSON results of an earlier run.")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = {"startup": bench_startup(args.startup_runs)}
+    app = create_app()
+    with silence_logs():
+        results["ping"] = asyncio.run(
+            bench_requests(app, "/ping", args.requests, args.concurrency)
+        )
+        results["error"] = asyncio.run(
+            bench_requests(app, "/bench/error", args.requests, args.concurrency)
+        )
+    results["get_component"] = bench_get_component(args.lookups)
+    results["get_config"] = bench_get_config(args.lookups)
+
+    from openg2p_fastapi_common import __version__
+
+    output = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    output_json = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output_json + "\n")
+    else:
+        print(output_json)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(results, json.load(f))), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
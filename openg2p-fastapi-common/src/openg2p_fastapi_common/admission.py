@@ -0,0 +1,177 @@
+"""Module containing admission control, limiting concurrent requests globally and per route"""
+
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .component import BaseComponent
+from .config import Settings
+from .errors import ErrorListResponse, ErrorResponse
+from .errors.http_exceptions import ServiceUnavailableError
+
+_config = Settings.get_config(strict=False)
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    """
+    Allows up to limit concurrent holders. Others wait in a queue of up to queue_size,
+    for up to timeout seconds each, and are rejected with AdmissionRejected
+    if the queue is full or the timeout expires.
+    """
+
+    def __init__(
+        self, limit: int, queue_size: int = 0, timeout: Optional[float] = None
+    ):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            self.active += 1
+            return
+        if self.waiting >= self.queue_size or not self.timeout:
+            self.rejected += 1
+            raise AdmissionRejected()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AdmissionRejected() from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def limit_concurrency(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+class ConcurrencyPool(ConcurrencyLimiter, BaseComponent):
+    """
+    Named concurrency limit shared by the routes it is declared on, as a dependency.
+    See BaseController.concurrency_pool. The limit can be overridden with
+    admission_route_pools in the config.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        queue_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        ConcurrencyLimiter.__init__(
+            self,
+            _config.admission_route_pools.get(name, limit),
+            queue_size=_config.admission_queue_size
+            if queue_size is None
+            else queue_size,
+            timeout=_config.admission_queue_timeout_secs
+            if timeout is None
+            else timeout,
+        )
+        BaseComponent.__init__(self, name=name)
+
+    async def __call__(self):
+        try:
+            await self.acquire()
+        except AdmissionRejected:
+            raise ServiceUnavailableError(
+                headers={"Retry-After": str(_config.admission_retry_after_secs)}
+            ) from None
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits the number of requests processed concurrently by the worker,
+    responding 503 with Retry-After to the requests that can't be admitted in time.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: ConcurrencyLimiter):
+        self.app = app
+        self.limiter = limiter
+        self.exclude_paths: List[re.Pattern] = [
+            re.compile(path) for path in _config.admission_exclude_paths
+        ]
+        self.rejected_body = orjson.dumps(
+            ErrorListResponse(
+                errors=[
+                    ErrorResponse(
+                        code=ServiceUnavailableError().code,
+                        message=ServiceUnavailableError().message,
+                    )
+                ]
+            ).model_dump()
+        )
+        self.rejected_headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(self.rejected_body)).encode()),
+            (b"retry-after", str(_config.admission_retry_after_secs).encode()),
+        ]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or any(
+            pattern.match(scope["path"]) for pattern in self.exclude_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.limiter.acquire()
+        except AdmissionRejected:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": self.rejected_headers,
+                }
+            )
+            await send({"type": "http.response.body", "body": self.rejected_body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+def get_concurrency_pool(name: str, limit: int, **kwargs) -> ConcurrencyPool:
+    """
+    Returns the registered ConcurrencyPool of the name, creating it if not registered yet.
+    """
+    return ConcurrencyPool.get_component(name=name) or ConcurrencyPool(
+        name, limit, **kwargs
+    )
@@ -1,28 +1,50 @@
 """Module containing initialization instructions and FastAPI app"""
 import argparse
+import asyncio
 import logging
 import sys
-from contextlib import asynccontextmanager
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Optional
 
 import json_logging
 import orjson
-import uvicorn
-from fastapi import FastAPI
-from sqlalchemy.ext.asyncio import create_async_engine
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.routing import Route
 
 from .component import BaseComponent
 from .config import Settings
-from .context import app_registry, component_registry, dbengine
+from .context import (
+    app_registry,
+    component_registry,
+    dbengine,
+    dbsession_manager,
+    log_pipeline,
+    process_pool_executor,
+    thread_pool_executor,
+)
 from .exception import BaseExceptionHandler
+from .request_log import RequestLogFormatter, register_request_log_support
 
 _config = Settings.get_config(strict=False)
 _logger = logging.getLogger(_config.logging_default_logger_name)
 
 
 class Initializer(BaseComponent):
+    """
+    Modules of subsystems with heavy dependencies (uvicorn, sqlalchemy, prometheus_client, ...)
+    are imported by the init methods and commands that use them, to keep startup fast.
+    The subsystems only needed to serve requests are initialized by init_server,
+    when the run command starts, so other commands (migrate, getOpenAPI, ...) don't load them.
+    """
+
     def __init__(self, name="", **kwargs):
         super().__init__(name=name, **kwargs)
+        start = time.perf_counter()
         self.initialize()
+        # Reported by the startup-profile command.
+        self.initialize_duration = time.perf_counter() - start
 
     def initialize(self):
         """
@@ -30,26 +52,113 @@ class Initializer(BaseComponent):
         """
         self.init_logger()
         self.init_app()
-        self.init_db()
+        self.init_admission_control()
+        self.init_compression()
+        self.init_profiling()
 
         BaseExceptionHandler()
 
+    def init_server(self):
+        """
+        Initializes the subsystems only needed to serve requests: metrics, DB,
+        executors, HTTP clients and health probes. Called by the run command.
+        Call it before serving the app in any other way, eg. from an ASGI server.
+        """
+        self.init_metrics()
+        self.init_db()
+        self.init_db_session_middleware()
+        self.init_executors()
+        self.init_http_client()
+        self.init_health()
+
     def init_logger(self):
+        register_request_log_support()
         json_logging.init_fastapi(enable_json=True)
         json_logging.JSON_SERIALIZER = lambda log: orjson.dumps(log).decode("utf-8")
         _logger.setLevel(getattr(logging, _config.logging_level))
-        _logger.addHandler(logging.StreamHandler(sys.stdout))
+        handlers = [logging.StreamHandler(sys.stdout)]
         if _config.logging_file_name:
-            file_handler = logging.FileHandler(_config.logging_file_name)
-            _logger.addHandler(file_handler)
+            handlers.append(logging.FileHandler(_config.logging_file_name))
+        if not _config.logging_queue_enabled:
+            for handler in handlers:
+                _logger.addHandler(handler)
+            return _logger
+
+        from .log_pipeline import LogPipeline, QueuedJSONLogFormatter
+
+        pipeline = log_pipeline.get()
+        if not pipeline:
+            pipeline = LogPipeline(
+                max_size=_config.logging_queue_max_size,
+                overflow_policy=_config.logging_queue_overflow_policy,
+                sample_rate=_config.logging_queue_sample_rate,
+                batch_size=_config.logging_queue_batch_size,
+                flush_timeout=_config.logging_queue_flush_timeout_secs,
+            )
+            log_pipeline.set(pipeline)
+        for handler in handlers:
+            handler.setFormatter(QueuedJSONLogFormatter())
+        _logger.addHandler(pipeline.get_handler(handlers))
+        pipeline.start()
         return _logger
 
     def init_db(self):
         if _config.db_datasource:
-            db_engine = create_async_engine(
-                _config.db_datasource, echo=_config.db_logging
-            )
+            from .db import DBSessionManager, create_db_engine
+
+            db_engine = create_db_engine(_config.db_datasource)
             dbengine.set(db_engine)
+            dbsession_manager.set(
+                DBSessionManager(
+                    db_engine,
+                    replica_engines=[
+                        create_db_engine(replica_datasource)
+                        for replica_datasource in _config.db_replica_datasources
+                    ],
+                    replica_strategy=_config.db_replica_strategy,
+                )
+            )
+
+    def init_db_session_middleware(self):
+        if not _config.db_datasource:
+            return
+        from starlette.middleware import Middleware
+
+        from .db import DBSessionMiddleware
+
+        # Added as the innermost middleware, so the commit happens before
+        # any other middleware sees the response.
+        app_registry.get().user_middleware.append(Middleware(DBSessionMiddleware))
+
+    def init_executors(self):
+        from .executors import create_process_pool_executor, create_thread_pool_executor
+
+        thread_pool_executor.set(create_thread_pool_executor())
+        process_pool_executor.set(create_process_pool_executor())
+
+    def init_http_client(self):
+        from .http_client import HttpClientManager
+
+        return HttpClientManager()
+
+    def init_health(self):
+        if not _config.health_enabled:
+            return None
+        from .health import (
+            check_db_engine,
+            get_db_replica_check,
+            get_health_prober,
+            get_http_check,
+        )
+
+        prober = get_health_prober()
+        if _config.db_datasource:
+            prober.register_check("db", check_db_engine)
+            for i in range(len(_config.db_replica_datasources)):
+                prober.register_check(f"db_replica_{i}", get_db_replica_check(i))
+        for name, url in _config.health_http_checks.items():
+            prober.register_check(name, get_http_check(url), critical=False)
+        return prober
 
     def init_app(self):
         app = FastAPI(
@@ -66,20 +175,172 @@ class Initializer(BaseComponent):
             },
             lifespan=self.fastapi_app_lifespan,
             root_path=_config.openapi_root_path if _config.openapi_root_path else "",
+            openapi_url=None if _config.openapi_mode == "disabled" else "/openapi.json",
+        )
+        self.init_openapi(app)
+        json_logging.init_request_instrument(
+            app,
+            custom_formatter=RequestLogFormatter,
+            exclude_url_patterns=_config.logging_request_exclude_paths,
         )
-        json_logging.init_request_instrument(app)
+        if log_pipeline.get():
+            # Request logs are formatted from the request object, not the call stack,
+            # so their formatter works as is in the writer thread.
+            request_logger = json_logging.get_request_logger()
+            request_logger.handlers = [
+                log_pipeline.get().get_handler(
+                    request_logger.handlers, capture_correlation_id=False
+                )
+            ]
         app_registry.set(app)
         return app
 
+    def init_openapi(self, app: FastAPI):
+        # Serialized schemas by root path, which may differ per request behind proxies.
+        app.state.openapi_json = {}
+        if not app.openapi_url:
+            return
+        if _config.openapi_mode == "file":
+            with open(_config.openapi_file, "rb") as f:
+                openapi_json = f.read()
+            app.openapi_schema = orjson.loads(openapi_json)
+            app.state.openapi_json[app.root_path.rstrip("/")] = openapi_json
+        # Replaces the route added by FastAPI, which serializes the schema on every request.
+        for i, route in enumerate(app.router.routes):
+            if isinstance(route, Route) and route.path == app.openapi_url:
+                app.router.routes[i] = Route(
+                    app.openapi_url, self.get_openapi_json, include_in_schema=False
+                )
+
+    def build_openapi_json(
+        self, app: FastAPI, root_path: Optional[str] = None
+    ) -> bytes:
+        """
+        Serializes the schema, listing the root path (by default the app's) first
+        in its servers, like FastAPI does with the root path of the request scope.
+        """
+        root_path = (app.root_path if root_path is None else root_path).rstrip("/")
+        schema = app.openapi()
+        servers = schema.get("servers", [])
+        if (
+            root_path
+            and app.root_path_in_servers
+            and not any(server.get("url") == root_path for server in servers)
+        ):
+            schema = {**schema, "servers": [{"url": root_path}, *servers]}
+        openapi_json = app.state.openapi_json[root_path] = orjson.dumps(schema)
+        return openapi_json
+
+    async def get_openapi_json(self, request: Request) -> Response:
+        app = request.app
+        root_path = request.scope.get("root_path", "").rstrip("/")
+        openapi_json = app.state.openapi_json.get(root_path)
+        if openapi_json is None:
+            # Built in the threadpool, so that a large schema doesn't block the event loop.
+            openapi_json = await run_in_threadpool(
+                self.build_openapi_json, app, root_path
+            )
+        return Response(openapi_json, media_type="application/json")
+
+    def init_admission_control(self):
+        if not _config.admission_max_concurrency:
+            return None
+        from .admission import AdmissionControlMiddleware, ConcurrencyLimiter
+
+        limiter = ConcurrencyLimiter(
+            _config.admission_max_concurrency,
+            queue_size=_config.admission_queue_size,
+            timeout=_config.admission_queue_timeout_secs,
+        )
+        app_registry.get().add_middleware(AdmissionControlMiddleware, limiter=limiter)
+        return limiter
+
+    def init_compression(self):
+        if not _config.compression_enabled:
+            return
+        from .compression import CompressionMiddleware
+
+        app_registry.get().add_middleware(CompressionMiddleware)
+
+    def init_metrics(self):
+        if not _config.metrics_enabled:
+            return None
+        from .metrics import MetricsController, MetricsManager, MetricsMiddleware
+
+        metrics = MetricsManager()
+        app_registry.get().add_middleware(MetricsMiddleware, metrics=metrics)
+        MetricsController().post_init()
+        return metrics
+
+    def init_profiling(self):
+        if not _config.profiling_enabled:
+            return None
+        from starlette.middleware import Middleware
+
+        from .profiling import ProfilingController, ProfilingMiddleware, RequestProfiler
+
+        profiler = RequestProfiler()
+        # Added as the innermost middleware, because middlewares based on BaseHTTPMiddleware
+        # run the rest of the app in another task, which would hide it from the profiler.
+        app_registry.get().user_middleware.append(
+            Middleware(ProfilingMiddleware, profiler=profiler)
+        )
+        ProfilingController().post_init()
+        return profiler
+
     def main(self):
         parser = argparse.ArgumentParser(description="FastApi Common Server")
         subparsers = parser.add_subparsers(help="List Commands.", required=True)
         run_subparser = subparsers.add_parser("run", help="Run API Server.")
+        run_subparser.add_argument(
+            "--workers",
+            type=int,
+            default=_config.server_workers,
+            help="Number of pre-forked worker processes.",
+        )
+        run_subparser.add_argument(
+            "--loop",
+            choices=["auto", "asyncio", "uvloop"],
+            default=_config.server_loop,
+            help="Event loop implementation.",
+        )
+        run_subparser.add_argument(
+            "--http",
+            choices=["auto", "h11", "httptools"],
+            default=_config.server_http,
+            help="HTTP protocol implementation.",
+        )
+        run_subparser.add_argument(
+            "--backlog",
+            type=int,
+            default=_config.server_backlog,
+            help="Maximum number of pending connections.",
+        )
+        run_subparser.add_argument(
+            "--timeout-keep-alive",
+            type=int,
+            default=_config.server_timeout_keep_alive,
+            help="Seconds to keep idle connections open.",
+        )
+        run_subparser.add_argument(
+            "--limit-concurrency",
+            type=int,
+            default=_config.server_limit_concurrency,
+            help="Maximum concurrent connections/tasks per worker before responding 503.",
+        )
         run_subparser.set_defaults(func=self.run_server)
         migrate_subparser = subparsers.add_parser(
             "migrate", help="Create/Migrate Database Tables."
         )
-        migrate_subparser.set_defaults(func=self.migrate_database)
+        migrate_subparser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only log the statements of the pending migrations.",
+        )
+        migrate_subparser.add_argument(
+            "--target", help="Apply pending migrations only up to this version."
+        )
+        migrate_subparser.set_defaults(func=self.migrate_database, init=self.init_db)
         openapi_subparser = subparsers.add_parser(
             "getOpenAPI", help="Get OpenAPI Json of the Server."
         )
@@ -87,21 +348,133 @@ class Initializer(BaseComponent):
             "filepath", help="Path of the Output OpenAPI Json File."
         )
         openapi_subparser.set_defaults(func=self.get_openapi)
+        startup_profile_subparser = subparsers.add_parser(
+            "startup-profile",
+            help="Report import time per module and init time per Initializer.",
+        )
+        startup_profile_subparser.add_argument(
+            "--top", type=int, default=25, help="Number of packages and modules listed."
+        )
+        startup_profile_subparser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+        # Used internally, by the profiled run of the same command.
+        startup_profile_subparser.add_argument(
+            "--initializer-times-file", help=argparse.SUPPRESS
+        )
+        startup_profile_subparser.set_defaults(func=self.startup_profile)
         args = parser.parse_args()
+        # Subsystems needed by the command, other than run, which calls init_server.
+        if getattr(args, "init", None):
+            args.init()
         args.func(args)
 
     def run_server(self, args):
-        app = app_registry.get()
-        uvicorn.run(
-            app,
-            host=_config.host,
-            port=_config.port,
-            access_log=False,
-        )
+        import uvicorn
+
+        from .supervisor import WorkerSupervisor, temp_multiproc_dir
+
+        # Entered before init_server imports the metrics module (see temp_multiproc_dir).
+        with temp_multiproc_dir() if args.workers > 1 else nullcontext():
+            self.init_server()
+            app = app_registry.get()
+            if _config.openapi_mode == "eager" and app.openapi_url:
+                # Before forking workers, so that it is built once and shared.
+                self.build_openapi_json(app)
+            server_kwargs = {
+                "host": _config.host,
+                "port": _config.port,
+                "access_log": False,
+                "loop": args.loop,
+                "http": args.http,
+                "backlog": args.backlog,
+                "timeout_keep_alive": args.timeout_keep_alive,
+                "limit_concurrency": args.limit_concurrency,
+            }
+            from .metrics import MetricsManager
+
+            metrics = MetricsManager.get_component()
+            if metrics:
+                metrics.clear_multiprocess_dir()
+            if args.workers <= 1:
+                uvicorn.run(app, **server_kwargs)
+                return
+
+            if metrics and not metrics.is_multiprocess():
+                # Only if prometheus_client was imported before the run command,
+                # eg. by a service creating its metrics at import.
+                _logger.warning(
+                    "Metrics are not aggregated across workers. "
+                    "Set metrics_multiproc_dir in the config."
+                )
+            WorkerSupervisor(
+                uvicorn.Config(app, **server_kwargs),
+                args.workers,
+                post_fork=self.init_worker,
+                on_worker_exit=metrics.mark_process_dead if metrics else None,
+                gc_freeze=_config.server_gc_freeze,
+                restart_delay=_config.server_worker_restart_delay_secs,
+            ).run()
+
+    def init_worker(self):
+        """
+        Runs inside every forked worker process, before it starts serving.
+        Drops the resources created by the supervisor, that are not fork safe,
+        and calls post_fork on all Initializers.
+        """
+        dbengine.set(None)
+        dbsession_manager.set(None)
+        # The threads of the executors don't survive the fork.
+        thread_pool_executor.set(None)
+        process_pool_executor.set(None)
+        from .http_client import HttpClientManager
+
+        http_client_manager = HttpClientManager.get_component()
+        if http_client_manager:
+            http_client_manager.reset()
+        for initializer in component_registry.get():
+            if isinstance(initializer, Initializer):
+                initializer.post_fork()
+
+    def post_fork(self):
+        # Overload this method to (re)create per process resources,
+        # like connection pools, in a forked worker process.
+        if not dbengine.get():
+            self.init_db()
+        if not thread_pool_executor.get():
+            self.init_executors()
 
     def migrate_database(self, args):
-        # Implement the logic for the 'migrate' subcommand here
+        # Overload this method to create tables before the versioned migrations.
         _logger.info("Starting DB migrations.")
+        if not _config.db_datasource:
+            return
+        from .migrations import MigrationRunner, get_registered_migrations
+
+        asyncio.run(
+            MigrationRunner(
+                _config.db_datasource,
+                get_registered_migrations(),
+                dry_run=args.dry_run,
+                target=args.target,
+            ).run()
+        )
+
+    def startup_profile(self, args):
+        from .startup_profile import (
+            format_startup_profile,
+            profile_startup,
+            write_initializer_times,
+        )
+
+        if args.initializer_times_file:
+            write_initializer_times(args.initializer_times_file)
+            return
+        profile = profile_startup(top=args.top)
+        if args.json:
+            print(orjson.dumps(profile, option=orjson.OPT_INDENT_2).decode())
+        else:
+            print(format_startup_profile(profile))
 
     def get_openapi(self, args):
         app = app_registry.get()
@@ -115,6 +488,24 @@ class Initializer(BaseComponent):
 
     async def fastapi_app_shutdown(self, app: FastAPI):
         # Overload this method to execute something on shutdown
+        from .tasks import TaskSupervisor
+
+        task_supervisor = TaskSupervisor.get_component()
+        if task_supervisor:
+            # Before the DB and other pools are closed, as running tasks may use them.
+            await task_supervisor.drain(_config.tasks_drain_timeout_secs)
+        if thread_pool_executor.get() or process_pool_executor.get():
+            from .executors import shutdown_executors
+
+            await shutdown_executors()
+        from .http_client import HttpClientManager
+
+        http_client_manager = HttpClientManager.get_component()
+        if http_client_manager:
+            await http_client_manager.aclose()
+        if dbsession_manager.get():
+            await dbsession_manager.get().dispose_replicas()
+            dbsession_manager.set(None)
         if dbengine.get():
             await dbengine.get().dispose()
             dbengine.set(None)
@@ -124,7 +515,19 @@ class Initializer(BaseComponent):
         for initializer in component_registry.get():
             if isinstance(initializer, Initializer):
                 await initializer.fastapi_app_startup(app)
+        prober = None
+        if _config.health_enabled:
+            from .health import HealthProber
+
+            prober = HealthProber.get_component()
+            if prober:
+                prober.start()
         yield
+        if prober:
+            await prober.stop()
         for initializer in component_registry.get():
             if isinstance(initializer, Initializer):
                 await initializer.fastapi_app_shutdown(app)
+        if log_pipeline.get():
+            # Flush the queued logs, once all initializers are done logging.
+            log_pipeline.get().stop()
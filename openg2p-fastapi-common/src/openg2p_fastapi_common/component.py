@@ -1,28 +1,65 @@
 """Module from initializing Component Class"""
 
-from .context import component_registry
+from .context import component_index, component_registry
 
 
 class BaseComponent:
     def __init__(self, name=""):
         self.name = name
         component_registry.get().append(self)
+        _get_component_index()
 
     @classmethod
     def get_component(cls, name="", strict=False):
-        for component in component_registry.get():
-            result = None
-            if strict:
-                if cls is type(component):
-                    result = component
-            else:
-                if isinstance(component, cls):
-                    result = component
-
-            if result:
-                if name:
-                    if name == result.name:
-                        return result
-                else:
-                    return result
-        return None
+        """
+        Returns the first registered component that is an instance of this class
+        (or exactly of this class, if strict), optionally matching the given name.
+        """
+        index = _get_component_index()
+        if name:
+            return index["strict_named" if strict else "named"].get((cls, name))
+        return index["strict" if strict else "typed"].get(cls)
+
+
+def _get_component_index() -> dict:
+    """
+    Returns the lookup index of component_registry, indexing any components
+    appended since the last call. The index is rebuilt if the registry was replaced
+    or changed otherwise (see VersionedList). Registries that are plain lists
+    can't be tracked, so their index is rebuilt on every call.
+    """
+    registry = component_registry.get()
+    index = component_index.get()
+    version = getattr(registry, "version", None)
+    if (
+        index.get("registry") is not registry
+        or version is None
+        or index["version"] != version
+    ):
+        index.clear()
+        index.update(
+            registry=registry,
+            version=version,
+            size=0,
+            strict={},
+            strict_named={},
+            typed={},
+            named={},
+        )
+    if index["size"] < len(registry):
+        for component in registry[index["size"] :]:
+            _index_component(index, component)
+        index["size"] = len(registry)
+    return index
+
+
+def _index_component(index: dict, component):
+    # Only the first component registered per key is kept,
+    # which matches the registration order lookup of get_component.
+    name = getattr(component, "name", "")
+    component_type = type(component)
+    index["strict"].setdefault(component_type, component)
+    index["strict_named"].setdefault((component_type, name), component)
+    for klass in component_type.__mro__:
+        index["typed"].setdefault(klass, component)
+        index["named"].setdefault((klass, name), component)
@@ -0,0 +1,214 @@
+"""Module containing the negotiated response compression middleware"""
+
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import Settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_config = Settings.get_config(strict=False)
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self.compressor = zlib.compressobj(
+            _config.compression_gzip_level, zlib.DEFLATED, 31
+        )
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=_config.compression_brotli_quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        data = self.compressor.process(data)
+        return data + (self.compressor.finish() if final else self.compressor.flush())
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(
+            level=_config.compression_zstd_level
+        ).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if final
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+
+ENCODERS: Dict[str, Callable] = {"gzip": _GzipEncoder}
+if brotli:
+    ENCODERS["br"] = _BrotliEncoder
+if zstandard:
+    ENCODERS["zstd"] = _ZstdEncoder
+
+
+def compression(enabled: bool = True, min_size: Optional[int] = None):
+    """
+    Decorator setting the compression of a route's responses, overriding the defaults
+    from the config. Eg. to never compress a route:
+    @compression(enabled=False)
+    async def get_ping(self): ...
+    """
+
+    def decorator(endpoint):
+        endpoint.__compression__ = {"enabled": enabled, "min_size": min_size}
+        return endpoint
+
+    return decorator
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    encodings = {}
+    for item in header.split(","):
+        encoding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if encoding:
+            encodings[encoding.strip().lower()] = quality
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best encoding accepted by the client, among
+    compression_encodings in order of preference. Skips responses smaller than the
+    minimum size, already encoded, or with content types not in compression_content_types.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    MAX_CACHED_ACCEPT_ENCODINGS = 256
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.encodings: List[str] = [
+            e for e in _config.compression_encodings if e in ENCODERS
+        ]
+        self.min_size = _config.compression_min_size
+        self.routes_default = _config.compression_routes_default
+        self.content_types = tuple(_config.compression_content_types)
+        self._selected_encodings: Dict[str, Optional[str]] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = self.select_encoding(accept_encoding)
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressedResponder(self, scope, encoding, send))
+
+    def select_encoding(self, accept_encoding: str) -> Optional[str]:
+        if not accept_encoding:
+            return None
+        if accept_encoding in self._selected_encodings:
+            return self._selected_encodings[accept_encoding]
+        accepted = parse_accept_encoding(accept_encoding)
+        selected, selected_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, accepted.get("*", 0.0))
+            if quality > selected_quality:
+                selected, selected_quality = encoding, quality
+        if len(self._selected_encodings) < self.MAX_CACHED_ACCEPT_ENCODINGS:
+            self._selected_encodings[accept_encoding] = selected
+        return selected
+
+    def get_route_settings(self, scope: Scope):
+        route_settings = getattr(
+            getattr(scope.get("route"), "endpoint", None), "__compression__", None
+        )
+        if not route_settings:
+            return self.routes_default, self.min_size
+        min_size = route_settings["min_size"]
+        return (
+            route_settings["enabled"],
+            self.min_size if min_size is None else min_size,
+        )
+
+
+class CompressedResponder:
+    def __init__(
+        self, middleware: CompressionMiddleware, scope: Scope, encoding: str, send: Send
+    ):
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = MutableHeaders(raw=message["headers"])
+            enabled, self.min_size = self.middleware.get_route_settings(self.scope)
+            content_length = headers.get("content-length")
+            self.passthrough = (
+                not enabled
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(
+                    self.middleware.content_types
+                )
+                or (content_length is not None and int(content_length) < self.min_size)
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body and len(body) < self.min_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.encoder = ENCODERS[self.encoding]()
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            body = self.encoder.compress(body, final=not more_body)
+            if not more_body:
+                headers["Content-Length"] = str(len(body))
+            await self.send(self.start_message)
+        else:
+            body = self.encoder.compress(body, final=not more_body)
+        await self.send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
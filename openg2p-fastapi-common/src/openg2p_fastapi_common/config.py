@@ -1,12 +1,18 @@
 """Module initializing configs"""
+import weakref
 from pathlib import Path
-from typing import Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
 
 from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from . import __version__
-from .context import config_registry
+from .context import config_index, config_registry
+
+# Config views, by id of the config. Kept outside the config instances,
+# so that copying or pickling a config doesn't carry its view along.
+_config_views: Dict[int, Mapping[str, Any]] = {}
 
 
 class Settings(BaseSettings):
@@ -17,9 +23,164 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
 
+    # Number of worker processes. If more than 1, workers are pre-forked
+    # from a supervisor process sharing the server socket.
+    server_workers: int = 1
+    # One of "auto", "asyncio", "uvloop"
+    server_loop: str = "auto"
+    # One of "auto", "h11", "httptools"
+    server_http: str = "auto"
+    server_backlog: int = 2048
+    server_timeout_keep_alive: int = 5
+    server_limit_concurrency: Optional[int] = None
+    server_worker_restart_delay_secs: float = 1
+    server_gc_freeze: bool = True
+
     logging_default_logger_name: str = "app"
     logging_level: str = "INFO"
     logging_file_name: Optional[Path] = None
+    # Format and write logs from a background thread, instead of the event loop.
+    logging_queue_enabled: bool = False
+    logging_queue_max_size: int = 10000
+    # One of "drop", "sample", "block". Drop discards records once the queue is full.
+    # Sample also keeps only a fraction of records below WARNING once it is half full.
+    # Block makes the logging call wait for space in the queue.
+    logging_queue_overflow_policy: str = "drop"
+    logging_queue_sample_rate: float = 0.1
+    logging_queue_batch_size: int = 500
+    logging_queue_flush_timeout_secs: float = 5
+    # Request logs. Sample rates (0 to 1) and levels of requests, by path regex.
+    # The first matching regex applies. Eg. {"^/ping$": 0.01}
+    logging_request_sample_rates: Dict[str, float] = {}
+    logging_request_levels: Dict[str, str] = {}
+    logging_request_default_level: str = "INFO"
+    # Requests with at least this status code are always logged, at ERROR. 0 to disable.
+    logging_request_always_log_status: int = 500
+    # Requests slower than this are always logged, at WARNING. 0 to disable.
+    logging_request_slow_threshold_ms: int = 1000
+    # Requests with paths matching these regexes are never logged.
+    logging_request_exclude_paths: List[str] = []
+    # Status classes ("4xx", "5xx") of handled exceptions logged with their traceback.
+    # The rest are logged in one line.
+    logging_exception_traceback_status_classes: List[str] = ["5xx"]
+    # Identical errors (by exception type, error code and status) logged per window.
+    # 0 to log all.
+    logging_exception_rate_limit_count: int = 10
+    logging_exception_rate_limit_window_secs: float = 60
+
+    # Admission control. Maximum concurrent requests per worker. 0 for no limit.
+    admission_max_concurrency: int = 0
+    # Requests over a limit wait, up to admission_queue_size of them, for up to
+    # admission_queue_timeout_secs, before being rejected with 503 and Retry-After.
+    admission_queue_size: int = 100
+    admission_queue_timeout_secs: float = 5
+    admission_retry_after_secs: int = 1
+    # Requests with paths matching these regexes skip the global limit. Eg. ["^/ping$"]
+    admission_exclude_paths: List[str] = []
+    # Limits of the named route concurrency pools, overriding those declared in code.
+    admission_route_pools: Dict[str, int] = {}
+
+    # Negotiated response compression. brotli and zstd need the "compression" extras.
+    compression_enabled: bool = False
+    # Encodings in order of preference, among those accepted by the client
+    compression_encodings: List[str] = ["zstd", "br", "gzip"]
+    compression_min_size: int = 1024
+    # If False, only routes opted in with the compression decorator are compressed.
+    compression_routes_default: bool = True
+    compression_content_types: List[str] = [
+        "application/json",
+        "application/xml",
+        "text/",
+    ]
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+
+    # Caching of the responses of routes decorated with cached_response.
+    response_cache_enabled: bool = True
+    # Default backend of the routes, "memory" or "redis".
+    response_cache_backend: str = "memory"
+    response_cache_max_size: int = 1024
+    response_cache_redis_url: Optional[str] = None
+    response_cache_key_prefix: str = "response_cache:"
+
+    # Background health prober, serving cached liveness and readiness.
+    health_enabled: bool = True
+    health_probe_interval_secs: float = 10
+    health_probe_timeout_secs: float = 2
+    # Liveness fails if no probe round completed in this time. 0 to disable.
+    health_liveness_max_staleness_secs: float = 60
+    health_liveness_path: str = "/health/live"
+    health_readiness_path: str = "/health/ready"
+    # Outbound dependencies checked with a GET, by name. Reported, but not critical.
+    health_http_checks: Dict[str, str] = {}
+
+    # Background tasks of the TaskSupervisor. Defaults of every task group, the concurrency
+    # limit and the number of tasks waiting to run, beyond which tasks are rejected.
+    tasks_default_concurrency: int = 100
+    tasks_default_queue_size: int = 1000
+    # Limits by task group name. Eg. {"mapper_resolve": {"limit": 20, "queue_size": 200}}
+    tasks_groups: Dict[str, Dict[str, int]] = {}
+    # Seconds to wait for running tasks on shutdown, before cancelling them.
+    tasks_drain_timeout_secs: float = 30
+
+    # Thread pool for blocking calls (run_sync) and process pool for CPU heavy work (run_cpu).
+    # Sizes default to those of concurrent.futures.
+    executors_thread_workers: Optional[int] = None
+    executors_process_workers: Optional[int] = None
+    # One of "spawn", "forkserver", "fork". Only forked processes inherit the registries,
+    # but forking a process running threads may deadlock, so "fork" is opt-in.
+    executors_process_start_method: str = "spawn"
+
+    # Shared clients for outbound HTTP calls, see HttpClientManager.
+    http_client_max_connections: int = 100
+    http_client_max_keepalive_connections: int = 20
+    http_client_keepalive_expiry_secs: float = 30
+    http_client_timeout_secs: float = 10
+    http_client_connect_timeout_secs: float = 5
+    # Needs the "http2" extras.
+    http_client_http2: bool = False
+    # Overrides of the above by upstream name, without the http_client_ prefix.
+    # Eg. {"mapper": {"max_connections": 50, "http2": true}}
+    http_client_upstreams: Dict[str, Dict[str, Any]] = {}
+
+    metrics_enabled: bool = True
+    metrics_path: str = "/metrics"
+    metrics_namespace: str = ""
+    # Directory where worker processes keep their metrics, to be aggregated on scrape.
+    # If not set and the server runs more than one worker (--workers or server_workers),
+    # a temporary directory is used, removed when the server stops.
+    metrics_multiproc_dir: Optional[Path] = None
+    metrics_latency_buckets: List[float] = [
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+    ]
+    metrics_size_buckets: List[float] = [100, 1000, 10000, 100000, 1000000, 10000000]
+
+    # Per request sampling profiler. Requests are profiled if they carry the secret
+    # in the header or query parameter, or randomly, for profiling_sample_fraction of requests,
+    # of which only those slower than profiling_slow_threshold_ms are kept.
+    profiling_enabled: bool = False
+    profiling_secret: str = ""
+    profiling_header: str = "X-Profile"
+    profiling_query_param: str = "profile"
+    profiling_sample_fraction: float = 0
+    profiling_slow_threshold_ms: int = 1000
+    profiling_interval_ms: float = 5
+    # Directory to write profiles to, as folded stacks. Profiles are also kept in memory,
+    # and listed on profiling_admin_path, which requires the secret header.
+    profiling_output_dir: Optional[Path] = None
+    profiling_max_reports: int = 50
+    profiling_admin_path: str = "/admin/profiles"
 
     openapi_title: str = "Common"
     openapi_description: str = """
@@ -36,6 +197,11 @@ class Settings(BaseSettings):
     openapi_license_url: str = "https://www.mozilla.org/en-US/MPL/2.0/"
     openapi_root_path: str = ""
     openapi_common_api_prefix: str = ""
+    # One of "lazy", "eager", "file", "disabled". Lazy builds the schema on the first request,
+    # eager before the server starts, file loads it from openapi_file (written by getOpenAPI),
+    # and disabled removes the openapi and docs routes. Served as pre-serialized JSON.
+    openapi_mode: str = "lazy"
+    openapi_file: Optional[Path] = None
 
     # If empty will be constructed like this
     # f"{db_driver}://{db_username}:{db_password}@{db_hostname}:{db_port}/{db_dbname}"
@@ -48,6 +214,37 @@ class Settings(BaseSettings):
     db_dbname: Optional[str] = None
     db_logging: Optional[bool] = False
 
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # Seconds to wait for a connection from the pool before failing
+    db_pool_timeout_secs: float = 30
+    # Connections older than this are replaced on checkout. -1 to disable.
+    db_pool_recycle_secs: int = -1
+    db_pool_pre_ping: bool = False
+    db_connect_timeout_secs: Optional[float] = None
+    db_command_timeout_secs: Optional[float] = None
+    # asyncpg prepared statement cache size, per connection. 0 to disable.
+    db_statement_cache_size: int = 100
+    # For PgBouncer in transaction pooling mode. Disables the prepared statement caches,
+    # uses unique prepared statement names and doesn't pool connections in the app.
+    db_pgbouncer_mode: bool = False
+    # Rows per statement used by the bulk ORM helpers
+    db_bulk_chunk_size: int = 1000
+    # Rows per query used by get_page and iter_all
+    db_page_size: int = 1000
+
+    db_migrations_table_name: str = "schema_migrations"
+    # Lock timeout applied to migrations, so they fail instead of blocking traffic. 0 to disable.
+    db_migrations_lock_timeout_ms: int = 5000
+    db_migrations_backfill_batch_size: int = 1000
+    db_migrations_backfill_sleep_secs: float = 0.1
+
+    # Read replica datasources. Read only ORM helpers are routed to these,
+    # unless the primary is forced. Uses the same pool settings as the primary.
+    db_replica_datasources: List[str] = []
+    # One of "round_robin", "least_loaded"
+    db_replica_strategy: str = "round_robin"
+
     @model_validator(mode="after")
     def validate_db_datasource(self) -> "Settings":
         if self.db_datasource:
@@ -68,10 +265,35 @@ class Settings(BaseSettings):
 
         return self
 
+    @model_validator(mode="after")
+    def validate_openapi_mode(self) -> "Settings":
+        if self.openapi_mode not in ("lazy", "eager", "file", "disabled"):
+            raise ValueError(
+                f"Invalid openapi_mode {self.openapi_mode}. "
+                "Must be one of lazy, eager, file, disabled."
+            )
+        if self.openapi_mode == "file" and not self.openapi_file:
+            raise ValueError("openapi_file must be set if openapi_mode is file.")
+        return self
+
     @classmethod
     def get_config(cls, strict=True):
-        result = None
-        for config in config_registry.get():
+        registry = config_registry.get()
+        index = config_index.get()
+        # Rebuilt if the registry was replaced or changed other than by appending
+        # (see VersionedList). Plain list registries can't be tracked.
+        version = getattr(registry, "version", None)
+        if (
+            index.get("registry") is not registry
+            or version is None
+            or index["version"] != version
+        ):
+            index.clear()
+            index.update(registry=registry, version=version, configs={})
+        result = index["configs"].get((cls, strict))
+        if result is not None:
+            return result
+        for config in registry:
             if strict:
                 if cls is type(config):
                     result = config
@@ -82,5 +304,44 @@ class Settings(BaseSettings):
                     break
         if not result:
             result = cls()
-            config_registry.get().append(result)
+            registry.append(result)
+        # Appending never changes the first match of an already cached lookup.
+        index["configs"][(cls, strict)] = result
         return result
+
+    def get_config_view(self) -> Mapping[str, Any]:
+        """
+        Returns a read-only mapping of the config values, equivalent to model_dump().
+        Built once per config instance and reused.
+        """
+        view = _config_views.get(id(self))
+        if view is None:
+            view = _freeze(self.model_dump())
+            _config_views[id(self)] = view
+            weakref.finalize(self, _config_views.pop, id(self), None)
+        return view
+
+    def reload_config(self, **kwargs) -> "Settings":
+        """
+        Loads the config again (from env, .env file and given kwargs) into a new
+        instance, which replaces this one in the config registry, and returns it.
+        This instance is left unchanged, so look the config up again using get_config.
+        """
+        config = type(self)(**kwargs)
+        registry = config_registry.get()
+        for i, registered in enumerate(registry):
+            if registered is self:
+                # Changes the registry version, so get_config lookups are redone.
+                registry[i] = config
+                break
+        return config
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
@@ -1,19 +1,61 @@
 """Module for initializing Contexts"""
 
 from contextvars import ContextVar
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from fastapi import FastAPI
 from pydantic_settings import BaseSettings
-from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .utils.versioned_list import VersionedList
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+    from .db import DBSessionManager
+    from .log_pipeline import LogPipeline
 
 app_registry: ContextVar[Optional[FastAPI]] = ContextVar("app_registry", default=None)
 
 config_registry: ContextVar[List[BaseSettings]] = ContextVar(
-    "config_registry", default=[]
+    "config_registry", default=VersionedList()
+)
+
+# Cache of Settings.get_config lookups over config_registry, keyed by (class, strict).
+config_index: ContextVar[Dict[str, Any]] = ContextVar("config_index", default={})
+
+# The following is a list of BaseComponents.
+# Versioned, so that component_index is rebuilt when components are removed or replaced.
+component_registry: ContextVar[List] = ContextVar(
+    "component_registry", default=VersionedList()
+)
+
+# Lookup index over component_registry, maintained by BaseComponent.
+# Holds the first component registered for every class in its MRO, by type and by name.
+component_index: ContextVar[Dict[str, Any]] = ContextVar("component_index", default={})
+
+dbengine: ContextVar[Optional["AsyncEngine"]] = ContextVar("dbengine", default=None)
+
+dbsession_manager: ContextVar[Optional["DBSessionManager"]] = ContextVar(
+    "dbsession_manager", default=None
 )
 
-# The following is a list of BaseComponents
-component_registry: ContextVar[List] = ContextVar("component_registry", default=[])
+# Request scoped session, set by the get_db_session dependency.
+dbsession: ContextVar[Optional["AsyncSession"]] = ContextVar("dbsession", default=None)
+
+# If set, read only ORM helpers use the primary instead of read replicas.
+dbforce_primary: ContextVar[bool] = ContextVar("dbforce_primary", default=False)
 
-dbengine: ContextVar[AsyncEngine] = ContextVar("dbengine", default=None)
+# Set by Initializer.init_logger, if the queued log pipeline is enabled.
+log_pipeline: ContextVar[Optional["LogPipeline"]] = ContextVar(
+    "log_pipeline", default=None
+)
+
+# Set by Initializer.init_executors. See executors.run_sync and executors.run_cpu.
+thread_pool_executor: ContextVar[Optional["ThreadPoolExecutor"]] = ContextVar(
+    "thread_pool_executor", default=None
+)
+process_pool_executor: ContextVar[Optional["ProcessPoolExecutor"]] = ContextVar(
+    "process_pool_executor", default=None
+)
@@ -1,13 +1,16 @@
 """Module from initializing base controllers"""
 
+from fastapi import Depends, params
 from fastapi.datastructures import Default
 from fastapi.responses import ORJSONResponse
 from fastapi.routing import APIRouter
 
+from .admission import get_concurrency_pool
 from .component import BaseComponent
 from .config import Settings
 from .context import app_registry
 from .errors import ErrorListResponse
+from .response_cache import CachedAPIRoute
 
 _config = Settings.get_config(strict=False)
 
@@ -17,6 +20,8 @@ class BaseController(BaseComponent):
         super().__init__(name=name)
         if "default_response_class" not in kwargs:
             kwargs["default_response_class"] = Default(ORJSONResponse)
+        if "route_class" not in kwargs:
+            kwargs["route_class"] = CachedAPIRoute
         self.router = APIRouter(**kwargs)
         self.router.responses = {
             401: {"model": ErrorListResponse},
@@ -27,6 +32,18 @@ class BaseController(BaseComponent):
         if _config.openapi_common_api_prefix:
             self.router.prefix = _config.openapi_common_api_prefix
 
+    def concurrency_pool(self, name: str, limit: int, **kwargs) -> params.Depends:
+        """
+        Dependency limiting the concurrent requests of all routes declared with the same pool name.
+        Requests over the limit wait in a bounded queue, and get a 503 with Retry-After
+        if not admitted in time. Eg.
+        self.router.add_api_route(
+            "/resolve", self.resolve, methods=["POST"],
+            dependencies=[self.concurrency_pool("resolve", 20)],
+        )
+        """
+        return Depends(get_concurrency_pool(name, limit, **kwargs))
+
     def post_init(self):
         app_registry.get().include_router(self.router)
         return self
@@ -0,0 +1,406 @@
+"""Module containing the DB session manager and session dependencies"""
+
+import itertools
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, List, Optional
+from uuid import uuid4
+
+from fastapi import Request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
+from sqlalchemy.sql.elements import TextClause
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import Settings
+from .context import dbengine, dbforce_primary, dbsession, dbsession_manager
+
+_config = Settings.get_config(strict=False)
+
+
+class DBPoolStats:
+    """
+    Counters of connection checkouts from a pool, including the time spent
+    waiting for a connection, and the checkouts that timed out.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_total_secs = 0.0
+        self.wait_max_secs = 0.0
+
+    def record_checkout(self, wait_secs: float):
+        self.checkouts += 1
+        self.wait_total_secs += wait_secs
+        if wait_secs > self.wait_max_secs:
+            self.wait_max_secs = wait_secs
+
+
+class InstrumentedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = DBPoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return conn
+
+    def _do_return_conn(self, record):
+        self.stats.checkins += 1
+        return super()._do_return_conn(record)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(InstrumentedPoolMixin, NullPool):
+    pass
+
+
+def create_db_engine(datasource: str, pooled: bool = True) -> AsyncEngine:
+    """
+    Creates the async engine for the datasource, with the db_* pool,
+    timeout and statement cache settings.
+    Without pooled, every checkout opens a new connection, like in PgBouncer mode.
+    """
+    engine_kwargs = {"echo": _config.db_logging}
+    connect_args = {}
+    if _config.db_pgbouncer_mode or not pooled:
+        engine_kwargs["poolclass"] = InstrumentedNullPool
+    else:
+        engine_kwargs.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=_config.db_pool_size,
+            max_overflow=_config.db_max_overflow,
+            pool_timeout=_config.db_pool_timeout_secs,
+            pool_recycle=_config.db_pool_recycle_secs,
+            pool_pre_ping=_config.db_pool_pre_ping,
+        )
+
+    if make_url(datasource).get_driver_name() == "asyncpg":
+        if _config.db_connect_timeout_secs is not None:
+            connect_args["timeout"] = _config.db_connect_timeout_secs
+        if _config.db_command_timeout_secs is not None:
+            connect_args["command_timeout"] = _config.db_command_timeout_secs
+        if _config.db_pgbouncer_mode:
+            # Prepared statements don't survive across PgBouncer server connections.
+            connect_args.update(
+                statement_cache_size=0,
+                prepared_statement_cache_size=0,
+                prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__",
+            )
+        else:
+            connect_args[
+                "prepared_statement_cache_size"
+            ] = _config.db_statement_cache_size
+
+    return create_async_engine(datasource, connect_args=connect_args, **engine_kwargs)
+
+
+def get_pool_load(pool: Pool) -> int:
+    if isinstance(pool, QueuePool):
+        return pool.checkedout()
+    stats = getattr(pool, "stats", None)
+    return stats.checkouts - stats.checkins if stats else 0
+
+
+def get_pool_stats(pool: Pool) -> dict:
+    res = {"status": pool.status()}
+    stats = getattr(pool, "stats", None)
+    if stats:
+        res.update(
+            checkouts=stats.checkouts,
+            checkins=stats.checkins,
+            timeouts=stats.timeouts,
+            wait_avg_ms=(stats.wait_total_secs / stats.checkouts * 1000)
+            if stats.checkouts
+            else 0.0,
+            wait_max_ms=stats.wait_max_secs * 1000,
+        )
+    if isinstance(pool, QueuePool):
+        res.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return res
+
+
+class PrimarySession(Session):
+    """
+    Session class of the primary DB. Records in its info whether it has written anything,
+    so that later reads in the same unit of work are not routed to a replica.
+    """
+
+
+@event.listens_for(PrimarySession, "after_flush")
+def _primary_session_after_flush(session, flush_context):
+    session.info["has_writes"] = True
+
+
+@event.listens_for(PrimarySession, "do_orm_execute")
+def _primary_session_do_orm_execute(orm_execute_state):
+    if is_write_statement(orm_execute_state):
+        orm_execute_state.session.info["has_writes"] = True
+
+
+# Leading keywords of textual statements that don't write.
+# WITH is not one of them, as its queries may modify data.
+_READ_ONLY_SQL = re.compile(r"\s*\(*\s*(SELECT|SHOW|EXPLAIN|VALUES)\b", re.IGNORECASE)
+
+
+def is_write_statement(orm_execute_state) -> bool:
+    """
+    Returns True if the statement executed by the session is an insert, update or delete,
+    or a textual statement that isn't a read.
+    """
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        return True
+    statement = orm_execute_state.statement
+    return isinstance(statement, TextClause) and not _READ_ONLY_SQL.match(
+        statement.text
+    )
+
+
+class DBSessionManager:
+    """
+    Holds the session factories of the DB engine and of the read replica engines,
+    created once by Initializer.init_db.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        replica_engines: Optional[List[AsyncEngine]] = None,
+        replica_strategy: str = "round_robin",
+    ):
+        self.engine = engine
+        self.session_maker = async_sessionmaker(
+            engine, expire_on_commit=False, sync_session_class=PrimarySession
+        )
+        self.replica_engines = replica_engines or []
+        self.replica_session_makers = [
+            async_sessionmaker(replica_engine, expire_on_commit=False)
+            for replica_engine in self.replica_engines
+        ]
+        self.replica_strategy = replica_strategy
+        self._replica_counter = itertools.count()
+
+    def pool_stats(self) -> dict:
+        """
+        Returns the current state of the engine's connection pool,
+        along with the checkout, wait time and timeout counters.
+        """
+        return get_pool_stats(self.engine.pool)
+
+    def replica_pool_stats(self) -> List[dict]:
+        return [get_pool_stats(engine.pool) for engine in self.replica_engines]
+
+    def requires_primary(self) -> bool:
+        """
+        Returns True if reads must see the latest writes. That is when the primary
+        is forced (see use_primary) or the request session has written something.
+        """
+        if dbforce_primary.get():
+            return True
+        session = dbsession.get()
+        return session is not None and session.info.get("has_writes", False)
+
+    def prefers_primary(self) -> bool:
+        return not self.replica_session_makers or self.requires_primary()
+
+    def get_replica_session_maker(self) -> async_sessionmaker:
+        if self.replica_strategy == "least_loaded":
+            replica_index = min(
+                range(len(self.replica_engines)),
+                key=lambda i: get_pool_load(self.replica_engines[i].pool),
+            )
+        else:
+            replica_index = next(self._replica_counter) % len(
+                self.replica_session_makers
+            )
+        return self.replica_session_makers[replica_index]
+
+    @asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Yields a new session on a read replica, which is closed on exit.
+        Yields the same as session() instead, if the primary is preferred.
+        """
+        if self.prefers_primary():
+            async with self.session() as session:
+                yield session
+            return
+        async with self.get_replica_session_maker()() as session:
+            yield session
+
+    @asynccontextmanager
+    async def detached_read_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Yields a new session, on a read replica if there are any, which is closed on exit.
+        Never yields the request scoped session, so loaded instances are detached after exit.
+        """
+        if self.replica_session_makers:
+            session_maker = self.get_replica_session_maker()
+        else:
+            session_maker = self.session_maker
+        async with session_maker() as session:
+            yield session
+
+    async def dispose_replicas(self):
+        for replica_engine in self.replica_engines:
+            await replica_engine.dispose()
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Yields the request scoped session, if one is active.
+        Else yields a new session which is closed (not committed) on exit.
+        """
+        session = dbsession.get()
+        if session is not None:
+            yield session
+            return
+        async with self.session_maker() as session:
+            yield session
+
+    @asynccontextmanager
+    async def write_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Yields the request scoped session, if one is active. It is committed at the end of the request.
+        Else yields a new session on the primary, which is committed on exit.
+        """
+        session = dbsession.get()
+        if session is not None:
+            yield session
+            return
+        async with self.session_maker() as session, session.begin():
+            yield session
+
+    @asynccontextmanager
+    async def request_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Opens a unit of work session that is used by all ORM helpers till exit.
+        Commits on exit, or rolls back if an exception is raised.
+        """
+        async with self.session_maker() as session:
+            token = dbsession.set(session)
+            try:
+                yield session
+                await session.commit()
+            except BaseException:
+                await session.rollback()
+                raise
+            finally:
+                dbsession.reset(token)
+
+
+def get_db_session_manager() -> DBSessionManager:
+    """
+    Returns the session manager of the DB engine. If the engine was replaced,
+    eg. in tests, a new manager is created, keeping the replicas of the previous one,
+    or creating them from db_replica_datasources if there was none.
+    """
+    manager = dbsession_manager.get()
+    engine = dbengine.get()
+    if manager is None or manager.engine is not engine:
+        if engine is None:
+            raise RuntimeError("DB engine is not initialized.")
+        if manager is not None:
+            replica_engines = manager.replica_engines
+            replica_strategy = manager.replica_strategy
+        else:
+            replica_engines = [
+                create_db_engine(replica_datasource)
+                for replica_datasource in _config.db_replica_datasources
+            ]
+            replica_strategy = _config.db_replica_strategy
+        manager = DBSessionManager(
+            engine,
+            replica_engines=replica_engines,
+            replica_strategy=replica_strategy,
+        )
+        dbsession_manager.set(manager)
+    return manager
+
+
+@contextmanager
+def use_primary():
+    """
+    Routes read only ORM helpers called within this block to the primary DB.
+    For example, to read back rows right after writing them outside the request session.
+    """
+    token = dbforce_primary.set(True)
+    try:
+        yield
+    finally:
+        dbforce_primary.reset(token)
+
+
+async def get_db_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    FastAPI dependency providing one session per request.
+    ORM helpers called during the request reuse this session.
+    It is committed by DBSessionMiddleware before the response is sent,
+    or rolled back on error. Without the middleware, it is committed when
+    the dependency exits, which is after the response is sent.
+
+    Usage: ``session: Annotated[AsyncSession, Depends(get_db_session)]``,
+    or as a router dependency.
+    """
+    async with get_db_session_manager().request_session() as session:
+        request.scope["dbsession"] = session
+        try:
+            yield session
+        finally:
+            request.scope.pop("dbsession", None)
+
+
+class DBSessionMiddleware:
+    """
+    ASGI middleware committing the request session of get_db_session when the response starts,
+    so that the response is only sent once the changes are committed,
+    and a failed commit results in an error response.
+    Needed as dependencies with yield exit after the response is sent.
+    Sessions of requests that raised are rolled back before the response, and not committed.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                session = scope.pop("dbsession", None)
+                if session is not None:
+                    await session.commit()
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
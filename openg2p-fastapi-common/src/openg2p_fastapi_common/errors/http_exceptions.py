@@ -49,3 +49,14 @@ class InternalServerError(BaseAppException):
         **kwargs
     ):
         super().__init__(code, message, http_status_code, **kwargs)
+
+
+class ServiceUnavailableError(BaseAppException):
+    def __init__(
+        self,
+        code="G2P-REQ-503",
+        message="Service Unavailable",
+        http_status_code=503,
+        **kwargs
+    ):
+        super().__init__(code, message, http_status_code, **kwargs)
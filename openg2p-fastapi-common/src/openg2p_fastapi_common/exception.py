@@ -1,7 +1,11 @@
 import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
 
+import orjson
 from fastapi.exceptions import RequestValidationError, ResponseValidationError
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from .component import BaseComponent
@@ -14,6 +18,7 @@ from .errors.http_exceptions import (
     InternalServerError,
     MethodNotAllowedError,
     NotFoundError,
+    ServiceUnavailableError,
     UnauthorizedError,
 )
 
@@ -21,9 +26,57 @@ _config = Settings.get_config()
 _logger = logging.getLogger(_config.logging_default_logger_name)
 
 
+class ErrorLogRateLimiter:
+    """
+    Allows logging up to count identical errors (by key) per window of window_secs.
+    The number of errors suppressed in a window is reported with the first log of the next one.
+    """
+
+    def __init__(self, count: int, window_secs: float, max_keys: int = 1024):
+        self.count = count
+        self.window_secs = window_secs
+        self.max_keys = max_keys
+        # key -> [window start, logged in window, suppressed in window]
+        self.windows: Dict[Hashable, List] = {}
+
+    def allow(self, key: Hashable) -> Tuple[bool, int]:
+        """
+        Returns whether to log the error, and the number of suppressed errors to report.
+        """
+        if not self.count:
+            return True, 0
+        now = time.monotonic()
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.window_secs:
+            if window is None and len(self.windows) >= self.max_keys:
+                self.windows = {
+                    k: w
+                    for k, w in self.windows.items()
+                    if now - w[0] < self.window_secs
+                }
+            self.windows[key] = [now, 1, 0]
+            return True, window[2] if window else 0
+        if window[1] < self.count:
+            window[1] += 1
+            return True, 0
+        window[2] += 1
+        return False, 0
+
+
 class BaseExceptionHandler(BaseComponent):
+    MAX_CACHED_ERROR_BODIES = 1024
+
     def __init__(self, name="", **kwargs):
         super().__init__(name=name)
+        self.traceback_status_classes = set(
+            _config.logging_exception_traceback_status_classes
+        )
+        self.rate_limiter = ErrorLogRateLimiter(
+            _config.logging_exception_rate_limit_count,
+            _config.logging_exception_rate_limit_window_secs,
+        )
+        # LRU of serialized ErrorListResponse bodies, by (code, message)
+        self.error_bodies: OrderedDict[Tuple[str, str], bytes] = OrderedDict()
 
         app = app_registry.get()
         app.add_exception_handler(StarletteHTTPException, self.http_exception_handler)
@@ -37,13 +90,19 @@ class BaseExceptionHandler(BaseComponent):
         app.add_exception_handler(Exception, self.unknown_exception_handler)
 
     async def base_exception_handler(self, request, exc: BaseAppException):
-        _logger.exception(f"Received Exception: {exc}")
-        # TODO: Handle multiple exceptions
-        res = ErrorListResponse(
-            errors=[ErrorResponse(code=exc.code, message=exc.message)]
+        self.log_exception(
+            exc,
+            (type(exc), exc.code, exc.status_code),
+            exc.status_code,
+            "Received Exception: %s",
+            exc,
         )
-        return ORJSONResponse(
-            content=res.model_dump(), status_code=exc.status_code, headers=exc.headers
+        # TODO: Handle multiple exceptions
+        return Response(
+            content=self.get_error_body(exc.code, exc.message),
+            status_code=exc.status_code,
+            headers=exc.headers,
+            media_type=ORJSONResponse.media_type,
         )
 
     async def http_exception_handler(self, request, exc: StarletteHTTPException):
@@ -85,7 +144,14 @@ class BaseExceptionHandler(BaseComponent):
         return ORJSONResponse(content=res.model_dump(), status_code=500)
 
     async def unknown_exception_handler(self, request, exc):
-        _logger.exception("Received Unknown Exception: %s", repr(exc))
+        # Keyed by where it was raised, as messages often contain variable values.
+        self.log_exception(
+            exc,
+            (type(exc), get_raise_location(exc)),
+            500,
+            "Received Unknown Exception: %s",
+            repr(exc),
+        )
         exc_split = str(exc).split("::")
         if len(exc_split) > 1:
             code = exc_split[0]
@@ -96,6 +162,43 @@ class BaseExceptionHandler(BaseComponent):
         res = ErrorListResponse(errors=[ErrorResponse(code=code, message=message)])
         return ORJSONResponse(content=res.model_dump(), status_code=500)
 
+    def log_exception(
+        self, exc: Exception, key: Hashable, status_code: int, msg: str, *args
+    ):
+        """
+        Logs the exception, with its traceback if its status class is configured for it,
+        unless too many identical errors were logged recently.
+        """
+        allowed, suppressed = self.rate_limiter.allow(key)
+        if not allowed:
+            return
+        if suppressed:
+            msg += f" (Suppressed {suppressed} similar errors.)"
+        exc_info = f"{status_code // 100}xx" in self.traceback_status_classes
+        _logger.error(msg, *args, exc_info=exc if exc_info else None)
+
+    def get_error_body(self, code: str, message: str) -> bytes:
+        """
+        Returns the serialized ErrorListResponse of the error.
+        Cached, as most errors, like those of map_http_to_base_exception, are fixed.
+        The least recently used are evicted, so errors with variable messages don't
+        push the fixed ones out for good.
+        """
+        key = (code, message)
+        body = self.error_bodies.get(key)
+        if body is not None:
+            self.error_bodies.move_to_end(key)
+            return body
+        body = orjson.dumps(
+            ErrorListResponse(
+                errors=[ErrorResponse(code=code, message=message)]
+            ).model_dump()
+        )
+        self.error_bodies[key] = body
+        if len(self.error_bodies) > self.MAX_CACHED_ERROR_BODIES:
+            self.error_bodies.popitem(last=False)
+        return body
+
     def map_http_to_base_exception(
         self, exc: StarletteHTTPException
     ) -> BaseAppException:
@@ -111,6 +214,8 @@ class BaseExceptionHandler(BaseComponent):
             final_exc = MethodNotAllowedError(headers=exc.headers)
         elif exc.status_code == 500:
             final_exc = InternalServerError(headers=exc.headers)
+        elif exc.status_code == 503:
+            final_exc = ServiceUnavailableError(headers=exc.headers)
         else:
             final_exc = BaseAppException(
                 code="G2P-REQ-100",
@@ -122,3 +227,15 @@ class BaseExceptionHandler(BaseComponent):
             final_exc.detail = exc.detail
             final_exc.message = exc.detail
         return final_exc
+
+
+def get_raise_location(exc: BaseException) -> Optional[Tuple[str, int]]:
+    """
+    Returns the file and line number of the innermost frame of the exception's traceback.
+    """
+    tb = exc.__traceback__
+    if tb is None:
+        return None
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    return tb.tb_frame.f_code.co_filename, tb.tb_lineno
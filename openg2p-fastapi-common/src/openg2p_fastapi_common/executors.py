@@ -0,0 +1,97 @@
+"""Module containing the thread and process pool executors, for blocking and CPU heavy work"""
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from .config import Settings
+from .context import dbsession, process_pool_executor, thread_pool_executor
+
+_config = Settings.get_config(strict=False)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Thread pool running every call in a copy of the submitter's contextvars,
+    like CTXThread does for a single thread. The request session is not passed on,
+    as async sessions must not be used from other threads.
+    """
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        context = contextvars.copy_context()
+        context.run(dbsession.set, None)
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def create_thread_pool_executor() -> ContextThreadPoolExecutor:
+    return ContextThreadPoolExecutor(
+        max_workers=_config.executors_thread_workers,
+        thread_name_prefix="worker-thread",
+    )
+
+
+def create_process_pool_executor() -> ProcessPoolExecutor:
+    """
+    Worker processes are started on first use, by default with the "spawn" start method,
+    so the main module must only start the app under if __name__ == "__main__".
+    Functions and arguments given to the pool must be picklable.
+    The "fork" start method is opt-in. Forked workers inherit the registries and config
+    of the process, but may deadlock on locks held by its threads (like the log writer)
+    at the time of the fork.
+    """
+    return ProcessPoolExecutor(
+        max_workers=_config.executors_process_workers,
+        mp_context=multiprocessing.get_context(_config.executors_process_start_method),
+    )
+
+
+def get_thread_pool_executor() -> ThreadPoolExecutor:
+    executor = thread_pool_executor.get()
+    if executor is None:
+        executor = create_thread_pool_executor()
+        thread_pool_executor.set(executor)
+    return executor
+
+
+def get_process_pool_executor() -> ProcessPoolExecutor:
+    executor = process_pool_executor.get()
+    if executor is None:
+        executor = create_process_pool_executor()
+        process_pool_executor.set(executor)
+    return executor
+
+
+async def run_sync(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Runs blocking fn(*args, **kwargs) in the thread pool, with the caller's contextvars,
+    without blocking the event loop. Eg.
+    txn_status = await run_sync(service.resolve_request_sync, mappings)
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        get_thread_pool_executor(), functools.partial(fn, *args, **kwargs)
+    )
+
+
+async def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Runs CPU heavy fn(*args, **kwargs) in the process pool, so that it neither blocks
+    the event loop nor holds the GIL. fn must be a module level function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        get_process_pool_executor(), functools.partial(fn, *args, **kwargs)
+    )
+
+
+async def shutdown_executors():
+    """
+    Shuts down the executors, waiting for the submitted work to finish
+    without blocking the event loop.
+    """
+    for executor_var in (thread_pool_executor, process_pool_executor):
+        executor = executor_var.get()
+        if executor is not None:
+            executor_var.set(None)
+            await asyncio.to_thread(executor.shutdown)
@@ -0,0 +1,208 @@
+"""Module containing the background health prober, serving cached liveness and readiness"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import orjson
+
+from .component import BaseComponent
+from .config import Settings
+from .context import dbengine, dbsession_manager
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class HealthCheck:
+    def __init__(
+        self,
+        name: str,
+        check: Callable[[], Awaitable],
+        timeout: float,
+        critical: bool = True,
+    ):
+        self.name = name
+        self.check = check
+        self.timeout = timeout
+        self.critical = critical
+        self.result: Optional[dict] = None
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.check(), self.timeout)
+            status, error = "up", None
+        except asyncio.TimeoutError:
+            status, error = "down", f"Timed out after {self.timeout}s"
+        except Exception as e:
+            status, error = "down", repr(e)
+        if error:
+            # Only logged, as errors may include connection details.
+            # Repeated failures are logged at debug level.
+            was_down = self.result is not None and self.result["status"] == "down"
+            _logger.log(
+                logging.DEBUG if was_down else logging.WARNING,
+                "Health check %s is down. %s",
+                self.name,
+                error,
+            )
+        self.result = {
+            "status": status,
+            "critical": self.critical,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+            "checked_at": datetime.utcnow().isoformat(),
+        }
+        return self.result
+
+
+class HealthProber(BaseComponent):
+    """
+    Runs the registered checks concurrently, every health_probe_interval_secs,
+    in a background task started with the app. The liveness and readiness responses
+    are built once per round, so probes are served without touching the dependencies.
+    Readiness fails until the first round is done, and while any critical check is down.
+    Liveness fails if no round completed for health_liveness_max_staleness_secs,
+    eg. when the event loop is blocked.
+    """
+
+    def __init__(
+        self,
+        name="",
+        interval: Optional[float] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ):
+        super().__init__(name=name)
+        self.interval = interval or _config.health_probe_interval_secs
+        self.timeout = timeout or _config.health_probe_timeout_secs
+        self.checks: Dict[str, HealthCheck] = {}
+        self.ready = False
+        self.last_probed_at: Optional[float] = None
+        self.readiness_body = self.build_readiness_body()
+        self._task: Optional[asyncio.Task] = None
+
+    def register_check(
+        self,
+        name: str,
+        check: Callable[[], Awaitable],
+        timeout: Optional[float] = None,
+        critical: bool = True,
+    ):
+        """
+        Registers an async check, which fails by raising or timing out.
+        Non critical checks are reported, but don't fail readiness.
+        """
+        self.checks[name] = HealthCheck(
+            name, check, timeout or self.timeout, critical=critical
+        )
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def probe(self):
+        checks = list(self.checks.values())
+        await asyncio.gather(*(check.run() for check in checks))
+        ready = all(
+            check.result["status"] == "up" for check in checks if check.critical
+        )
+        if ready != self.ready and self.last_probed_at is not None:
+            _logger.warning(
+                "Readiness changed to %s.", "ready" if ready else "not ready"
+            )
+        self.ready = ready
+        self.last_probed_at = time.monotonic()
+        self.readiness_body = self.build_readiness_body()
+
+    def is_alive(self) -> bool:
+        max_staleness = _config.health_liveness_max_staleness_secs
+        if not max_staleness or self.last_probed_at is None or not self._task:
+            return True
+        return time.monotonic() - self.last_probed_at < max_staleness
+
+    def build_readiness_body(self) -> bytes:
+        return orjson.dumps(
+            {
+                "status": "ready" if self.ready else "not_ready",
+                # Only the status, as the body is served unauthenticated.
+                "checks": {
+                    name: check.result["status"]
+                    for name, check in self.checks.items()
+                    if check.result is not None
+                },
+            }
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                _logger.exception("Health probe failed.")
+            await asyncio.sleep(self.interval)
+
+
+async def check_db_engine():
+    from sqlalchemy import text
+
+    async with dbengine.get().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def get_db_replica_check(index: int) -> Callable[[], Awaitable]:
+    async def check_db_replica():
+        from sqlalchemy import text
+
+        async with dbsession_manager.get().replica_engines[index].connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    return check_db_replica
+
+
+def get_redis_check(get_pool: Callable) -> Callable[[], Awaitable]:
+    """
+    Returns a check pinging Redis through the async connection pool returned by get_pool.
+    The pool is looked up on every check, so it may be recreated, eg. after forking.
+    """
+
+    async def check_redis():
+        import redis.asyncio as redis_asyncio
+
+        client = redis_asyncio.Redis(connection_pool=get_pool())
+        try:
+            await client.ping()
+        finally:
+            await client.aclose(close_connection_pool=False)
+
+    return check_redis
+
+
+def get_http_check(url: str) -> Callable[[], Awaitable]:
+    """
+    Returns a check making a GET request to the url, which fails on 5xx responses.
+    """
+
+    async def check_http():
+        from .http_client import get_http_client
+
+        response = await get_http_client("health").get(url)
+        if response.status_code >= 500:
+            raise RuntimeError(f"Status {response.status_code}")
+
+    return check_http
+
+
+def get_health_prober() -> HealthProber:
+    return HealthProber.get_component() or HealthProber()
@@ -0,0 +1,149 @@
+"""Module containing the shared, pooled HTTP clients for outbound calls"""
+
+import threading
+from typing import Any, Dict, List
+
+import httpx
+
+from .component import BaseComponent
+from .config import Settings
+
+_config = Settings.get_config(strict=False)
+
+
+class HttpClientManager(BaseComponent):
+    """
+    Holds one async and one sync httpx client per upstream name, created on first use,
+    so that connections are kept alive and reused across requests.
+    Limits, timeouts and HTTP/2 come from the http_client_* config, overridden
+    per upstream by http_client_upstreams. HTTP/2 needs the "http2" extras. Eg.
+    res = await get_http_client("mapper").post(url, content=body)
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.sync_clients: Dict[str, httpx.Client] = {}
+        self.requests: Dict[str, int] = {}
+        # Sync clients may be requested from several threads at once.
+        self._lock = threading.Lock()
+
+    def get_client_kwargs(self, upstream: str) -> Dict[str, Any]:
+        upstream_config = _config.http_client_upstreams.get(upstream, {})
+
+        def get(key: str):
+            return upstream_config.get(key, getattr(_config, f"http_client_{key}"))
+
+        return {
+            "limits": httpx.Limits(
+                max_connections=get("max_connections"),
+                max_keepalive_connections=get("max_keepalive_connections"),
+                keepalive_expiry=get("keepalive_expiry_secs"),
+            ),
+            "timeout": httpx.Timeout(
+                get("timeout_secs"), connect=get("connect_timeout_secs")
+            ),
+            "http2": get("http2"),
+        }
+
+    def get_client(self, upstream: str = "") -> httpx.AsyncClient:
+        client = self.clients.get(upstream)
+        if client is None:
+            with self._lock:
+                client = self.clients.get(upstream)
+                if client is None:
+                    client = self.clients[upstream] = httpx.AsyncClient(
+                        event_hooks={
+                            "request": [self._get_request_hook(upstream, True)]
+                        },
+                        **self.get_client_kwargs(upstream),
+                    )
+        return client
+
+    def get_sync_client(self, upstream: str = "") -> httpx.Client:
+        """
+        Client for sync code paths. Blocks the calling thread, so don't use it on the event loop.
+        """
+        client = self.sync_clients.get(upstream)
+        if client is None:
+            with self._lock:
+                client = self.sync_clients.get(upstream)
+                if client is None:
+                    client = self.sync_clients[upstream] = httpx.Client(
+                        event_hooks={
+                            "request": [self._get_request_hook(upstream, False)]
+                        },
+                        **self.get_client_kwargs(upstream),
+                    )
+        return client
+
+    def _get_request_hook(self, upstream: str, is_async: bool):
+        def count_request(request: httpx.Request):
+            self.requests[upstream] = self.requests.get(upstream, 0) + 1
+
+        async def count_request_async(request: httpx.Request):
+            count_request(request)
+
+        return count_request_async if is_async else count_request
+
+    def reset(self):
+        """
+        Drops the clients without closing them. Used in forked workers,
+        as connections must not be shared with the parent process.
+        """
+        self.clients = {}
+        self.sync_clients = {}
+
+    async def aclose(self):
+        clients, sync_clients = self.clients, self.sync_clients
+        self.reset()
+        for client in clients.values():
+            await client.aclose()
+        for client in sync_clients.values():
+            client.close()
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Returns the number of requests made, and of open and idle pooled connections,
+        by upstream.
+        """
+        stats = {}
+        for clients in (self.clients, self.sync_clients):
+            for upstream, client in list(clients.items()):
+                connections = get_pool_connections(client)
+                upstream_stats = stats.setdefault(
+                    upstream,
+                    {
+                        "requests": self.requests.get(upstream, 0),
+                        "connections": 0,
+                        "idle_connections": 0,
+                    },
+                )
+                upstream_stats["connections"] += len(connections)
+                upstream_stats["idle_connections"] += sum(
+                    1 for connection in connections if connection.is_idle()
+                )
+        return stats
+
+
+def get_pool_connections(client) -> List:
+    """
+    Returns the pooled connections of the client.
+    httpx has no public API for these, so this relies on the private transport pool
+    (httpcore's ConnectionPool.connections), and returns none if that changes.
+    """
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return list(connections) if connections is not None else []
+
+
+def get_http_client_manager() -> HttpClientManager:
+    return HttpClientManager.get_component() or HttpClientManager()
+
+
+def get_http_client(upstream: str = "") -> httpx.AsyncClient:
+    return get_http_client_manager().get_client(upstream)
+
+
+def get_sync_http_client(upstream: str = "") -> httpx.Client:
+    return get_http_client_manager().get_sync_client(upstream)
@@ -0,0 +1,230 @@
+"""Module containing the queued, non blocking log pipeline"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import json_logging
+
+OVERFLOW_POLICIES = ("drop", "sample", "block")
+
+_STOP = object()
+
+
+class QueuedJSONLogFormatter(json_logging.JSONLogFormatter):
+    """
+    JSON formatter for records formatted outside the thread that logged them.
+    Uses the correlation id and timestamp captured when the record was enqueued,
+    since json_logging otherwise looks up the request in the current call stack.
+    """
+
+    def _format_log_object(self, record, request_util):
+        json_log_object = super()._format_log_object(record, request_util)
+        created = datetime.utcfromtimestamp(record.created)
+        json_log_object["written_at"] = json_logging.util.iso_time_format(created)
+        json_log_object["written_ts"] = json_logging.util.epoch_nano_second(created)
+        json_log_object["correlation_id"] = getattr(
+            record, "correlation_id", json_logging.EMPTY_VALUE
+        )
+        return json_log_object
+
+
+class QueuedLogHandler(logging.Handler):
+    """
+    Handler that only enqueues records to the LogPipeline.
+    The pipeline's writer thread formats them and writes them to the target handlers.
+    """
+
+    def __init__(
+        self,
+        pipeline: "LogPipeline",
+        targets: Sequence[logging.Handler],
+        capture_correlation_id: bool = True,
+    ):
+        super().__init__()
+        self.pipeline = pipeline
+        self.targets = tuple(targets)
+        self.capture_correlation_id = capture_correlation_id
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            # Whatever depends on the logging thread, or on mutable arguments,
+            # is resolved here. The rest of the formatting happens in the writer thread.
+            record.msg = record.getMessage()
+            record.args = None
+            if self.capture_correlation_id:
+                record.correlation_id = _get_correlation_id()
+            self.pipeline.enqueue(self.targets, record)
+        except Exception:
+            self.handleError(record)
+
+
+class LogPipeline:
+    """
+    Bounded queue of log records, drained by a dedicated writer thread,
+    which formats records in batches and writes every batch to each stream with one write call.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        overflow_policy: str = "drop",
+        sample_rate: float = 0.1,
+        batch_size: int = 500,
+        flush_timeout: float = 5,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Invalid log queue overflow policy {overflow_policy}. "
+                f"Must be one of {', '.join(OVERFLOW_POLICIES)}."
+            )
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_timeout = flush_timeout
+
+        self.queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self.dropped = 0
+        self.handlers: List[QueuedLogHandler] = []
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        os.register_at_fork(after_in_child=self._after_fork_in_child)
+        atexit.register(self.stop)
+
+    def get_handler(
+        self, targets: Sequence[logging.Handler], capture_correlation_id: bool = True
+    ) -> QueuedLogHandler:
+        handler = QueuedLogHandler(self, targets, capture_correlation_id)
+        self.handlers.append(handler)
+        return handler
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="log-pipeline-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Writes the records still in the queue, and stops the writer thread.
+        Records logged afterwards are written synchronously.
+        """
+        if not self._running:
+            return
+        self._running = False
+        thread = self._thread
+        self._thread = None
+        try:
+            self.queue.put(_STOP, timeout=self.flush_timeout)
+        except queue.Full:
+            pass
+        thread.join(self.flush_timeout)
+
+    def enqueue(self, targets: Tuple[logging.Handler, ...], record: logging.LogRecord):
+        if not self._running:
+            self.write([(targets, record)])
+            return
+        if self.overflow_policy == "block":
+            self.queue.put((targets, record))
+            return
+        if (
+            self.overflow_policy == "sample"
+            and record.levelno < logging.WARNING
+            and self.queue.qsize() * 2 >= self.max_size
+            and random.random() >= self.sample_rate
+        ):
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait((targets, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.write(batch)
+            if item is _STOP:
+                return
+
+    def write(self, batch: List[Tuple[Tuple[logging.Handler, ...], logging.LogRecord]]):
+        if self.dropped and batch:
+            dropped, self.dropped = self.dropped, 0
+            batch.append((batch[0][0], self._dropped_record(dropped)))
+
+        lines: Dict[logging.StreamHandler, List[str]] = {}
+        last_records: Dict[logging.StreamHandler, logging.LogRecord] = {}
+        for targets, record in batch:
+            for handler in targets:
+                if record.levelno < handler.level or not handler.filter(record):
+                    continue
+                if not isinstance(handler, logging.StreamHandler) or not handler.stream:
+                    handler.handle(record)
+                    continue
+                try:
+                    lines.setdefault(handler, []).append(handler.format(record))
+                    last_records[handler] = record
+                except Exception:
+                    handler.handleError(record)
+
+        for handler, handler_lines in lines.items():
+            handler.acquire()
+            try:
+                handler.stream.write(
+                    handler.terminator.join(handler_lines) + handler.terminator
+                )
+                handler.flush()
+            except Exception:
+                handler.handleError(last_records[handler])
+            finally:
+                handler.release()
+
+    def _dropped_record(self, dropped: int) -> logging.LogRecord:
+        record = logging.LogRecord(
+            "log-pipeline",
+            logging.WARNING,
+            __file__,
+            0,
+            f"Log queue overflow. Dropped {dropped} log records.",
+            None,
+            None,
+        )
+        record.correlation_id = json_logging.EMPTY_VALUE
+        return record
+
+    def _after_fork_in_child(self):
+        # The writer thread does not survive a fork, and the queue may hold
+        # locks and records of the parent process.
+        was_running = self._running
+        self.queue = queue.Queue(maxsize=self.max_size)
+        self.dropped = 0
+        self._thread = None
+        self._running = False
+        if was_running:
+            self.start()
+
+
+def _get_correlation_id() -> str:
+    try:
+        return json_logging.get_correlation_id()
+    except Exception:
+        return json_logging.EMPTY_VALUE
@@ -0,0 +1,218 @@
+# ruff: noqa: E402
+"""Module containing the prometheus metrics component, middleware and controller"""
+
+import glob
+import logging
+import os
+import time
+from typing import Dict, Optional, Sequence
+
+from .config import Settings
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+# prometheus_client picks the per process (mmap file backed) value implementation at import,
+# so the multiprocess directory has to be set up before importing it.
+# Without metrics_multiproc_dir, the run command sets up a temporary directory
+# for its workers before importing this module (see supervisor.temp_multiproc_dir).
+if _config.metrics_multiproc_dir:
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", str(_config.metrics_multiproc_dir)
+    )
+
+from fastapi.responses import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    Summary,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.metrics import MetricWrapperBase
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .component import BaseComponent
+from .controller import BaseController
+
+
+class MetricsManager(BaseComponent):
+    """
+    Registry of the service's prometheus metrics, including the HTTP metrics
+    recorded by MetricsMiddleware. Services add their own metrics using
+    counter, gauge, histogram and summary, which return the existing metric if already created.
+    """
+
+    def __init__(self, name="", namespace: Optional[str] = None, **kwargs):
+        super().__init__(name=name)
+        self.namespace = _config.metrics_namespace if namespace is None else namespace
+        self.registry = CollectorRegistry()
+        self._metrics: Dict[str, MetricWrapperBase] = {}
+
+        self.requests = self.counter(
+            "http_requests",
+            "Number of HTTP requests, by route and status code.",
+            ["method", "route", "status"],
+        )
+        self.request_duration = self.histogram(
+            "http_request_duration_seconds",
+            "Latency of HTTP requests, by route.",
+            ["method", "route"],
+            buckets=_config.metrics_latency_buckets,
+        )
+        self.response_size = self.histogram(
+            "http_response_size_bytes",
+            "Size of HTTP response bodies, by route.",
+            ["method", "route"],
+            buckets=_config.metrics_size_buckets,
+        )
+        # The route is only known once the request is routed, so in flight requests are by method.
+        self.requests_in_progress = self.gauge(
+            "http_requests_in_progress",
+            "Number of HTTP requests in progress.",
+            ["method"],
+            multiprocess_mode="livesum",
+        )
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs
+    ) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames, **kwargs)
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs
+    ) -> Gauge:
+        # In multiprocess mode, pass multiprocess_mode to choose how worker values are combined.
+        return self._get_or_create(Gauge, name, documentation, labelnames, **kwargs)
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, **kwargs)
+
+    def summary(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs
+    ) -> Summary:
+        return self._get_or_create(Summary, name, documentation, labelnames, **kwargs)
+
+    def _get_or_create(self, metric_class, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = metric_class(
+                name,
+                documentation,
+                labelnames=labelnames,
+                namespace=self.namespace,
+                registry=self.registry,
+                **kwargs,
+            )
+            self._metrics[name] = metric
+        elif not isinstance(metric, metric_class):
+            raise ValueError(
+                f"Metric {name} already exists as a {type(metric).__name__}."
+            )
+        return metric
+
+    @staticmethod
+    def is_multiprocess() -> bool:
+        return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+    def generate_latest(self) -> bytes:
+        """
+        Returns the metrics in the prometheus text format.
+        In multiprocess mode, these are aggregated across all worker processes.
+        """
+        if not self.is_multiprocess():
+            return generate_latest(self.registry)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    def clear_multiprocess_dir(self):
+        # Removes the metrics of earlier runs, before workers are started.
+        if self.is_multiprocess():
+            for path in glob.glob(
+                os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")
+            ):
+                os.remove(path)
+
+    def mark_process_dead(self, pid: int):
+        if self.is_multiprocess():
+            multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, latency, response size
+    and in flight requests to the MetricsManager.
+    Routes are labelled by their path template, and unmatched requests as "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp, metrics: MetricsManager):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = self.metrics.requests_in_progress.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.requests.labels(method, route, str(status_code)).inc()
+            self.metrics.request_duration.labels(method, route).observe(duration)
+            self.metrics.response_size.labels(method, route).observe(response_size)
+
+
+class MetricsController(BaseController):
+    def __init__(self, name="", **kwargs):
+        super().__init__(name, **kwargs)
+
+        self.router.tags += ["metrics"]
+
+        self.router.add_api_route(
+            _config.metrics_path,
+            self.get_metrics,
+            methods=["GET"],
+            include_in_schema=False,
+        )
+
+    def get_metrics(self):
+        """
+        Returns the metrics in the prometheus text format.
+        Defined sync, so that reading the multiprocess files runs in the threadpool.
+        """
+        return Response(
+            get_metrics_manager().generate_latest(),
+            headers={"Content-Type": CONTENT_TYPE_LATEST},
+        )
+
+
+def get_metrics_manager() -> MetricsManager:
+    """
+    Returns the registered MetricsManager, creating one if metrics are disabled,
+    so that services can always create and update their metrics.
+    """
+    return MetricsManager.get_component() or MetricsManager()
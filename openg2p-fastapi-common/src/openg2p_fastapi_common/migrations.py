@@ -0,0 +1,314 @@
+"""Module containing the versioned DB migration runner"""
+
+import asyncio
+import logging
+import re
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .component import BaseComponent
+from .config import Settings
+from .context import component_registry
+from .db import create_db_engine
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+def get_version_key(version: str) -> Tuple[Union[str, int], ...]:
+    """
+    Sort key of migration versions, comparing runs of digits as numbers,
+    so that "9" < "10" and "1.9" < "1.10".
+    """
+    return tuple(
+        int(part) if i % 2 else part
+        for i, part in enumerate(re.split(r"(\d+)", version))
+    )
+
+
+class MigrationContext:
+    """
+    Operations available to a migration's upgrade method.
+    In dry run mode, statements are only recorded in the plan and not executed.
+    """
+
+    def __init__(
+        self,
+        connection: Optional[AsyncConnection],
+        transactional: bool = True,
+        dry_run: bool = False,
+    ):
+        self.connection = connection
+        self.transactional = transactional
+        self.dry_run = dry_run
+        self.plan: List[str] = []
+
+    async def execute(self, statement: str, params: Optional[dict] = None):
+        self.plan.append(statement)
+        if self.dry_run:
+            return None
+        return await self.connection.execute(text(statement), params or {})
+
+    async def create_index_concurrently(
+        self,
+        name: str,
+        table: str,
+        columns: Sequence[str],
+        unique: bool = False,
+        where: Optional[str] = None,
+    ):
+        """
+        Creates the index without blocking writes to the table.
+        If this fails, postgres leaves behind an invalid index, which has to be dropped before retrying.
+        """
+        self.ensure_non_transactional("CREATE INDEX CONCURRENTLY")
+        statement = (
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS "
+            f"{name} ON {table} ({', '.join(columns)})"
+        )
+        if where:
+            statement += f" WHERE {where}"
+        await self.execute(statement)
+
+    async def drop_index_concurrently(self, name: str):
+        self.ensure_non_transactional("DROP INDEX CONCURRENTLY")
+        await self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    async def backfill(
+        self,
+        table: str,
+        set_clause: str,
+        where: str = "TRUE",
+        key: str = "id",
+        batch_size: Optional[int] = None,
+        sleep_secs: Optional[float] = None,
+    ) -> int:
+        """
+        Runs UPDATE table SET set_clause WHERE where, in batches of batch_size rows in key order.
+        Each batch is committed separately, and followed by a sleep of sleep_secs,
+        to limit row locks, replication lag and load on the DB.
+        Returns the number of rows updated.
+        """
+        self.ensure_non_transactional("Batched backfill")
+        batch_size = batch_size or _config.db_migrations_backfill_batch_size
+        if sleep_secs is None:
+            sleep_secs = _config.db_migrations_backfill_sleep_secs
+
+        def batch_statement(after_condition: str):
+            return (
+                f"UPDATE {table} SET {set_clause} WHERE {key} IN ("
+                f"SELECT {key} FROM {table} WHERE {after_condition}({where}) "
+                f"ORDER BY {key} LIMIT :batch_size) RETURNING {key}"
+            )
+
+        first_statement = batch_statement("")
+        next_statement = batch_statement(f"{key} > :after AND ")
+        if self.dry_run:
+            self.plan.append(
+                f"-- Batches of {batch_size} rows, sleeping {sleep_secs}s in between\n"
+                f"{next_statement}"
+            )
+            return 0
+
+        total = 0
+        after = None
+        while True:
+            if after is None:
+                result = await self.connection.execute(
+                    text(first_statement), {"batch_size": batch_size}
+                )
+            else:
+                result = await self.connection.execute(
+                    text(next_statement), {"batch_size": batch_size, "after": after}
+                )
+            keys = [row[0] for row in result]
+            if not keys:
+                break
+            total += len(keys)
+            after = max(keys)
+            _logger.info("Backfill of %s. Updated %d rows.", table, total)
+            if sleep_secs:
+                await asyncio.sleep(sleep_secs)
+        return total
+
+    def ensure_non_transactional(self, operation: str):
+        if self.transactional:
+            raise ValueError(
+                f"{operation} can not run inside a transaction. "
+                "Set transactional = False on the migration."
+            )
+
+
+class BaseMigration(BaseComponent):
+    """
+    Base class of versioned migrations. Migrations are applied in the order
+    of their version (numbers in versions compare numerically), once each. Register them by instantiating them in an Initializer.
+    """
+
+    version: str = ""
+    description: str = ""
+    # Transactional migrations run in one transaction, with the lock timeout applied.
+    # Set to False for CREATE INDEX CONCURRENTLY and batched backfills,
+    # in which case every statement is committed as it runs.
+    transactional: bool = True
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name or self.version)
+
+    async def upgrade(self, ctx: MigrationContext):
+        raise NotImplementedError()
+
+
+class MigrationRunner:
+    def __init__(
+        self,
+        datasource: str,
+        migrations: Sequence[BaseMigration],
+        table_name: str = None,
+        lock_timeout_ms: Optional[int] = None,
+        dry_run: bool = False,
+        target: Optional[str] = None,
+    ):
+        self.datasource = datasource
+        self.migrations = sorted(migrations, key=lambda m: get_version_key(m.version))
+        self.table_name = table_name or _config.db_migrations_table_name
+        self.lock_timeout_ms = (
+            lock_timeout_ms
+            if lock_timeout_ms is not None
+            else _config.db_migrations_lock_timeout_ms
+        )
+        self.dry_run = dry_run
+        self.target = target
+
+        versions = [m.version for m in self.migrations]
+        if "" in versions or len(set(versions)) != len(versions):
+            raise ValueError("Migration versions must be unique and non empty.")
+
+    async def run(self) -> List[BaseMigration]:
+        """
+        Applies (or in dry run mode, plans) the pending migrations, up to the target version.
+        Returns the pending migrations.
+        """
+        # A separate engine without pooling, as migrations may run on their own event loop,
+        # and need dedicated connections for autocommit mode. Otherwise with the same
+        # timeout and PgBouncer settings as the app's engine.
+        engine = create_db_engine(self.datasource, pooled=False)
+        target_key = get_version_key(self.target) if self.target is not None else None
+        try:
+            async with self.lock(engine):
+                applied_versions = await self.get_applied_versions(engine)
+                pending = [
+                    m
+                    for m in self.migrations
+                    if m.version not in applied_versions
+                    and (target_key is None or get_version_key(m.version) <= target_key)
+                ]
+                if not pending:
+                    _logger.info("DB migrations. No pending migrations.")
+                for migration in pending:
+                    await self.apply(engine, migration)
+                return pending
+        finally:
+            await engine.dispose()
+
+    @asynccontextmanager
+    async def lock(self, engine: AsyncEngine):
+        """
+        Holds a postgres advisory lock (keyed by the migrations table) on a dedicated connection,
+        so that concurrent runs, eg. from several replicas starting together, apply migrations
+        one at a time. Runs that waited then find the migrations already applied.
+        """
+        if self.dry_run or engine.dialect.name != "postgresql":
+            yield
+            return
+        key = zlib.crc32(self.table_name.encode())
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+            try:
+                yield
+            finally:
+                await conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": key}
+                )
+
+    async def get_applied_versions(self, engine: AsyncEngine) -> set:
+        async with engine.begin() as conn:
+            if self.dry_run:
+                exists = await conn.run_sync(
+                    lambda sync_conn: inspect(sync_conn).has_table(self.table_name)
+                )
+                if not exists:
+                    return set()
+            else:
+                await conn.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {self.table_name} ("
+                        "version VARCHAR PRIMARY KEY, "
+                        "description VARCHAR, "
+                        "applied_at TIMESTAMP NOT NULL)"
+                    )
+                )
+            result = await conn.execute(text(f"SELECT version FROM {self.table_name}"))
+            return {row[0] for row in result}
+
+    async def apply(self, engine: AsyncEngine, migration: BaseMigration):
+        if self.dry_run:
+            ctx = MigrationContext(
+                None, transactional=migration.transactional, dry_run=True
+            )
+            await migration.upgrade(ctx)
+            _logger.info(
+                "DB migrations. Plan of %s (%s):\n%s",
+                migration.version,
+                migration.description,
+                ";\n".join(ctx.plan) + ";" if ctx.plan else "-- Nothing",
+            )
+            return
+
+        _logger.info(
+            "DB migrations. Applying %s (%s).", migration.version, migration.description
+        )
+        if migration.transactional:
+            async with engine.begin() as conn:
+                await self.set_lock_timeout(conn, local=True)
+                await migration.upgrade(MigrationContext(conn, transactional=True))
+                await self.record_version(conn, migration)
+        else:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await self.set_lock_timeout(conn)
+                await migration.upgrade(MigrationContext(conn, transactional=False))
+                await self.record_version(conn, migration)
+        _logger.info("DB migrations. Applied %s.", migration.version)
+
+    async def set_lock_timeout(self, conn: AsyncConnection, local=False):
+        # Fail fast instead of queueing behind (and blocking) live traffic on locked tables.
+        if self.lock_timeout_ms and conn.dialect.name == "postgresql":
+            await conn.execute(
+                text(
+                    f"SET {'LOCAL ' if local else ''}lock_timeout = {int(self.lock_timeout_ms)}"
+                )
+            )
+
+    async def record_version(self, conn: AsyncConnection, migration: BaseMigration):
+        await conn.execute(
+            text(
+                f"INSERT INTO {self.table_name} (version, description, applied_at) "
+                "VALUES (:version, :description, :applied_at)"
+            ),
+            {
+                "version": migration.version,
+                "description": migration.description,
+                "applied_at": datetime.utcnow(),
+            },
+        )
+
+
+def get_registered_migrations() -> List[BaseMigration]:
+    return [c for c in component_registry.get() if isinstance(c, BaseMigration)]
@@ -1,13 +1,40 @@
 """Module containing base models"""
 
 from datetime import datetime
-from typing import List, Optional
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-from sqlalchemy import DateTime, select
-from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import DateTime, event, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    Session,
+    mapped_column,
+    object_session,
+)
 
+from .config import Settings
 from .context import dbengine
+from .db import get_db_session_manager
+from .utils.ttl_cache import TTLCache
+
+_config = Settings.get_config(strict=False)
+
+_model_caches: Dict[type, TTLCache] = {}
+
+
+def _chunks(items: Sequence, chunk_size: int):
+    for i in range(0, len(items), chunk_size):
+        yield items[i : i + chunk_size]
 
 
 class BaseORMModel(DeclarativeBase):
@@ -23,37 +50,271 @@ class BaseORMModel(DeclarativeBase):
 class BaseORMModelWithId(BaseORMModel):
     __abstract__ = True
 
+    # Set a TTL (in secs) to cache the results of get_by_id and get_all in process.
+    # Cached instances are detached and shared across requests, so treat them as read only.
+    # Writes only invalidate the cache of the process making them, so other worker processes
+    # may serve stale rows for up to the TTL.
+    __cache_ttl__: Optional[float] = None
+    __cache_max_size__: int = 1024
+
+    # Columns not overwritten by bulk_upsert, when update_columns are not given.
+    __bulk_upsert_preserve_columns__: Sequence[str] = ()
+
     id: Mapped[int] = mapped_column(primary_key=True)
     active: Mapped[bool] = mapped_column()
 
     @classmethod
     async def get_by_id(cls, id: int, active=True) -> "BaseORMModelWithId":
-        result = None
-        async_session_maker = async_sessionmaker(dbengine.get())
-        async with async_session_maker() as session:
-            result = await session.get(cls, id)
-            if result.active != active:
-                result = None
-
-        return result
+        return await cls._cached_read(("id", id, active), cls._get_by_id, id, active)
 
     @classmethod
     async def get_all(cls, active=True) -> List["BaseORMModelWithId"]:
-        response = []
-        async_session_maker = async_sessionmaker(dbengine.get())
-        async with async_session_maker() as session:
-            stmt = select(cls).where(cls.active == active).order_by(cls.id.asc())
+        return list(await cls._cached_read(("all", active), cls._get_all, active))
+
+    @classmethod
+    async def get_page(
+        cls, after_id: Optional[int] = None, limit: Optional[int] = None, active=True
+    ) -> Tuple[List["BaseORMModelWithId"], Optional[int]]:
+        """
+        Returns up to limit rows with id greater than after_id (the cursor), ordered by id.
+        Also returns the cursor of the next page, which is None if there are no more rows.
+        """
+        limit = limit or _config.db_page_size
+        stmt = select(cls).where(cls.active == active)
+        if after_id is not None:
+            stmt = stmt.where(cls.id > after_id)
+        stmt = stmt.order_by(cls.id.asc()).limit(limit + 1)
 
+        manager = get_db_session_manager()
+        if manager.requires_primary():
+            session_context = manager.read_session()
+        else:
+            # A new session per page, so loaded rows are not retained by the request session.
+            session_context = manager.detached_read_session()
+        async with session_context as session:
             result = await session.execute(stmt)
+            rows = list(result.scalars())
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1].id
+        return rows, None
 
-            response = list(result.scalars())
+    @classmethod
+    async def iter_all(
+        cls, active=True, page_size: Optional[int] = None
+    ) -> AsyncIterator["BaseORMModelWithId"]:
+        """
+        Yields all rows ordered by id, fetching page_size rows per query,
+        using keyset pagination on id. No connection is held between pages,
+        so memory and connection usage stay flat irrespective of the table size.
+        """
+        after_id = None
+        while True:
+            rows, after_id = await cls.get_page(
+                after_id=after_id, limit=page_size, active=active
+            )
+            for row in rows:
+                yield row
+            if after_id is None:
+                break
+
+    @classmethod
+    async def bulk_get_by_ids(
+        cls, ids: Iterable[int], active=True, chunk_size: Optional[int] = None
+    ) -> List["BaseORMModelWithId"]:
+        """
+        Returns the rows with the given ids, ordered by id, fetching chunk_size ids per query.
+        Ids that are not found (or don't match active) are skipped.
+        """
+        ids = list(dict.fromkeys(ids))
+        response = []
+        async with get_db_session_manager().read_session() as session:
+            for chunk in _chunks(ids, chunk_size or _config.db_bulk_chunk_size):
+                stmt = select(cls).where(cls.id.in_(chunk), cls.active == active)
+                result = await session.execute(stmt)
+                response.extend(result.scalars())
+        response.sort(key=lambda row: row.id)
         return response
 
+    @classmethod
+    async def bulk_insert(
+        cls, rows: Sequence[Dict[str, Any]], chunk_size: Optional[int] = None
+    ) -> int:
+        """
+        Inserts the rows (dicts of column values), chunk_size rows per statement.
+        Uses the request scoped session if active, else commits on completion.
+        Returns the number of rows inserted.
+        """
+        rows = cls.prepare_bulk_rows(rows)
+        async with get_db_session_manager().write_session() as session:
+            for chunk in _chunks(rows, chunk_size or _config.db_bulk_chunk_size):
+                await session.execute(insert(cls), chunk)
+            _record_cache_invalidation(session.sync_session, cls)
+        return len(rows)
+
+    @classmethod
+    async def bulk_upsert(
+        cls,
+        rows: Sequence[Dict[str, Any]],
+        index_elements: Sequence[str] = ("id",),
+        update_columns: Optional[Sequence[str]] = None,
+        chunk_size: Optional[int] = None,
+    ) -> int:
+        """
+        Inserts the rows (dicts of column values), updating the existing ones
+        using INSERT .. ON CONFLICT (index_elements) DO UPDATE, chunk_size rows per statement.
+        Updates the columns present in the rows, except the index elements, if update_columns not given.
+        Uses the request scoped session if active, else commits on completion.
+        Returns the number of rows upserted.
+        """
+        rows = cls.prepare_bulk_rows(rows)
+        if not rows:
+            return 0
+        if update_columns is None:
+            update_columns = [
+                column
+                for column in dict.fromkeys(k for row in rows for k in row)
+                if column not in index_elements
+                and column not in cls.__bulk_upsert_preserve_columns__
+            ]
+        async with get_db_session_manager().write_session() as session:
+            dialect_name = session.bind.dialect.name
+            if dialect_name == "postgresql":
+                stmt = postgresql.insert(cls)
+            elif dialect_name == "sqlite":
+                stmt = sqlite.insert(cls)
+            else:
+                raise NotImplementedError(
+                    f"Bulk upsert not supported on {dialect_name}"
+                )
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=index_elements,
+                    set_={column: stmt.excluded[column] for column in update_columns},
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+            for chunk in _chunks(rows, chunk_size or _config.db_bulk_chunk_size):
+                await session.execute(stmt, chunk)
+            _record_cache_invalidation(session.sync_session, cls)
+        return len(rows)
+
+    @classmethod
+    def prepare_bulk_rows(cls, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Overload this to fill in values for bulk inserts/upserts
+        return [dict(row) for row in rows]
+
+    @classmethod
+    async def _get_by_id(cls, session, id: int, active=True):
+        result = await session.get(cls, id)
+        if result.active != active:
+            result = None
+        return result
+
+    @classmethod
+    async def _get_all(cls, session, active=True):
+        stmt = select(cls).where(cls.active == active).order_by(cls.id.asc())
+
+        result = await session.execute(stmt)
+
+        return list(result.scalars())
+
+    @classmethod
+    async def _cached_read(cls, key, query, *args):
+        """
+        Runs query(session, *args) on a read session.
+        Goes through the model's cache, if enabled and the reads need not see the latest writes.
+        """
+        manager = get_db_session_manager()
+        cache = cls.get_cache()
+        if cache is None or manager.requires_primary():
+            async with manager.read_session() as session:
+                return await query(session, *args)
+
+        result = cache.get(key)
+        if result is TTLCache.MISSING:
+            async with manager.detached_read_session() as session:
+                result = await query(session, *args)
+            cache.set(key, result)
+        return result
+
+    @classmethod
+    def get_cache(cls) -> Optional[TTLCache]:
+        if not cls.__cache_ttl__:
+            return None
+        cache = _model_caches.get(cls)
+        if cache is None:
+            cache = _model_caches[cls] = TTLCache(
+                cls.__cache_ttl__, max_size=cls.__cache_max_size__
+            )
+        return cache
+
+    @classmethod
+    def invalidate_cache(cls, id: Optional[int] = None):
+        """
+        Drops the cached results of this model. Only those containing the given id, if given.
+        Called automatically when a session of this process commits inserts, updates or deletes
+        of instances of this model, or bulk inserts/upserts.
+        """
+        cache = _model_caches.get(cls)
+        if cache is None:
+            return
+        if id is None:
+            cache.invalidate()
+        else:
+            cache.invalidate(predicate=lambda key: key[0] == "all" or key[1] == id)
+
+    @classmethod
+    def get_cache_stats(cls) -> Optional[dict]:
+        cache = _model_caches.get(cls)
+        return cache.stats() if cache is not None else None
+
+
+def _record_cache_invalidation(session: Session, cls: type, id: Optional[int] = None):
+    # Invalidating at flush would let concurrent reads cache the rows again
+    # before the changes are committed, so they are invalidated after commit.
+    if cls.__cache_ttl__:
+        session.info.setdefault("invalidate_model_caches", set()).add((cls, id))
+
+
+@event.listens_for(BaseORMModelWithId, "after_insert", propagate=True)
+@event.listens_for(BaseORMModelWithId, "after_update", propagate=True)
+@event.listens_for(BaseORMModelWithId, "after_delete", propagate=True)
+def _record_model_cache_invalidation(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        type(target).invalidate_cache(target.id)
+    else:
+        _record_cache_invalidation(session, type(target), target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_model_caches(session):
+    for cls, id in session.info.pop("invalidate_model_caches", ()):
+        cls.invalidate_cache(id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_model_cache_invalidations(session):
+    session.info.pop("invalidate_model_caches", None)
+
 
 class BaseORMModelWithTimes(BaseORMModelWithId):
     __abstract__ = True
 
+    __bulk_upsert_preserve_columns__ = ("created_at",)
+
     created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
     updated_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime(), default=datetime.utcnow
     )
+
+    @classmethod
+    def prepare_bulk_rows(cls, rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        rows = super().prepare_bulk_rows(rows)
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault("created_at", now)
+            row["updated_at"] = now
+        return rows
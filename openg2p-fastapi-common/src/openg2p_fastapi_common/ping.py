@@ -1,11 +1,14 @@
 # ruff: noqa: E402
 
+from fastapi import Response
+
 from .config import Settings
 
 _config = Settings.get_config(strict=False)
 
 from .app import Initializer
 from .controller import BaseController
+from .health import HealthProber
 
 
 class PingController(BaseController):
@@ -19,6 +22,16 @@ class PingController(BaseController):
             self.get_ping,
             methods=["GET"],
         )
+        self.router.add_api_route(
+            _config.health_liveness_path,
+            self.get_liveness,
+            methods=["GET"],
+        )
+        self.router.add_api_route(
+            _config.health_readiness_path,
+            self.get_readiness,
+            methods=["GET"],
+        )
 
     async def get_ping(self):
         """
@@ -27,6 +40,33 @@ class PingController(BaseController):
         """
         return "pong"
 
+    async def get_liveness(self):
+        """
+        Liveness probe. Returns 503 if the background health prober has stalled.
+        """
+        prober = HealthProber.get_component()
+        if prober and not prober.is_alive():
+            return Response(
+                b'{"status":"not_alive"}', 503, media_type="application/json"
+            )
+        return Response(b'{"status":"alive"}', media_type="application/json")
+
+    async def get_readiness(self):
+        """
+        Readiness probe. Returns the last status of every check of the background
+        health prober, and 503 if any critical check is down.
+        """
+        prober = HealthProber.get_component()
+        if not prober:
+            return Response(
+                b'{"status":"ready","checks":{}}', media_type="application/json"
+            )
+        return Response(
+            prober.readiness_body,
+            200 if prober.ready else 503,
+            media_type="application/json",
+        )
+
 
 class PingInitializer(Initializer):
     def initialize(self, **kwargs):
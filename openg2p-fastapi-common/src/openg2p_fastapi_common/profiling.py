@@ -0,0 +1,279 @@
+"""Module containing the on demand, per request sampling profiler"""
+
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .component import BaseComponent
+from .config import Settings
+from .controller import BaseController
+from .errors.http_exceptions import NotFoundError, UnauthorizedError
+from .executors import run_sync
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+# Samples taken while the request's coroutine was suspended, eg. waiting for the DB.
+AWAITING_FRAME = "[awaiting]"
+
+
+class RequestProfile:
+    """
+    Samples of the stack of one request, folded into flame graph compatible
+    "frame;frame;frame count" lines.
+    """
+
+    def __init__(self, method: str, path: str, thread_id: int, anchor_frame):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.thread_id = thread_id
+        self.anchor_frame = anchor_frame
+        self.created_at = datetime.utcnow()
+        self.duration_ms = 0
+        self.samples = 0
+        self.stacks: Dict[str, int] = Counter()
+
+    def add_sample(self, frame):
+        stack = []
+        while frame is not None and frame is not self.anchor_frame:
+            code = frame.f_code
+            stack.append(
+                f"{getattr(code, 'co_qualname', code.co_name)} "
+                f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+        if frame is None:
+            # The anchor is not on the stack, so the loop is running some other task.
+            stack = [AWAITING_FRAME]
+        stack.append(f"{self.method} {self.path}")
+        self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def to_folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+        }
+
+
+class RequestProfiler(BaseComponent):
+    """
+    Runs one sampler thread for all requests being profiled, and keeps the latest reports.
+    """
+
+    def __init__(
+        self,
+        name="",
+        interval_ms: Optional[float] = None,
+        output_dir: Optional[Path] = None,
+        max_reports: Optional[int] = None,
+        **kwargs,
+    ):
+        super().__init__(name=name)
+        self.interval = (interval_ms or _config.profiling_interval_ms) / 1000
+        self.output_dir = output_dir or _config.profiling_output_dir
+        self.reports: Deque[RequestProfile] = deque(
+            maxlen=max_reports or _config.profiling_max_reports
+        )
+        self.active: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: RequestProfile):
+        with self._lock:
+            self.active.append(profile)
+            # Also restarts the sampler in forked workers, where the thread doesn't survive.
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="request-profiler", daemon=True
+                )
+                self._thread.start()
+
+    async def stop(self, profile: RequestProfile, keep: bool = True):
+        with self._lock:
+            self.active.remove(profile)
+        if keep:
+            await self.save(profile)
+
+    async def save(self, profile: RequestProfile):
+        self.reports.append(profile)
+        if self.output_dir:
+            # In the thread pool, so that the file write doesn't block the event loop.
+            await run_sync(self.write_profile, profile)
+        _logger.info(
+            "Profiled %s %s. Duration %dms, %d samples. Profile id %s.",
+            profile.method,
+            profile.path,
+            profile.duration_ms,
+            profile.samples,
+            profile.id,
+        )
+
+    def write_profile(self, profile: RequestProfile):
+        path_name = re.sub(r"[^A-Za-z0-9]+", "_", profile.path).strip("_")
+        file_name = (
+            f"{profile.created_at:%Y%m%dT%H%M%S}-{profile.method}-"
+            f"{path_name}-{profile.id}.folded"
+        )
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, file_name), "w") as f:
+                f.write(profile.to_folded())
+        except OSError:
+            _logger.exception("Could not write request profile %s.", profile.id)
+
+    def get_report(self, profile_id: str) -> Optional[RequestProfile]:
+        for profile in self.reports:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.active:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for profile in self.active:
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None:
+                        profile.add_sample(frame)
+            del frames
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests carrying the profiling secret in the header or query parameter,
+    and a random fraction of the other requests, of which only those slower
+    than the threshold are kept.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+        self.header = _config.profiling_header.lower().encode()
+        self.query_param = _config.profiling_query_param
+        self.sample_fraction = _config.profiling_sample_fraction
+        self.slow_threshold_ms = _config.profiling_slow_threshold_ms
+        self.admin_path = _config.profiling_admin_path.rstrip("/")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.is_admin_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        requested = self.is_requested(scope)
+        if not requested and (
+            not self.sample_fraction or random.random() >= self.sample_fraction
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            scope["method"], scope["path"], threading.get_ident(), sys._getframe()
+        )
+        start = time.perf_counter()
+        self.profiler.start(profile)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.duration_ms = int((time.perf_counter() - start) * 1000)
+            await self.profiler.stop(
+                profile,
+                keep=requested or profile.duration_ms >= self.slow_threshold_ms,
+            )
+
+    def is_admin_path(self, path: str) -> bool:
+        return path == self.admin_path or path.startswith(self.admin_path + "/")
+
+    def is_requested(self, scope: Scope) -> bool:
+        # Compared as the raw bytes sent, as compare_digest rejects non ASCII str.
+        secret = _config.profiling_secret.encode()
+        if not secret:
+            return False
+        for name, value in scope["headers"]:
+            if name == self.header:
+                return hmac.compare_digest(value, secret)
+        query_string = scope.get("query_string", b"")
+        if self.query_param and self.query_param.encode() in query_string:
+            # Unquoted as latin-1, which maps every byte to one char and back.
+            values = parse_qs(query_string.decode("latin-1"), encoding="latin-1").get(
+                self.query_param
+            )
+            return bool(values) and hmac.compare_digest(
+                values[0].encode("latin-1"), secret
+            )
+        return False
+
+
+class ProfilingController(BaseController):
+    def __init__(self, name="", **kwargs):
+        super().__init__(name, **kwargs)
+
+        self.router.tags += ["profiling"]
+
+        self.router.add_api_route(
+            _config.profiling_admin_path,
+            self.get_profiles,
+            methods=["GET"],
+            include_in_schema=False,
+        )
+        self.router.add_api_route(
+            f"{_config.profiling_admin_path}/{{profile_id}}",
+            self.get_profile_report,
+            methods=["GET"],
+            include_in_schema=False,
+        )
+
+    async def get_profiles(self, request: Request):
+        """
+        Lists the latest request profiles. Requires the profiling secret header.
+        """
+        self.authorize(request)
+        return [
+            profile.summary()
+            for profile in reversed(RequestProfiler.get_component().reports)
+        ]
+
+    async def get_profile_report(self, profile_id: str, request: Request):
+        """
+        Returns the profile in the folded stack format of flamegraph.pl and speedscope.
+        Requires the profiling secret header.
+        """
+        self.authorize(request)
+        profile = RequestProfiler.get_component().get_report(profile_id)
+        if not profile:
+            raise NotFoundError()
+        return PlainTextResponse(profile.to_folded())
+
+    def authorize(self, request: Request):
+        secret = _config.profiling_secret.encode()
+        # Headers are decoded as latin-1, so this gives back the raw header bytes.
+        value = request.headers.get(_config.profiling_header, "").encode("latin-1")
+        if not secret or not hmac.compare_digest(value, secret):
+            raise UnauthorizedError()
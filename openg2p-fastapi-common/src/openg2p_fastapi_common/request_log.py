@@ -0,0 +1,159 @@
+"""Module containing the sampled request (access) log instrumentation"""
+
+import logging
+import random
+import re
+from typing import Dict, Optional, Pattern, Sequence, Tuple
+
+import json_logging
+from json_logging.framework.fastapi import (
+    FastAPIAppRequestInstrumentationConfigurator,
+    FastAPIRequestAdapter,
+    FastAPIResponseAdapter,
+)
+from json_logging.framework.fastapi.implementation import JSONLoggingASGIMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import Settings
+
+_config = Settings.get_config(strict=False)
+
+
+class RequestLogPolicy:
+    """
+    Decides whether, and at which level, a request is logged.
+    Sample rates and levels are looked up by the first matching path regex.
+    Requests at or above always_log_status, or slower than slow_threshold_ms,
+    are always logged, at ERROR and WARNING respectively.
+    """
+
+    MAX_CACHED_PATHS = 1024
+
+    def __init__(
+        self,
+        sample_rates: Optional[Dict[str, float]] = None,
+        levels: Optional[Dict[str, str]] = None,
+        default_level: str = "INFO",
+        always_log_status: int = 500,
+        slow_threshold_ms: int = 0,
+    ):
+        self.sample_rates = self._compile(sample_rates or {})
+        self.levels = [
+            (pattern, logging.getLevelName(level.upper()))
+            for pattern, level in self._compile(levels or {})
+        ]
+        self.default_level = logging.getLevelName(default_level.upper())
+        self.always_log_status = always_log_status
+        self.slow_threshold_ms = slow_threshold_ms
+        self._path_cache: Dict[str, Tuple[float, int]] = {}
+
+    def get_log_level(
+        self, path: str, status_code: int, response_time_ms: int
+    ) -> Optional[int]:
+        """
+        Returns the level to log the request at, or None if it is to be skipped.
+        """
+        sample_rate, level = self._get_path_policy(path)
+        if self.always_log_status and status_code >= self.always_log_status:
+            return max(level, logging.ERROR)
+        if self.slow_threshold_ms and response_time_ms >= self.slow_threshold_ms:
+            return max(level, logging.WARNING)
+        if sample_rate >= 1 or random.random() < sample_rate:
+            return level
+        return None
+
+    def _get_path_policy(self, path: str) -> Tuple[float, int]:
+        policy = self._path_cache.get(path)
+        if policy is None:
+            policy = (
+                self._match(self.sample_rates, path, 1.0),
+                self._match(self.levels, path, self.default_level),
+            )
+            # Paths with path parameters are unbounded. Stop caching instead of evicting.
+            if len(self._path_cache) < self.MAX_CACHED_PATHS:
+                self._path_cache[path] = policy
+        return policy
+
+    @staticmethod
+    def _match(rules: Sequence[Tuple[Pattern, object]], path: str, default):
+        for pattern, value in rules:
+            if pattern.match(path):
+                return value
+        return default
+
+    @staticmethod
+    def _compile(rules: Dict[str, object]):
+        return [(re.compile(pattern), value) for pattern, value in rules.items()]
+
+
+class RequestLogFormatter(json_logging.JSONRequestLogFormatter):
+    """
+    JSONRequestLogFormatter that also includes the level, which varies by route and outcome.
+    """
+
+    def _format_log_object(self, record, request_util):
+        json_log_object = super()._format_log_object(record, request_util)
+        json_log_object["level"] = record.levelname
+        return json_log_object
+
+
+class SampledRequestLogMiddleware(JSONLoggingASGIMiddleware):
+    """
+    JSONLoggingASGIMiddleware that logs requests according to the RequestLogPolicy from Settings.
+    """
+
+    def __init__(self, app, exclude_url_patterns=()):
+        super().__init__(app, exclude_url_patterns=exclude_url_patterns)
+        self.policy = RequestLogPolicy(
+            sample_rates=_config.logging_request_sample_rates,
+            levels=_config.logging_request_levels,
+            default_level=_config.logging_request_default_level,
+            always_log_status=_config.logging_request_always_log_status,
+            slow_threshold_ms=_config.logging_request_slow_threshold_ms,
+        )
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        if not json_logging.util.is_not_match_any_pattern(
+            request.url.path, self.exclude_url_patterns
+        ):
+            return await call_next(request)
+
+        request_info = json_logging.RequestInfo(request)
+        response = await call_next(request)
+        request_info.update_response_status(response)
+        level = self.policy.get_log_level(
+            request.url.path,
+            request_info.response_status,
+            request_info.response_time_ms,
+        )
+        if level is not None:
+            self.request_logger.log(
+                level, "", extra={"request_info": request_info, "type": "request"}
+            )
+        return response
+
+
+class SampledRequestInstrumentationConfigurator(
+    FastAPIAppRequestInstrumentationConfigurator
+):
+    def config(self, app, exclude_url_patterns=()):
+        logging.getLogger("uvicorn.access").disabled = True
+        self.request_logger = logging.getLogger("fastapi-request-logger")
+        app.add_middleware(
+            SampledRequestLogMiddleware, exclude_url_patterns=exclude_url_patterns
+        )
+
+
+def register_request_log_support():
+    """
+    Makes json_logging instrument FastAPI apps with SampledRequestLogMiddleware.
+    Call before json_logging.init_fastapi.
+    """
+    json_logging.register_framework_support(
+        "fastapi",
+        app_configurator=None,
+        app_request_instrumentation_configurator=SampledRequestInstrumentationConfigurator,
+        request_adapter_class=FastAPIRequestAdapter,
+        response_adapter_class=FastAPIResponseAdapter,
+    )
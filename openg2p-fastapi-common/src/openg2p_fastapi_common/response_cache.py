@@ -0,0 +1,312 @@
+"""Module containing route level response caching, with ETags and conditional GETs"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Callable, Dict, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from .component import BaseComponent
+from .config import Settings
+from .utils.ttl_cache import TTLCache
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+# Response headers not stored in the cache.
+_UNCACHED_HEADERS = {"content-length", "set-cookie", "etag", "vary", "date"}
+
+
+class CachedResponse:
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+    def dumps(self) -> bytes:
+        return (
+            orjson.dumps({"status_code": self.status_code, "headers": self.headers})
+            + b"\n"
+            + self.body
+        )
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CachedResponse":
+        meta, _, body = data.partition(b"\n")
+        meta = orjson.loads(meta)
+        return cls(meta["status_code"], meta["headers"], body)
+
+
+class MemoryResponseCacheBackend:
+    def __init__(self, max_size: int):
+        self.cache = TTLCache(0, max_size=max_size)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return self.cache.get(key, None)
+
+    async def set(self, key: str, response: CachedResponse, ttl: float):
+        self.cache.set(key, response, ttl=ttl)
+
+    async def invalidate(self, prefix: str = ""):
+        self.cache.invalidate(predicate=lambda key: key.startswith(prefix))
+
+
+class RedisResponseCacheBackend:
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+
+        self.redis = redis_asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        data = await self.redis.get(key)
+        return CachedResponse.loads(data) if data is not None else None
+
+    async def set(self, key: str, response: CachedResponse, ttl: float):
+        await self.redis.set(key, response.dumps(), px=int(ttl * 1000))
+
+    async def invalidate(self, prefix: str = ""):
+        keys = [key async for key in self.redis.scan_iter(match=f"{prefix}*")]
+        if keys:
+            await self.redis.delete(*keys)
+
+
+class ResponseCache(BaseComponent):
+    """
+    Holds the response cache backends, by name ("memory", "redis").
+    The redis backend is available if response_cache_redis_url is configured.
+    Backend errors are logged and treated as cache misses.
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self.key_prefix = _config.response_cache_key_prefix
+        self.backends = {
+            "memory": MemoryResponseCacheBackend(_config.response_cache_max_size)
+        }
+        if _config.response_cache_redis_url:
+            self.backends["redis"] = RedisResponseCacheBackend(
+                _config.response_cache_redis_url
+            )
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def get_backend(self, name: Optional[str] = None):
+        name = name or _config.response_cache_backend
+        backend = self.backends.get(name)
+        if backend is None:
+            raise ValueError(f"Response cache backend {name} is not configured")
+        return backend
+
+    async def get(self, backend, key: str) -> Optional[CachedResponse]:
+        try:
+            response = await backend.get(key)
+        except Exception:
+            self.errors += 1
+            _logger.exception("Response cache read failed.")
+            response = None
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def set(self, backend, key: str, response: CachedResponse, ttl: float):
+        try:
+            await backend.set(key, response, ttl)
+        except Exception:
+            self.errors += 1
+            _logger.exception("Response cache write failed.")
+
+    async def invalidate(self, route_name: str = "", backend: Optional[str] = None):
+        """
+        Drops the cached responses of the route (by its name), or all, if not given.
+        """
+        prefix = f"{self.key_prefix}{route_name}:" if route_name else self.key_prefix
+        await self.get_backend(backend).invalidate(prefix)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+        }
+
+
+def cached_response(
+    ttl: float,
+    key: Optional[Callable[[Request], str]] = None,
+    vary_auth: bool = False,
+    backend: Optional[str] = None,
+):
+    """
+    Decorator caching the successful GET responses of a BaseController route for ttl seconds.
+    The cache key is the path and query, or the result of key(request), if given.
+    If vary_auth, responses are cached per Authorization header / access token cookie.
+    Responses carry an ETag, and requests with a matching If-None-Match get a 304.
+    The cache is looked up after the route dependencies are resolved, so dependencies,
+    like authentication, still run (and may reject the request) on every request.
+    Only the endpoint call is skipped on a cache hit. Eg.
+    @cached_response(ttl=60)
+    async def get_login_providers(self): ...
+    """
+
+    def decorator(endpoint):
+        endpoint.__response_cache__ = {
+            "ttl": ttl,
+            "key": key,
+            "vary_auth": vary_auth,
+            "backend": backend,
+        }
+        return endpoint
+
+    return decorator
+
+
+def get_auth_identity(request: Request) -> str:
+    token = request.headers.get("authorization") or request.cookies.get(
+        "X-Access-Token", ""
+    )
+    return hashlib.sha256(token.encode()).hexdigest() if token else ""
+
+
+class CachedAPIRoute(APIRoute):
+    """
+    Route class of BaseController routers, serving the routes decorated
+    with cached_response from the response cache.
+    The endpoint call is wrapped, rather than the route handler, so that the cache
+    is only looked up once the dependencies have run. On a miss, the serialized
+    response is cached by the route handler.
+    """
+
+    # Name of the parameter the request is injected as, if the endpoint doesn't take it.
+    REQUEST_PARAM_NAME = "__response_cache_request__"
+
+    def get_route_handler(self) -> Callable:
+        settings = getattr(self.endpoint, "__response_cache__", None)
+        if (
+            not _config.response_cache_enabled
+            or not settings
+            or not settings["ttl"]
+            or "GET" not in self.methods
+        ):
+            return super().get_route_handler()
+
+        ttl = settings["ttl"]
+        key_func = settings["key"]
+        vary_auth = settings["vary_auth"]
+        backend_name = settings["backend"]
+        vary = "Authorization, Cookie" if vary_auth else None
+
+        self.dependant.call = self.get_cached_call(
+            self.dependant.call, key_func, vary_auth, backend_name, vary
+        )
+        handler = super().get_route_handler()
+
+        async def cached_handler(request: Request) -> Response:
+            response = await handler(request)
+            # Only set by the endpoint call on a cache miss.
+            miss = request.scope.pop("response_cache", None)
+            if miss is None:
+                return response
+            backend, key = miss
+            if (
+                response.status_code != 200
+                or response.background is not None
+                or not hasattr(response, "body")
+            ):
+                return response
+            cached = CachedResponse(
+                response.status_code,
+                {
+                    k: v
+                    for k, v in response.headers.items()
+                    if k not in _UNCACHED_HEADERS
+                },
+                response.body,
+            )
+            await get_response_cache().set(backend, key, cached, ttl)
+            return get_conditional_response(request, cached, response, vary)
+
+        return cached_handler
+
+    def get_cached_call(
+        self,
+        call: Callable,
+        key_func: Optional[Callable[[Request], str]],
+        vary_auth: bool,
+        backend_name: Optional[str],
+        vary: Optional[str],
+    ) -> Callable:
+        request_param_name = self.dependant.request_param_name
+        if request_param_name is None:
+            request_param_name = (
+                self.dependant.request_param_name
+            ) = self.REQUEST_PARAM_NAME
+            pop_request = True
+        else:
+            pop_request = False
+        is_coroutine = asyncio.iscoroutinefunction(call)
+
+        async def cached_call(**values):
+            if pop_request:
+                request = values.pop(request_param_name)
+            else:
+                request = values[request_param_name]
+
+            if request.method in ("GET", "HEAD"):
+                cache = get_response_cache()
+                backend = cache.get_backend(backend_name)
+                key = f"{cache.key_prefix}{self.name}:" + (
+                    key_func(request)
+                    if key_func
+                    else f"{request.url.path}?{request.url.query}"
+                )
+                if vary_auth:
+                    key += f":{get_auth_identity(request)}"
+                cached = await cache.get(backend, key)
+                if cached is not None:
+                    return get_conditional_response(request, cached, None, vary)
+                request.scope["response_cache"] = (backend, key)
+
+            if is_coroutine:
+                return await call(**values)
+            return await run_in_threadpool(call, **values)
+
+        return cached_call
+
+
+def get_conditional_response(
+    request: Request,
+    cached: CachedResponse,
+    response: Optional[Response],
+    vary: Optional[str],
+) -> Response:
+    """
+    Returns a 304 if the If-None-Match of the request matches the ETag of the cached response.
+    Else the response, or one built from the cached response, if not given.
+    """
+    if_none_match = request.headers.get("if-none-match", "")
+    if cached.etag in if_none_match or if_none_match.strip() == "*":
+        get_response_cache().not_modified += 1
+        response = Response(status_code=304)
+    elif response is None:
+        response = Response(
+            cached.body, status_code=cached.status_code, headers=cached.headers
+        )
+    headers = response.headers
+    headers["ETag"] = cached.etag
+    if vary:
+        headers["Vary"] = vary
+    return response
+
+
+def get_response_cache() -> ResponseCache:
+    return ResponseCache.get_component() or ResponseCache()
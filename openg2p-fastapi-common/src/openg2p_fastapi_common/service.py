@@ -1,8 +1,23 @@
 """Module for initiailizing base Service"""
 
+from typing import TYPE_CHECKING
+
 from .component import BaseComponent
 
+if TYPE_CHECKING:
+    from .metrics import MetricsManager
+
 
 class BaseService(BaseComponent):
     def __init__(self, name=""):
         super().__init__(name)
+
+    @property
+    def metrics(self) -> "MetricsManager":
+        """
+        Metrics registry of the service, for custom metrics. Eg.
+        self.metrics.counter("ids_mapped", "Number of IDs mapped.").inc()
+        """
+        from .metrics import get_metrics_manager
+
+        return get_metrics_manager()
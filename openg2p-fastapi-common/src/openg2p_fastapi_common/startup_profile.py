@@ -0,0 +1,126 @@
+"""Module containing the startup-profile command, reporting import and initializer times"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+from .context import component_registry
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_import_times(output: str) -> List[ImportTime]:
+    """
+    Parses the stderr output of python -X importtime.
+    """
+    import_times = []
+    for line in output.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            import_times.append(
+                ImportTime(
+                    module=match.group(4),
+                    self_us=int(match.group(1)),
+                    cumulative_us=int(match.group(2)),
+                    depth=len(match.group(3)) // 2,
+                )
+            )
+    return import_times
+
+
+def get_initializer_times() -> List[dict]:
+    from .app import Initializer
+
+    return [
+        {
+            "initializer": f"{type(c).__module__}.{type(c).__qualname__}",
+            "seconds": getattr(c, "initialize_duration", 0.0),
+        }
+        for c in component_registry.get()
+        if isinstance(c, Initializer)
+    ]
+
+
+def write_initializer_times(path: str):
+    with open(path, "w") as f:
+        json.dump(get_initializer_times(), f)
+
+
+def profile_startup(top: int = 25) -> dict:
+    """
+    Starts the same command line again, in a new interpreter with -X importtime,
+    up to the point where initializers are done. Returns the import times
+    (per top level package and the slowest modules) and the time taken by each Initializer.
+    """
+    orig_argv = getattr(sys, "orig_argv", [sys.executable] + sys.argv)
+    fd, timings_file = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime"]
+            + orig_argv[1:]
+            + ["--initializer-times-file", timings_file],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False,
+        )
+        with open(timings_file) as f:
+            content = f.read()
+        if result.returncode or not content:
+            raise RuntimeError(
+                f"Startup profile run failed with exit code {result.returncode}.\n"
+                + result.stderr[-2000:]
+            )
+        initializer_times = json.loads(content)
+    finally:
+        os.remove(timings_file)
+
+    import_times = parse_import_times(result.stderr)
+    packages: Dict[str, int] = defaultdict(int)
+    for import_time in import_times:
+        packages[import_time.module.split(".")[0]] += import_time.self_us
+    return {
+        "total_import_seconds": sum(i.self_us for i in import_times) / 1e6,
+        "packages": [
+            {"package": package, "seconds": us / 1e6}
+            for package, us in sorted(packages.items(), key=lambda p: -p[1])[:top]
+        ],
+        "modules": [
+            {
+                "module": i.module,
+                "self_seconds": i.self_us / 1e6,
+                "cumulative_seconds": i.cumulative_us / 1e6,
+            }
+            for i in sorted(import_times, key=lambda i: -i.cumulative_us)[:top]
+        ],
+        "initializers": initializer_times,
+        "total_initializer_seconds": sum(i["seconds"] for i in initializer_times),
+    }
+
+
+def format_startup_profile(profile: dict) -> str:
+    lines = [f"Imports: {profile['total_import_seconds']:.3f}s", "", "By package:"]
+    lines += [f"  {p['seconds']:8.3f}s  {p['package']}" for p in profile["packages"]]
+    lines += ["", "Slowest modules (cumulative / self):"]
+    lines += [
+        f"  {m['cumulative_seconds']:8.3f}s {m['self_seconds']:8.3f}s  {m['module']}"
+        for m in profile["modules"]
+    ]
+    lines += ["", f"Initializers: {profile['total_initializer_seconds']:.3f}s"]
+    lines += [
+        f"  {i['seconds']:8.3f}s  {i['initializer']}" for i in profile["initializers"]
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,148 @@
+"""Module containing the pre-fork multi worker server supervisor"""
+
+import gc
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+import uvicorn
+
+from .config import Settings
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class WorkerSupervisor:
+    """
+    Binds the server socket once, forks the given number of uvicorn workers
+    sharing that socket, and restarts workers that die until asked to shut down.
+    """
+
+    HANDLED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGQUIT)
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        workers: int,
+        post_fork: Optional[Callable[[], None]] = None,
+        on_worker_exit: Optional[Callable[[int], None]] = None,
+        gc_freeze: bool = True,
+        restart_delay: float = 1,
+    ):
+        self.config = config
+        self.workers = workers
+        self.post_fork = post_fork
+        self.on_worker_exit = on_worker_exit
+        self.gc_freeze = gc_freeze
+        self.restart_delay = restart_delay
+
+        self.socket = None
+        self.children: Dict[int, float] = {}
+        self.should_exit = False
+
+    def run(self):
+        self.socket = self.config.bind_socket()
+        if self.gc_freeze:
+            # Move everything allocated so far to the permanent generation,
+            # so that gc in the workers doesn't touch (and copy) the shared pages.
+            gc.collect()
+            gc.freeze()
+
+        for sig in self.HANDLED_SIGNALS:
+            signal.signal(sig, self.handle_exit)
+
+        _logger.info(
+            "Started supervisor process [%d] with %d workers.",
+            os.getpid(),
+            self.workers,
+        )
+        for _ in range(self.workers):
+            self.spawn_worker()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started_at = self.children.pop(pid, None)
+            if started_at is None:
+                continue
+            if self.on_worker_exit:
+                self.on_worker_exit(pid)
+            if self.should_exit:
+                continue
+            _logger.error(
+                "Worker process [%d] died with exit code %d. Restarting.",
+                pid,
+                os.waitstatus_to_exitcode(status),
+            )
+            if time.monotonic() - started_at < self.restart_delay:
+                # Avoid a tight fork loop when workers crash right after starting.
+                time.sleep(self.restart_delay)
+            if not self.should_exit:
+                self.spawn_worker()
+
+        self.socket.close()
+        _logger.info("Stopped supervisor process [%d].", os.getpid())
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+
+        exit_code = 0
+        try:
+            for sig in self.HANDLED_SIGNALS:
+                signal.signal(sig, signal.SIG_DFL)
+            if self.post_fork:
+                self.post_fork()
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        except BaseException:
+            _logger.exception("Worker process [%d] failed.", os.getpid())
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def handle_exit(self, sig, frame):
+        self.should_exit = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+@contextmanager
+def temp_multiproc_dir() -> Iterator[Optional[str]]:
+    """
+    Sets PROMETHEUS_MULTIPROC_DIR to a new temporary directory till exit, so that
+    the metrics of the forked workers, which inherit it, are aggregated on scrape.
+    prometheus_client picks its multiprocess mode at import, so this must be entered
+    before it is imported. Does nothing if metrics are disabled, a directory is
+    already configured, or prometheus_client is already imported.
+    """
+    if (
+        not _config.metrics_enabled
+        or _config.metrics_multiproc_dir
+        or os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+        or "prometheus_client" in sys.modules
+    ):
+        yield None
+        return
+    path = tempfile.mkdtemp(prefix="prometheus-multiproc-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    try:
+        yield path
+    finally:
+        # Workers exit without unwinding, so only the supervisor gets here.
+        shutil.rmtree(path, ignore_errors=True)
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR") == path:
+            del os.environ["PROMETHEUS_MULTIPROC_DIR"]
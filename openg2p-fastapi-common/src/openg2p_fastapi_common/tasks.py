@@ -0,0 +1,256 @@
+"""Module containing the supervisor of background tasks, run in bounded named groups"""
+
+import asyncio
+import functools
+import logging
+import time
+from typing import Coroutine, Dict, Optional, Set
+
+from .component import BaseComponent
+from .config import Settings
+from .context import dbsession
+from .errors.http_exceptions import ServiceUnavailableError
+
+_config = Settings.get_config(strict=False)
+_logger = logging.getLogger(_config.logging_default_logger_name)
+
+
+class TaskRejected(ServiceUnavailableError):
+    def __init__(
+        self,
+        code="G2P-TSK-503",
+        message="Too many background tasks pending",
+        **kwargs,
+    ):
+        super().__init__(code, message, **kwargs)
+
+
+class TaskGroupMetrics:
+    def __init__(self, metrics):
+        self.tasks = metrics.counter(
+            "background_tasks",
+            "Number of finished or rejected background tasks, by group and status.",
+            ["group", "status"],
+        )
+        self.running = metrics.gauge(
+            "background_tasks_running",
+            "Number of background tasks running, by group.",
+            ["group"],
+            multiprocess_mode="livesum",
+        )
+        self.pending = metrics.gauge(
+            "background_tasks_pending",
+            "Number of background tasks waiting to run, by group.",
+            ["group"],
+            multiprocess_mode="livesum",
+        )
+        self.queue_wait = metrics.histogram(
+            "background_task_queue_wait_seconds",
+            "Time background tasks waited to run, by group.",
+            ["group"],
+            buckets=_config.metrics_latency_buckets,
+        )
+        self.duration = metrics.histogram(
+            "background_task_duration_seconds",
+            "Run time of background tasks, by group.",
+            ["group"],
+            buckets=_config.metrics_latency_buckets,
+        )
+
+
+class TaskGroup:
+    """
+    Runs up to limit tasks concurrently. Up to queue_size more wait for their turn,
+    and tasks submitted beyond that are rejected with TaskRejected.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        queue_size: int,
+        metrics: Optional[TaskGroupMetrics] = None,
+    ):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.tasks: Set[asyncio.Task] = set()
+        # Tasks that acquired the semaphore, and so run (or ran) their coroutine.
+        self.started_tasks: Set[asyncio.Task] = set()
+        self.running = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.total_queue_wait = 0.0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def pending(self) -> int:
+        return len(self.tasks) - self.running
+
+    def submit(self, coro: Coroutine) -> asyncio.Task:
+        if len(self.tasks) >= self.limit + self.queue_size:
+            coro.close()
+            self.rejected += 1
+            if self.metrics:
+                self.metrics.tasks.labels(self.name, "rejected").inc()
+            raise TaskRejected()
+        task = asyncio.create_task(self._run(coro, time.perf_counter()))
+        self.tasks.add(task)
+        self.submitted += 1
+        if self.metrics:
+            self.metrics.pending.labels(self.name).inc()
+        task.add_done_callback(functools.partial(self._task_done, coro))
+        return task
+
+    def _task_done(self, coro: Coroutine, task: asyncio.Task):
+        self.tasks.discard(task)
+        if task in self.started_tasks:
+            self.started_tasks.discard(task)
+            return
+        # Cancelled while pending, possibly before _run even started,
+        # in which case the coroutine was never awaited.
+        coro.close()
+        if self.metrics:
+            self.metrics.pending.labels(self.name).dec()
+        self._finished("cancelled")
+
+    async def _run(self, coro: Coroutine, submitted_at: float):
+        # The task may outlive the request it was submitted from,
+        # so it must not use that request's session.
+        dbsession.set(None)
+        await self._semaphore.acquire()
+        self.started_tasks.add(asyncio.current_task())
+        started_at = time.perf_counter()
+        self.started += 1
+        self.running += 1
+        self.total_queue_wait += started_at - submitted_at
+        if self.metrics:
+            self.metrics.pending.labels(self.name).dec()
+            self.metrics.running.labels(self.name).inc()
+            self.metrics.queue_wait.labels(self.name).observe(started_at - submitted_at)
+        status = "completed"
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception:
+            status = "failed"
+            _logger.exception("Background task of group %s failed.", self.name)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            if self.metrics:
+                self.metrics.running.labels(self.name).dec()
+            self._finished(status, time.perf_counter() - started_at)
+
+    def _finished(self, status: str, duration: Optional[float] = None):
+        # Duration is None for tasks cancelled before they started running.
+        setattr(self, status, getattr(self, status) + 1)
+        if self.metrics:
+            self.metrics.tasks.labels(self.name, status).inc()
+        if duration is not None:
+            self.total_duration += duration
+            self.max_duration = max(self.max_duration, duration)
+            if self.metrics:
+                self.metrics.duration.labels(self.name).observe(duration)
+
+    def stats(self) -> dict:
+        started = self.started
+        finished = started - self.running
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "running": self.running,
+            "pending": self.pending,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_queue_wait_secs": self.total_queue_wait / started if started else 0,
+            "avg_duration_secs": self.total_duration / finished if finished else 0,
+            "max_duration_secs": self.max_duration,
+        }
+
+
+class TaskSupervisor(BaseComponent):
+    """
+    Keeps track of background tasks, run in named groups with their own
+    concurrency limit and queue size (see tasks_groups in the config).
+    Tasks still running on shutdown are drained, up to a deadline, then cancelled. Eg.
+    get_task_supervisor().submit("resolve", self.start_resolve_process(...))
+    """
+
+    def __init__(self, name="", **kwargs):
+        super().__init__(name=name)
+        self.groups: Dict[str, TaskGroup] = {}
+        self.metrics: Optional[TaskGroupMetrics] = None
+        if _config.metrics_enabled:
+            from .metrics import MetricsManager
+
+            metrics = MetricsManager.get_component()
+            if metrics:
+                self.metrics = TaskGroupMetrics(metrics)
+
+    def group(
+        self, name: str, limit: Optional[int] = None, queue_size: Optional[int] = None
+    ) -> TaskGroup:
+        """
+        Returns the task group of the name, creating it if not created yet.
+        Limits from tasks_groups in the config take precedence over those given.
+        """
+        group = self.groups.get(name)
+        if group is None:
+            group_config = _config.tasks_groups.get(name, {})
+            if limit is None:
+                limit = _config.tasks_default_concurrency
+            if queue_size is None:
+                queue_size = _config.tasks_default_queue_size
+            group = self.groups[name] = TaskGroup(
+                name,
+                group_config.get("limit", limit),
+                group_config.get("queue_size", queue_size),
+                metrics=self.metrics,
+            )
+        return group
+
+    def submit(self, group: str, coro: Coroutine) -> asyncio.Task:
+        """
+        Runs the coroutine as a task of the group. Raises TaskRejected if the group's queue is full.
+        """
+        return self.group(group).submit(coro)
+
+    async def drain(self, timeout: Optional[float] = None):
+        """
+        Waits up to timeout seconds for all tasks to finish, then cancels those left.
+        """
+        tasks = [task for group in self.groups.values() for task in group.tasks]
+        if not tasks:
+            return
+        _logger.info("Draining %d background tasks.", len(tasks))
+        timeout = _config.tasks_drain_timeout_secs if timeout is None else timeout
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            _logger.warning(
+                "Cancelling %d background tasks not finished in %ss.",
+                len(pending),
+                timeout,
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
+
+    def stats(self) -> dict:
+        return {name: group.stats() for name, group in self.groups.items()}
+
+
+def get_task_supervisor() -> TaskSupervisor:
+    return TaskSupervisor.get_component() or TaskSupervisor()
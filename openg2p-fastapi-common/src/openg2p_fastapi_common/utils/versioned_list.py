@@ -0,0 +1,50 @@
+class VersionedList(list):
+    """
+    List counting its changes in version, so that indexes built over it can tell
+    whether they are stale. Appends (append, extend, +=) don't change the version,
+    as indexes can pick up the new items at the end, by comparing the length.
+    Every other change does, eg. removing an item and appending another.
+    """
+
+    version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __imul__(self, count):
+        result = super().__imul__(count)
+        self._changed()
+        return result
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        self._changed()
+
+    def remove(self, item):
+        super().remove(item)
+        self._changed()
+
+    def pop(self, index=-1):
+        item = super().pop(index)
+        self._changed()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
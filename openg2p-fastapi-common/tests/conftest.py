@@ -0,0 +1,12 @@
+import pytest
+from openg2p_fastapi_common.context import component_index, component_registry
+from openg2p_fastapi_common.utils.versioned_list import VersionedList
+
+
+@pytest.fixture(autouse=True)
+def clean_component_registry():
+    component_registry.set(VersionedList())
+    component_index.set({})
+    yield
+    component_registry.set(VersionedList())
+    component_index.set({})
@@ -0,0 +1,127 @@
+import asyncio
+import re
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from openg2p_fastapi_common.admission import (
+    AdmissionControlMiddleware,
+    AdmissionRejected,
+    ConcurrencyLimiter,
+)
+from openg2p_fastapi_common.context import app_registry
+from openg2p_fastapi_common.controller import BaseController
+from openg2p_fastapi_common.exception import BaseExceptionHandler
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+
+def test_limiter_rejects_without_queue():
+    async def test():
+        limiter = ConcurrencyLimiter(1)
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        limiter.release()
+        await limiter.acquire()
+        return limiter.stats()
+
+    assert asyncio.run(test()) == {
+        "limit": 1,
+        "active": 1,
+        "waiting": 0,
+        "rejected": 1,
+    }
+
+
+def test_limiter_queues_up_to_timeout():
+    async def test():
+        limiter = ConcurrencyLimiter(1, queue_size=1, timeout=0.05)
+        await limiter.acquire()
+        # Times out in the queue.
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        # Admitted once released.
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        # Queue full.
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        return limiter.stats()
+
+    stats = asyncio.run(test())
+    assert stats["active"] == 1
+    assert stats["waiting"] == 0
+    assert stats["rejected"] == 2
+
+
+async def concurrent_gets(app, paths, started: asyncio.Event, done: asyncio.Event):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        first = asyncio.create_task(client.get(paths[0]))
+        await started.wait()
+        responses = [await client.get(path) for path in paths[1:]]
+        done.set()
+        return [await first, *responses]
+
+
+def test_middleware_responds_503_with_retry_after():
+    async def test():
+        started, done = asyncio.Event(), asyncio.Event()
+
+        async def slow(request):
+            started.set()
+            await done.wait()
+            return PlainTextResponse("slow")
+
+        async def health(request):
+            return PlainTextResponse("ok")
+
+        app = AdmissionControlMiddleware(
+            Starlette(routes=[Route("/slow", slow), Route("/health", health)]),
+            ConcurrencyLimiter(1),
+        )
+        app.exclude_paths = [re.compile("/health")]
+        return await concurrent_gets(app, ["/slow", "/slow", "/health"], started, done)
+
+    first, rejected, excluded = asyncio.run(test())
+    assert first.status_code == 200
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
+    assert rejected.json()["errors"][0]["code"] == "G2P-REQ-503"
+    assert excluded.status_code == 200
+
+
+def test_concurrency_pool_dependency():
+    async def test():
+        started, done = asyncio.Event(), asyncio.Event()
+        app = FastAPI()
+        token = app_registry.set(app)
+        try:
+            BaseExceptionHandler()
+            controller = BaseController()
+
+            async def slow():
+                started.set()
+                await done.wait()
+                return "slow"
+
+            async def other():
+                return "other"
+
+            pool = controller.concurrency_pool("test_pool", 1, queue_size=0)
+            controller.router.add_api_route("/slow", slow, dependencies=[pool])
+            controller.router.add_api_route("/other", other, dependencies=[pool])
+            controller.post_init()
+        finally:
+            app_registry.reset(token)
+        return await concurrent_gets(app, ["/slow", "/other"], started, done)
+
+    first, rejected = asyncio.run(test())
+    assert first.status_code == 200
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
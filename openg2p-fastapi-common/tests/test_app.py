@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+# Run in a new interpreter, as the test session has already imported everything.
+COMMAND_MODULES_CODE = """
+import sys
+sys.argv = ["main", *sys.argv[1:]]
+from openg2p_fastapi_common.ping import Initializer, PingInitializer
+main_init = Initializer()
+PingInitializer()
+if sys.argv[1] == "getOpenAPI":
+    main_init.main()
+print(" ".join(m for m in {modules} if m in sys.modules))
+"""
+
+SERVER_MODULES = ["sqlalchemy", "prometheus_client", "httpx", "uvicorn", "asyncpg"]
+
+
+def get_loaded_modules(*argv) -> set:
+    result = subprocess.run(
+        [sys.executable, "-c", COMMAND_MODULES_CODE.format(modules=SERVER_MODULES)]
+        + list(argv),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_initializer_does_not_load_server_subsystems():
+    assert get_loaded_modules("migrate") == set()
+
+
+def test_get_openapi_does_not_load_server_subsystems(tmp_path):
+    openapi_file = tmp_path / "openapi.json"
+    assert get_loaded_modules("getOpenAPI", str(openapi_file)) == set()
+    assert b'"/ping"' in openapi_file.read_bytes()
@@ -0,0 +1,77 @@
+from openg2p_fastapi_common.component import BaseComponent
+from openg2p_fastapi_common.context import component_registry
+from openg2p_fastapi_common.utils.versioned_list import VersionedList
+
+
+class ComponentA(BaseComponent):
+    pass
+
+
+class ComponentB(ComponentA):
+    pass
+
+
+def test_get_component_returns_first_registered():
+    first = ComponentA()
+    ComponentA()
+    assert ComponentA.get_component() is first
+    assert BaseComponent.get_component() is first
+
+
+def test_get_component_by_subclass_and_strict():
+    a = ComponentA()
+    b = ComponentB()
+    assert ComponentB.get_component() is b
+    assert ComponentA.get_component() is a
+    assert ComponentA.get_component(strict=True) is a
+    assert BaseComponent.get_component(strict=True) is None
+
+
+def test_get_component_strict_skips_subclasses():
+    b = ComponentB()
+    a = ComponentA()
+    assert ComponentA.get_component() is b
+    assert ComponentA.get_component(strict=True) is a
+
+
+def test_get_component_by_name():
+    ComponentA()
+    named = ComponentB(name="named")
+    assert ComponentA.get_component(name="named") is named
+    assert ComponentB.get_component(name="named", strict=True) is named
+    assert ComponentA.get_component(name="named", strict=True) is None
+    assert ComponentA.get_component(name="missing") is None
+
+
+def test_index_follows_registry_changes():
+    a = ComponentA()
+    component_registry.set(VersionedList())
+    assert ComponentA.get_component() is None
+    b = ComponentB()
+    assert ComponentA.get_component() is b
+    component_registry.get().clear()
+    assert ComponentA.get_component() is None
+    component_registry.get().append(a)
+    assert ComponentA.get_component() is a
+
+
+def test_index_rebuilt_when_component_replaced():
+    a = ComponentA(name="a")
+    # Same registry size after removing one component and adding another.
+    component_registry.get().remove(a)
+    b = ComponentB(name="b")
+    assert ComponentA.get_component() is b
+    assert ComponentA.get_component(name="a") is None
+    assert ComponentA.get_component(name="b") is b
+
+    component_registry.get()[0] = a
+    assert ComponentA.get_component() is a
+    assert ComponentA.get_component(name="b") is None
+
+
+def test_index_of_plain_list_registry():
+    component_registry.set([])
+    a = ComponentA()
+    component_registry.get().remove(a)
+    b = ComponentB()
+    assert ComponentA.get_component() is b
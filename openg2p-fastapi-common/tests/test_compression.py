@@ -0,0 +1,174 @@
+import asyncio
+import gzip
+import zlib
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from openg2p_fastapi_common.compression import (
+    CompressionMiddleware,
+    compression,
+    parse_accept_encoding,
+)
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+LARGE = {"items": ["value"] * 1000}
+
+
+async def large(request):
+    return JSONResponse(LARGE)
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def image(request):
+    return Response(b"0" * 5000, media_type="image/png")
+
+
+async def encoded(request):
+    return Response(
+        gzip.compress(b"0" * 5000),
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+
+async def stream(request):
+    async def chunks():
+        for i in range(3):
+            yield f"chunk {i}\n".encode() * 200
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+app = CompressionMiddleware(
+    Starlette(
+        routes=[
+            Route("/large", large),
+            Route("/small", small),
+            Route("/image", image),
+            Route("/encoded", encoded),
+            Route("/stream", stream),
+        ]
+    )
+)
+
+
+def get(app, path, accept_encoding="gzip"):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return await c.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    return asyncio.run(run())
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.5, zstd;q=0, *;q=x") == {
+        "gzip": 1.0,
+        "br": 0.5,
+        "zstd": 0.0,
+        "*": 0.0,
+    }
+
+
+def test_select_encoding():
+    assert app.select_encoding("") is None
+    assert app.select_encoding("gzip;q=0, deflate") is None
+    assert app.select_encoding("gzip, identity") == "gzip"
+    assert app.select_encoding("*") == app.encodings[0]
+
+
+def test_compresses_large_json():
+    response = get(app, "/large")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < 1000
+    assert response.json() == LARGE
+
+
+@pytest.mark.parametrize("encoding", ["br", "zstd"])
+def test_optional_encodings(encoding):
+    pytest.importorskip({"br": "brotli", "zstd": "zstandard"}[encoding])
+    response = get(app, "/large", encoding)
+    assert response.headers["content-encoding"] == encoding
+    assert response.json() == LARGE
+
+
+@pytest.mark.parametrize("path", ["/small", "/image", "/encoded"])
+def test_passthrough(path):
+    response = get(app, path)
+    assert "vary" not in response.headers
+    if path == "/encoded":
+        assert response.content == b"0" * 5000
+    else:
+        assert "content-encoding" not in response.headers
+
+
+def test_no_accepted_encoding():
+    response = get(app, "/large", "identity")
+    assert "content-encoding" not in response.headers
+    assert response.json() == LARGE
+
+
+def test_streaming_compressed_per_chunk():
+    messages = []
+
+    async def run():
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": b""}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/stream",
+            "raw_path": b"/stream",
+            "root_path": "",
+            "scheme": "http",
+            "query_string": b"",
+            "headers": [(b"accept-encoding", b"gzip")],
+            "server": ("t", 80),
+        }
+        await app(scope, receive, send)
+
+    asyncio.run(run())
+    start, *bodies = messages
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    # Every chunk is flushed, so it can be decompressed as soon as it is received.
+    decompressor = zlib.decompressobj(31)
+    chunks = [decompressor.decompress(body["body"]) for body in bodies]
+    assert chunks[:3] == [f"chunk {i}\n".encode() * 200 for i in range(3)]
+    assert not bodies[-1]["more_body"]
+
+
+def test_route_settings():
+    fastapi_app = FastAPI()
+
+    @fastapi_app.get("/disabled")
+    @compression(enabled=False)
+    async def disabled():
+        return LARGE
+
+    @fastapi_app.get("/always")
+    @compression(min_size=0)
+    async def always():
+        return {"ok": True}
+
+    middleware = CompressionMiddleware(fastapi_app)
+    assert "content-encoding" not in get(middleware, "/disabled").headers
+    assert get(middleware, "/always").headers["content-encoding"] == "gzip"
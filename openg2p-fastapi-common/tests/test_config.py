@@ -0,0 +1,86 @@
+import pickle
+
+import pytest
+from openg2p_fastapi_common.config import Settings
+from openg2p_fastapi_common.context import config_index, config_registry
+from openg2p_fastapi_common.utils.versioned_list import VersionedList
+
+
+class OtherSettings(Settings):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def clean_config_registry():
+    registry_token = config_registry.set(VersionedList())
+    index_token = config_index.set({})
+    yield
+    config_registry.reset(registry_token)
+    config_index.reset(index_token)
+
+
+def test_get_config_is_cached():
+    config = Settings.get_config()
+    assert Settings.get_config() is config
+    assert config_registry.get() == [config]
+    assert config_index.get()["configs"][(Settings, True)] is config
+
+
+def test_get_config_strict_and_subclasses():
+    other = OtherSettings.get_config()
+    assert Settings.get_config(strict=False) is other
+    config = Settings.get_config()
+    assert config is not other
+    assert Settings.get_config(strict=False) is other
+    assert len(config_registry.get()) == 2
+
+
+def test_get_config_follows_registry_changes():
+    config = Settings.get_config()
+    config_registry.set(VersionedList())
+    new_config = Settings.get_config()
+    assert new_config is not config
+    config_registry.get().clear()
+    assert Settings.get_config() is not new_config
+
+
+def test_config_view_is_read_only_and_cached():
+    config = Settings.get_config()
+    view = config.get_config_view()
+    assert config.get_config_view() is view
+    assert view.keys() == config.model_dump().keys()
+    assert view["logging_level"] == config.logging_level
+    with pytest.raises(TypeError):
+        view["logging_level"] = "DEBUG"
+
+
+def test_config_view_not_carried_by_copies():
+    config = Settings.get_config()
+    view = config.get_config_view()
+    copy = config.model_copy(update={"logging_level": "DEBUG"})
+    assert copy.get_config_view() is not view
+    assert copy.get_config_view()["logging_level"] == "DEBUG"
+
+    restored = pickle.loads(pickle.dumps(config))
+    assert restored.model_dump() == config.model_dump()
+    assert restored.get_config_view() == view
+
+
+def test_reload_config_replaces_registered_config(monkeypatch):
+    other = OtherSettings.get_config()
+    config = Settings.get_config()
+    assert Settings.get_config(strict=False) is other
+    view = config.get_config_view()
+    monkeypatch.setenv("COMMON_LOGGING_LEVEL", "DEBUG")
+
+    new_config = config.reload_config()
+    assert config.logging_level == "INFO"
+    assert config.get_config_view() is view
+    assert new_config.logging_level == "DEBUG"
+    assert new_config.get_config_view()["logging_level"] == "DEBUG"
+    assert Settings.get_config() is new_config
+    assert Settings.get_config(strict=False) is other
+    assert config_registry.get() == [other, new_config]
+
+    new_other = other.reload_config()
+    assert Settings.get_config(strict=False) is new_other
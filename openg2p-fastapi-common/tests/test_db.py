@@ -0,0 +1,294 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from openg2p_fastapi_common import db
+from openg2p_fastapi_common.context import dbengine, dbsession_manager
+from openg2p_fastapi_common.db import (
+    DBSessionManager,
+    DBSessionMiddleware,
+    InstrumentedAsyncQueuePool,
+    InstrumentedNullPool,
+    create_db_engine,
+    get_db_session,
+    get_db_session_manager,
+    use_primary,
+)
+from openg2p_fastapi_common.models import BaseORMModelWithId
+from sqlalchemy import event, exc, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+def create_app(engine, seen_at_response_start: list):
+    app = FastAPI()
+
+    @app.post("/items/{value}")
+    async def create_item(value: str, session: AsyncSession = Depends(get_db_session)):
+        await session.execute(
+            text("INSERT INTO items (value) VALUES (:v)"), {"v": value}
+        )
+        return {"value": value}
+
+    @app.post("/fail")
+    async def fail(session: AsyncSession = Depends(get_db_session)):
+        await session.execute(text("INSERT INTO items (value) VALUES ('fail')"))
+        raise ValueError("fail")
+
+    inner = DBSessionMiddleware(app)
+
+    async def outer(scope, receive, send):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                async with engine.connect() as conn:
+                    res = await conn.execute(text("SELECT value FROM items"))
+                    seen_at_response_start.append(sorted(res.scalars()))
+            await send(message)
+
+        await inner(scope, receive, send_wrapper)
+
+    return outer
+
+
+def test_request_session_committed_before_response(tmp_path):
+    async def run():
+        engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+        dbengine.set(engine)
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE items (value TEXT)"))
+        seen = []
+        app = create_app(engine, seen)
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            assert (await c.post("/items/a")).status_code == 200
+            assert (await c.post("/fail")).status_code == 500
+        await engine.dispose()
+        return seen
+
+    seen = asyncio.run(run())
+    assert seen[0] == ["a"]
+    assert seen[1] == ["a"]
+
+
+class ReplicaItem(BaseORMModelWithId):
+    __tablename__ = "test_replica_items"
+
+    name: Mapped[str] = mapped_column()
+
+
+@pytest.fixture
+def run_replicas(tmp_path):
+    """
+    Runs the test with a primary and two replicas, each holding a row
+    named after the DB, so that reads tell which DB they were routed to.
+    """
+
+    def run(test, replica_strategy="round_robin"):
+        async def main():
+            engines = []
+            for name in ("primary", "replica0", "replica1"):
+                engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/{name}.db")
+                async with engine.begin() as conn:
+                    await conn.run_sync(ReplicaItem.__table__.create)
+                    await conn.execute(
+                        insert(ReplicaItem).values(id=1, active=True, name=name)
+                    )
+                engines.append(engine)
+            dbengine.set(engines[0])
+            dbsession_manager.set(
+                DBSessionManager(
+                    engines[0],
+                    replica_engines=engines[1:],
+                    replica_strategy=replica_strategy,
+                )
+            )
+            try:
+                return await test(*engines)
+            finally:
+                dbsession_manager.set(None)
+                for engine in engines:
+                    await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+async def read_name() -> str:
+    return (await ReplicaItem.get_by_id(1)).name
+
+
+def test_reads_round_robin_across_replicas(run_replicas):
+    async def test(*engines):
+        return [await read_name() for _ in range(4)]
+
+    assert run_replicas(test) == ["replica0", "replica1", "replica0", "replica1"]
+
+
+def test_least_loaded_replica(run_replicas):
+    async def test(primary, replica0, replica1):
+        async with replica0.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            busy_replica0 = [await read_name() for _ in range(2)]
+        async with replica1.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            busy_replica1 = await read_name()
+        return busy_replica0, busy_replica1
+
+    busy_replica0, busy_replica1 = run_replicas(test, replica_strategy="least_loaded")
+    assert busy_replica0 == ["replica1", "replica1"]
+    assert busy_replica1 == "replica0"
+
+
+def test_reads_after_write_stay_on_primary(run_replicas):
+    async def test(*engines):
+        manager = get_db_session_manager()
+        async with manager.request_session() as session:
+            before_write = await read_name()
+            # Raw reads don't pin the request to the primary.
+            await session.execute(text("SELECT name FROM test_replica_items"))
+            after_raw_read = await read_name()
+            await ReplicaItem.bulk_insert([{"id": 2, "active": True, "name": "new"}])
+            after_write = await read_name()
+        async with manager.request_session() as session:
+            await session.execute(
+                text("UPDATE test_replica_items SET active = 1 WHERE id = 1")
+            )
+            after_raw_write = await read_name()
+        # A new unit of work reads from the replicas again.
+        return (
+            before_write,
+            after_raw_read,
+            after_write,
+            after_raw_write,
+            (await read_name()),
+        )
+
+    assert run_replicas(test) == (
+        "replica0",
+        "replica1",
+        "primary",
+        "primary",
+        "replica0",
+    )
+
+
+def test_use_primary(run_replicas):
+    async def test(*engines):
+        with use_primary():
+            forced = [await read_name() for _ in range(2)]
+        return forced, await read_name()
+
+    assert run_replicas(test) == (["primary", "primary"], "replica0")
+
+
+def test_session_manager_keeps_replicas_when_engine_replaced(run_replicas):
+    async def test(primary, replica0, replica1):
+        engine = create_db_engine("sqlite+aiosqlite://")
+        dbengine.set(engine)
+        try:
+            manager = get_db_session_manager()
+            return (
+                manager.engine is engine,
+                manager.replica_engines,
+                manager.replica_strategy,
+                [replica0, replica1],
+            )
+        finally:
+            await engine.dispose()
+
+    is_new_engine, replica_engines, strategy, replicas = run_replicas(
+        test, replica_strategy="least_loaded"
+    )
+    assert is_new_engine
+    assert replica_engines == replicas
+    assert strategy == "least_loaded"
+
+
+class Connecting(Exception):
+    pass
+
+
+def get_connect_params(engine) -> dict:
+    """
+    Returns the params the engine passes to the DB driver, without connecting.
+    """
+    params = {}
+
+    @event.listens_for(engine.sync_engine, "do_connect")
+    def do_connect(dialect, connection_record, cargs, cparams):
+        params.update(cparams)
+        raise Connecting()
+
+    async def connect():
+        try:
+            with pytest.raises(Connecting):
+                async with engine.connect():
+                    pass
+        finally:
+            await engine.dispose()
+
+    asyncio.run(connect())
+    return params
+
+
+def test_pgbouncer_mode(monkeypatch):
+    monkeypatch.setattr(db._config, "db_pgbouncer_mode", True)
+    monkeypatch.setattr(db._config, "db_connect_timeout_secs", 3)
+    engine = create_db_engine("postgresql+asyncpg://user:password@db/app")
+    assert isinstance(engine.pool, InstrumentedNullPool)
+
+    params = get_connect_params(engine)
+    assert params["statement_cache_size"] == 0
+    assert params["prepared_statement_cache_size"] == 0
+    assert params["timeout"] == 3
+    get_name = params["prepared_statement_name_func"]
+    names = {get_name(), get_name()}
+    assert len(names) == 2
+    assert all(name.startswith("__asyncpg_") for name in names)
+
+
+def test_pooled_and_unpooled_engines(monkeypatch):
+    monkeypatch.setattr(db._config, "db_pgbouncer_mode", False)
+    monkeypatch.setattr(db._config, "db_pool_size", 3)
+    engine = create_db_engine("postgresql+asyncpg://user:password@db/app")
+    assert isinstance(engine.pool, InstrumentedAsyncQueuePool)
+    assert engine.pool.size() == 3
+    params = get_connect_params(engine)
+    assert params["prepared_statement_cache_size"] == db._config.db_statement_cache_size
+    assert "statement_cache_size" not in params
+    assert "prepared_statement_name_func" not in params
+
+    # Not pooled, but otherwise the same settings.
+    engine = create_db_engine("postgresql+asyncpg://user:password@db/app", pooled=False)
+    assert isinstance(engine.pool, InstrumentedNullPool)
+    assert get_connect_params(engine) == params
+
+
+def test_pool_stats(monkeypatch, tmp_path):
+    monkeypatch.setattr(db._config, "db_pool_size", 1)
+    monkeypatch.setattr(db._config, "db_max_overflow", 0)
+    monkeypatch.setattr(db._config, "db_pool_timeout_secs", 0.05)
+
+    async def test():
+        engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+        manager = DBSessionManager(engine)
+        try:
+            async with engine.connect():
+                held = manager.pool_stats()
+                with pytest.raises(exc.TimeoutError):
+                    async with engine.connect():
+                        pass
+            return held, manager.pool_stats()
+        finally:
+            await engine.dispose()
+
+    held, released = asyncio.run(test())
+    assert (held["size"], held["checked_out"], held["checkouts"]) == (1, 1, 1)
+    assert released["checked_out"] == 0
+    assert released["checked_in"] == 1
+    assert (released["checkouts"], released["checkins"]) == (1, 1)
+    assert released["timeouts"] == 1
+    assert released["wait_max_ms"] >= 0
+    assert "status" in released
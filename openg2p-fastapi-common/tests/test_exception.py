@@ -0,0 +1,162 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from openg2p_fastapi_common import exception
+from openg2p_fastapi_common.context import app_registry
+from openg2p_fastapi_common.errors.http_exceptions import NotFoundError
+from openg2p_fastapi_common.exception import BaseExceptionHandler, ErrorLogRateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(exception.time, "monotonic", clock)
+    return clock
+
+
+def test_rate_limiter_per_key_and_window(clock):
+    limiter = ErrorLogRateLimiter(2, 60)
+    assert [limiter.allow("a") for _ in range(4)] == [
+        (True, 0),
+        (True, 0),
+        (False, 0),
+        (False, 0),
+    ]
+    assert limiter.allow("b") == (True, 0)
+
+    clock.now += 59
+    assert limiter.allow("a") == (False, 0)
+    clock.now += 1
+    # The first log of the next window reports the errors suppressed in the last one.
+    assert limiter.allow("a") == (True, 3)
+    assert limiter.allow("a") == (True, 0)
+    assert limiter.allow("b") == (True, 0)
+
+
+def test_rate_limiter_disabled_and_bounded(clock):
+    limiter = ErrorLogRateLimiter(0, 60)
+    assert all(limiter.allow("a") == (True, 0) for _ in range(100))
+
+    limiter = ErrorLogRateLimiter(1, 60, max_keys=2)
+    limiter.allow("a")
+    clock.now += 30
+    limiter.allow("b")
+    clock.now += 30
+    # Expired windows are dropped, once there are too many keys.
+    limiter.allow("c")
+    assert list(limiter.windows) == ["b", "c"]
+
+
+def get_app(monkeypatch, traceback_status_classes=("5xx",), rate_limit_count=10):
+    monkeypatch.setattr(
+        exception._config,
+        "logging_exception_traceback_status_classes",
+        list(traceback_status_classes),
+    )
+    monkeypatch.setattr(
+        exception._config, "logging_exception_rate_limit_count", rate_limit_count
+    )
+    app = FastAPI()
+    token = app_registry.set(app)
+    try:
+        handler = BaseExceptionHandler()
+    finally:
+        app_registry.reset(token)
+
+    async def not_found():
+        raise NotFoundError()
+
+    async def unavailable():
+        raise HTTPException(status_code=503)
+
+    async def failing():
+        raise RuntimeError("Failed for item 42")
+
+    app.add_api_route("/not-found", not_found)
+    app.add_api_route("/unavailable", unavailable)
+    app.add_api_route("/failing", failing)
+    return app, handler
+
+
+def get_logged(caplog, app, *paths):
+    """
+    Requests the paths in order, and returns the error logs as (message, has traceback).
+    """
+
+    async def main():
+        # Starlette raises unhandled errors again, after the handler's response is sent.
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+            base_url="http://t",
+        ) as client:
+            return [await client.get(path) for path in paths]
+
+    caplog.clear()
+    with caplog.at_level(logging.ERROR, logger=exception._logger.name):
+        responses = asyncio.run(main())
+    logs = [
+        (record.getMessage(), record.exc_info is not None)
+        for record in caplog.records
+        if record.name == exception._logger.name
+    ]
+    return responses, logs
+
+
+def test_tracebacks_only_for_configured_status_classes(monkeypatch, caplog):
+    app, _ = get_app(monkeypatch)
+    responses, logs = get_logged(caplog, app, "/not-found", "/unavailable", "/failing")
+    assert [response.status_code for response in responses] == [404, 503, 500]
+    assert [has_traceback for _, has_traceback in logs] == [False, True, True]
+    assert "Failed for item 42" in logs[2][0]
+
+    app, _ = get_app(monkeypatch, traceback_status_classes=["4xx"])
+    _, logs = get_logged(caplog, app, "/not-found", "/failing")
+    assert [has_traceback for _, has_traceback in logs] == [True, False]
+
+
+def test_repeated_errors_rate_limited(monkeypatch, caplog):
+    app, handler = get_app(monkeypatch, rate_limit_count=2)
+    responses, logs = get_logged(caplog, app, *["/failing"] * 4, "/not-found")
+    # Responses are not affected, only logs.
+    assert [response.status_code for response in responses] == [500] * 4 + [404]
+    assert len(logs) == 3
+
+    # Moves the windows back, rather than the clock, which the event loop uses too.
+    for window in handler.rate_limiter.windows.values():
+        window[0] -= handler.rate_limiter.window_secs
+    _, logs = get_logged(caplog, app, "/failing")
+    assert logs[0][0].endswith("(Suppressed 2 similar errors.)")
+
+
+def test_error_bodies_cached(monkeypatch, caplog):
+    app, handler = get_app(monkeypatch)
+    responses, _ = get_logged(caplog, app, "/not-found", "/not-found")
+    assert responses[0].content == responses[1].content
+    assert responses[0].json()["errors"][0]["code"] == NotFoundError().code
+    assert len(handler.error_bodies) == 1
+
+    body = handler.get_error_body("G2P-1", "First")
+    assert handler.get_error_body("G2P-1", "First") is body
+    assert handler.get_error_body("G2P-1", "Other") is not body
+
+
+def test_error_bodies_least_recently_used_evicted(monkeypatch):
+    app, handler = get_app(monkeypatch)
+    monkeypatch.setattr(handler, "MAX_CACHED_ERROR_BODIES", 2)
+    first = handler.get_error_body("G2P-1", "First")
+    handler.get_error_body("G2P-2", "Second")
+    # A hit makes it the most recently used, so the second is evicted instead.
+    assert handler.get_error_body("G2P-1", "First") is first
+    handler.get_error_body("G2P-3", "Third")
+    assert list(handler.error_bodies) == [("G2P-1", "First"), ("G2P-3", "Third")]
@@ -0,0 +1,57 @@
+import asyncio
+import contextvars
+
+import pytest
+from openg2p_fastapi_common.context import dbsession
+from openg2p_fastapi_common.executors import (
+    ContextThreadPoolExecutor,
+    run_cpu,
+    run_sync,
+    shutdown_executors,
+)
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_thread_does_not_inherit_request_session():
+    executor = ContextThreadPoolExecutor(1)
+    token = dbsession.set("request session")
+    try:
+        assert executor.submit(dbsession.get).result() is None
+        assert dbsession.get() == "request session"
+    finally:
+        dbsession.reset(token)
+        executor.shutdown()
+
+
+def test_run_sync_propagates_contextvars():
+    def get_and_set(value):
+        current = request_id.get()
+        request_id.set(value)
+        return current
+
+    async def main():
+        request_id.set("request 1")
+        try:
+            in_thread = await run_sync(get_and_set, value="changed in thread")
+            with pytest.raises(ZeroDivisionError):
+                await run_sync(divmod, 1, 0)
+        finally:
+            await shutdown_executors()
+        return in_thread, request_id.get()
+
+    # Changes made in the thread don't leak back to the caller.
+    assert asyncio.run(main()) == ("request 1", "request 1")
+
+
+def test_run_cpu():
+    async def main():
+        try:
+            results = await asyncio.gather(*(run_cpu(pow, 2, i) for i in range(4)))
+            with pytest.raises(ValueError):
+                await run_cpu(int, "not a number")
+        finally:
+            await shutdown_executors()
+        return results
+
+    assert asyncio.run(main()) == [1, 2, 4, 8]
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+
+import httpx
+import orjson
+from fastapi import FastAPI
+from openg2p_fastapi_common import health
+from openg2p_fastapi_common.context import app_registry
+from openg2p_fastapi_common.health import HealthProber
+from openg2p_fastapi_common.ping import PingController
+
+DSN = "postgresql://user:password@db/app"
+
+
+async def check_up():
+    pass
+
+
+async def check_down():
+    raise ConnectionError(f"Could not connect to {DSN}")
+
+
+async def check_slow():
+    await asyncio.sleep(10)
+
+
+def get_prober():
+    prober = HealthProber(interval=0.01, timeout=0.05)
+    prober.register_check("db", check_up)
+    prober.register_check("cache", check_slow, critical=False)
+    return prober
+
+
+def test_probe_reports_status_without_errors(caplog):
+    prober = get_prober()
+    assert not prober.ready
+    assert orjson.loads(prober.readiness_body) == {"status": "not_ready", "checks": {}}
+
+    asyncio.run(prober.probe())
+    # Non critical checks don't fail readiness.
+    assert prober.ready
+    assert orjson.loads(prober.readiness_body) == {
+        "status": "ready",
+        "checks": {"db": "up", "cache": "down"},
+    }
+    assert prober.checks["db"].result["latency_ms"] >= 0
+
+    prober.register_check("replica", check_down)
+    with caplog.at_level(logging.DEBUG, logger=health._logger.name):
+        asyncio.run(prober.probe())
+        asyncio.run(prober.probe())
+    assert not prober.ready
+    assert orjson.loads(prober.readiness_body)["checks"]["replica"] == "down"
+    assert DSN.encode() not in prober.readiness_body
+    # Errors are logged instead, at warning level only when the check goes down.
+    down_logs = [r for r in caplog.records if "replica is down" in r.getMessage()]
+    assert [r.levelno for r in down_logs] == [logging.WARNING, logging.DEBUG]
+    assert DSN in down_logs[0].getMessage()
+    timeout_logs = [r for r in caplog.records if "cache is down" in r.getMessage()]
+    assert "Timed out after 0.05s" in timeout_logs[0].getMessage()
+
+
+def test_prober_runs_in_background(monkeypatch):
+    monkeypatch.setattr(health._config, "health_liveness_max_staleness_secs", 60)
+    prober = get_prober()
+    assert prober.is_alive()
+
+    async def main():
+        prober.start()
+        while prober.last_probed_at is None:
+            await asyncio.sleep(0.01)
+        assert prober.ready
+        assert prober.is_alive()
+        # Not alive once the rounds stop completing.
+        prober.last_probed_at -= 60
+        assert not prober.is_alive()
+        await prober.stop()
+
+    asyncio.run(main())
+    assert prober._task is None
+
+
+def get_app():
+    app = FastAPI()
+    token = app_registry.set(app)
+    try:
+        PingController().post_init()
+    finally:
+        app_registry.reset(token)
+    return app
+
+
+async def get(app, path):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://t"
+    ) as client:
+        return await client.get(path)
+
+
+def test_health_routes_without_prober():
+    app = get_app()
+    assert asyncio.run(get(app, "/ping")).json() == "pong"
+    response = asyncio.run(get(app, "/health/live"))
+    assert (response.status_code, response.json()) == (200, {"status": "alive"})
+    response = asyncio.run(get(app, "/health/ready"))
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "checks": {}}
+
+
+def test_health_routes(monkeypatch):
+    monkeypatch.setattr(health._config, "health_liveness_max_staleness_secs", 60)
+    app = get_app()
+    prober = HealthProber()
+    prober.register_check("db", check_down)
+
+    response = asyncio.run(get(app, "/health/ready"))
+    assert (response.status_code, response.json()["status"]) == (503, "not_ready")
+
+    asyncio.run(prober.probe())
+    response = asyncio.run(get(app, "/health/ready"))
+    assert response.status_code == 503
+    assert response.json() == {"status": "not_ready", "checks": {"db": "down"}}
+
+    prober.register_check("db", check_up)
+    asyncio.run(prober.probe())
+    response = asyncio.run(get(app, "/health/ready"))
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "checks": {"db": "up"}}
+
+    assert asyncio.run(get(app, "/health/live")).status_code == 200
+    # As if the prober task had stalled.
+    prober._task = object()
+    prober.last_probed_at -= 60
+    response = asyncio.run(get(app, "/health/live"))
+    assert (response.status_code, response.json()) == (503, {"status": "not_alive"})
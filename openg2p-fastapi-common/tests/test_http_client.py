@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from openg2p_fastapi_common.http_client import HttpClientManager
+
+
+def test_sync_client_created_once_across_threads(monkeypatch):
+    manager = HttpClientManager()
+    created = []
+    barrier = threading.Barrier(8)
+    client_class = httpx.Client
+
+    def create_client(**kwargs):
+        created.append(kwargs)
+        return client_class(**kwargs)
+
+    monkeypatch.setattr(httpx, "Client", create_client)
+
+    def get_client(_):
+        barrier.wait()
+        return manager.get_sync_client("upstream")
+
+    with ThreadPoolExecutor(8) as executor:
+        clients = set(executor.map(get_client, range(8)))
+    assert len(clients) == 1
+    assert len(created) == 1
+    clients.pop().close()
+
+
+def test_stats():
+    manager = HttpClientManager()
+
+    def handler(request):
+        return httpx.Response(200)
+
+    async def main():
+        client = manager.get_client("upstream")
+        assert manager.get_client("upstream") is client
+        client._transport = httpx.MockTransport(handler)
+        await client.get("http://t/")
+        await client.get("http://t/")
+        return manager.stats()
+
+    stats = asyncio.run(main())
+    # The mock transport has no connection pool.
+    assert stats == {
+        "upstream": {"requests": 2, "connections": 0, "idle_connections": 0}
+    }
@@ -0,0 +1,105 @@
+import io
+import logging
+import threading
+
+import pytest
+from openg2p_fastapi_common.log_pipeline import LogPipeline
+
+
+class BlockingHandler(logging.Handler):
+    """Collects records, blocking the writer thread until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.blocked = threading.Event()
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.blocked.set()
+        self.unblock.wait(5)
+        self.records.append(record)
+
+
+def make_record(msg, level=logging.INFO, args=None):
+    return logging.LogRecord("test", level, __file__, 0, msg, args, None)
+
+
+def start_blocked(pipeline: LogPipeline):
+    target = BlockingHandler()
+    handler = pipeline.get_handler([target], capture_correlation_id=False)
+    pipeline.start()
+    # The writer takes the first record and blocks on it, so the queue fills up.
+    handler.handle(make_record("first"))
+    assert target.blocked.wait(5)
+    return target, handler
+
+
+def test_drop_policy():
+    pipeline = LogPipeline(max_size=3, overflow_policy="drop")
+    target, handler = start_blocked(pipeline)
+    for i in range(5):
+        handler.handle(make_record(str(i)))
+    assert pipeline.dropped == 2
+    target.unblock.set()
+    pipeline.stop()
+    messages = [record.getMessage() for record in target.records]
+    assert messages == [
+        "first",
+        "0",
+        "1",
+        "2",
+        "Log queue overflow. Dropped 2 log records.",
+    ]
+
+
+def test_sample_policy_keeps_warnings():
+    pipeline = LogPipeline(max_size=4, overflow_policy="sample", sample_rate=0)
+    target, handler = start_blocked(pipeline)
+    for i in range(2):
+        handler.handle(make_record(f"info {i}"))
+    # The queue is half full, so info records are sampled out, but not warnings.
+    handler.handle(make_record("info 2"))
+    handler.handle(make_record("warning", logging.WARNING))
+    assert pipeline.dropped == 1
+    target.unblock.set()
+    pipeline.stop()
+    messages = [record.getMessage() for record in target.records]
+    assert messages[:4] == ["first", "info 0", "info 1", "warning"]
+
+
+def test_stop_flushes_and_writes_batches():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    pipeline = LogPipeline(batch_size=2)
+    handler = pipeline.get_handler([target], capture_correlation_id=False)
+    pipeline.start()
+    for i in range(5):
+        handler.handle(make_record("message %s" % i))
+    pipeline.stop()
+    # Written synchronously once stopped.
+    handler.handle(make_record("after stop", logging.WARNING))
+    assert stream.getvalue().splitlines() == [
+        *(f"INFO message {i}" for i in range(5)),
+        "WARNING after stop",
+    ]
+
+
+def test_message_args_resolved_when_logged():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    pipeline = LogPipeline()
+    handler = pipeline.get_handler([target], capture_correlation_id=False)
+    args = {"value": 1}
+    record = make_record("%(value)s", args=(args,))
+    pipeline.start()
+    handler.handle(record)
+    args["value"] = 2
+    pipeline.stop()
+    assert stream.getvalue() == "1\n"
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        LogPipeline(overflow_policy="unknown")
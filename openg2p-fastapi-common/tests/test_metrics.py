@@ -0,0 +1,124 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from openg2p_fastapi_common.context import app_registry
+from openg2p_fastapi_common.metrics import (
+    MetricsController,
+    MetricsManager,
+    MetricsMiddleware,
+)
+from openg2p_fastapi_common.supervisor import temp_multiproc_dir
+from prometheus_client import CONTENT_TYPE_LATEST
+
+
+def test_temp_multiproc_dir_removed_on_exit(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    # Only set up if prometheus_client wasn't imported yet.
+    monkeypatch.delitem(sys.modules, "prometheus_client", raising=False)
+
+    with temp_multiproc_dir() as path:
+        assert os.path.isdir(path)
+        assert os.environ["PROMETHEUS_MULTIPROC_DIR"] == path
+        with open(os.path.join(path, "counter_1.db"), "wb") as f:
+            f.write(b"0")
+    assert not os.path.exists(path)
+    assert "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+
+
+def test_temp_multiproc_dir_skipped(monkeypatch, tmp_path):
+    monkeypatch.delitem(sys.modules, "prometheus_client", raising=False)
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    with temp_multiproc_dir() as path:
+        assert path is None
+    assert os.environ["PROMETHEUS_MULTIPROC_DIR"] == str(tmp_path)
+
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+    monkeypatch.setitem(sys.modules, "prometheus_client", object())
+    with temp_multiproc_dir() as path:
+        # Too late, as prometheus_client has already picked the single process mode.
+        assert path is None
+    assert "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+
+
+def get_app():
+    metrics = MetricsManager(namespace="test")
+    app = FastAPI()
+    token = app_registry.set(app)
+    try:
+        MetricsController().post_init()
+    finally:
+        app_registry.reset(token)
+
+    async def get_item(item_id: int):
+        if item_id < 0:
+            raise HTTPException(status_code=400)
+        return {"id": item_id}
+
+    app.add_api_route("/items/{item_id}", get_item)
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+    return app, metrics
+
+
+async def get_all(app, *paths):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://t"
+    ) as client:
+        return [await client.get(path) for path in paths]
+
+
+def test_metrics_labelled_by_route(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    app, metrics = get_app()
+    responses = asyncio.run(get_all(app, "/items/1", "/items/22", "/items/-1", "/nope"))
+
+    def get_sample(name, **labels):
+        return metrics.registry.get_sample_value(f"test_{name}", labels)
+
+    item = {"method": "GET", "route": "/items/{item_id}"}
+    assert get_sample("http_requests_total", **item, status="200") == 2
+    assert get_sample("http_requests_total", **item, status="400") == 1
+    assert get_sample("http_request_duration_seconds_count", **item) == 3
+    assert get_sample("http_response_size_bytes_sum", **item) == sum(
+        len(response.content) for response in responses[:3]
+    )
+    assert (
+        get_sample("http_requests_total", method="GET", route="unmatched", status="404")
+        == 1
+    )
+    # Raw paths are never used as labels.
+    assert get_sample("http_requests_total", **{**item, "route": "/items/1"}) is None
+    assert get_sample("http_requests_in_progress", method="GET") == 0
+
+    (response,) = asyncio.run(get_all(app, "/metrics"))
+    assert response.headers["content-type"] == CONTENT_TYPE_LATEST
+    assert (
+        'test_http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2.0'
+        in response.text
+    )
+
+
+def test_get_or_create_metrics():
+    metrics = MetricsManager(namespace="test")
+    counter = metrics.counter("jobs", "Jobs.", ["kind"])
+    assert metrics.counter("jobs", "Jobs.", ["kind"]) is counter
+    with pytest.raises(ValueError):
+        metrics.gauge("jobs", "Jobs.")
+    counter.labels("a").inc(3)
+    assert metrics.registry.get_sample_value("test_jobs_total", {"kind": "a"}) == 3
+
+
+def test_clear_multiprocess_dir(monkeypatch, tmp_path):
+    metrics = MetricsManager(namespace="test")
+    (tmp_path / "counter_1.db").write_bytes(b"0")
+    (tmp_path / "other.txt").write_bytes(b"0")
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    metrics.clear_multiprocess_dir()
+    assert (tmp_path / "counter_1.db").exists()
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    metrics.clear_multiprocess_dir()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["other.txt"]
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from openg2p_fastapi_common import migrations as migrations_module
+from openg2p_fastapi_common.db import InstrumentedNullPool, create_db_engine
+from openg2p_fastapi_common.migrations import (
+    BaseMigration,
+    MigrationContext,
+    MigrationRunner,
+    get_registered_migrations,
+    get_version_key,
+)
+from sqlalchemy import create_engine, text
+
+applied = []
+
+
+class Migration(BaseMigration):
+    async def upgrade(self, ctx: MigrationContext):
+        applied.append(self.version)
+        await ctx.execute(f"CREATE TABLE t_{self.version} (id INTEGER)")
+
+
+def create_migrations(*versions):
+    migrations = []
+    for version in versions:
+        migration_class = type(f"Migration{version}", (Migration,), {})
+        migration_class.version = version
+        migration_class.description = f"Migration {version}"
+        migrations.append(migration_class())
+    return migrations
+
+
+@pytest.fixture
+def datasource(tmp_path):
+    applied.clear()
+    return f"sqlite+aiosqlite:///{tmp_path}/test.db"
+
+
+def get_recorded_versions(datasource):
+    engine = create_engine(datasource.replace("+aiosqlite", ""))
+    with engine.connect() as conn:
+        versions = [
+            row[0]
+            for row in conn.execute(
+                text("SELECT version FROM schema_migrations ORDER BY applied_at")
+            )
+        ]
+    engine.dispose()
+    return versions
+
+
+def test_version_key_is_numeric():
+    assert sorted(["10", "9", "100"], key=get_version_key) == ["9", "10", "100"]
+    assert get_version_key("1.9") < get_version_key("1.10")
+    assert get_version_key("2024_01_9") < get_version_key("2024_01_10")
+
+
+def test_migrations_applied_in_version_order_once(datasource):
+    migrations = create_migrations("10", "9", "2")
+    pending = asyncio.run(MigrationRunner(datasource, migrations).run())
+    assert [m.version for m in pending] == ["2", "9", "10"]
+    assert applied == ["2", "9", "10"]
+    assert get_recorded_versions(datasource) == ["2", "9", "10"]
+
+    applied.clear()
+    migrations += create_migrations("11")
+    pending = asyncio.run(MigrationRunner(datasource, migrations).run())
+    assert [m.version for m in pending] == ["11"]
+    assert applied == ["11"]
+
+
+def test_migrations_use_unpooled_app_engine(datasource, monkeypatch):
+    engines = []
+
+    def create_recorded_engine(datasource, **kwargs):
+        engine = create_db_engine(datasource, **kwargs)
+        engines.append((kwargs, engine))
+        return engine
+
+    monkeypatch.setattr(migrations_module, "create_db_engine", create_recorded_engine)
+    asyncio.run(MigrationRunner(datasource, create_migrations("1")).run())
+    ((kwargs, engine),) = engines
+    assert kwargs == {"pooled": False}
+    assert isinstance(engine.pool, InstrumentedNullPool)
+
+
+def test_migrations_up_to_target(datasource):
+    migrations = create_migrations("1", "2", "10")
+    pending = asyncio.run(MigrationRunner(datasource, migrations, target="9").run())
+    assert [m.version for m in pending] == ["1", "2"]
+    assert get_recorded_versions(datasource) == ["1", "2"]
+
+
+def test_dry_run_changes_nothing(datasource):
+    migrations = create_migrations("1", "2")
+    runner = MigrationRunner(datasource, migrations, dry_run=True)
+    pending = asyncio.run(runner.run())
+    assert [m.version for m in pending] == ["1", "2"]
+    # The plan is built by running upgrade, without executing the statements.
+    assert applied == ["1", "2"]
+    engine = create_engine(datasource.replace("+aiosqlite", ""))
+    with engine.connect() as conn:
+        tables = conn.execute(text("SELECT name FROM sqlite_master")).all()
+    engine.dispose()
+    assert tables == []
+
+
+def test_duplicate_versions_rejected(datasource):
+    with pytest.raises(ValueError):
+        MigrationRunner(datasource, create_migrations("1", "1"))
+
+
+def test_non_transactional_operations_rejected_in_transaction():
+    ctx = MigrationContext(None, transactional=True, dry_run=True)
+    with pytest.raises(ValueError):
+        asyncio.run(ctx.create_index_concurrently("ix", "t", ["id"]))
+
+
+def test_registered_migrations():
+    migrations = create_migrations("1")
+    assert get_registered_migrations() == migrations
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+from openg2p_fastapi_common.context import dbengine, dbsession
+from openg2p_fastapi_common.db import create_db_engine, get_db_session_manager
+from openg2p_fastapi_common.models import BaseORMModelWithId, BaseORMModelWithTimes
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class CachedItem(BaseORMModelWithId):
+    __tablename__ = "test_cached_items"
+    __cache_ttl__ = 60
+
+    name: Mapped[str] = mapped_column()
+
+
+class TimedItem(BaseORMModelWithTimes):
+    __tablename__ = "test_timed_items"
+
+    name: Mapped[str] = mapped_column()
+    count: Mapped[int] = mapped_column(default=0)
+
+
+@pytest.fixture
+def run_db(tmp_path):
+    def run(test):
+        async def main():
+            engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+            dbengine.set(engine)
+            async with engine.begin() as conn:
+                await conn.run_sync(CachedItem.__table__.create)
+                await conn.run_sync(TimedItem.__table__.create)
+            try:
+                return await test()
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    yield run
+    CachedItem.invalidate_cache()
+
+
+async def read_outside_request(coro_fn):
+    # Like a concurrent request, that doesn't see the request session.
+    async def read():
+        dbsession.set(None)
+        return await coro_fn()
+
+    return await asyncio.create_task(read())
+
+
+def test_get_by_id_is_cached(run_db):
+    async def test():
+        await CachedItem.bulk_insert([{"id": 1, "active": True, "name": "a"}])
+        first = await CachedItem.get_by_id(1)
+        assert (await CachedItem.get_by_id(1)) is first
+        assert [item.name for item in await CachedItem.get_all()] == ["a"]
+        return CachedItem.get_cache_stats()
+
+    stats = run_db(test)
+    assert stats["hits"] == 1
+    assert stats["size"] == 2
+
+
+def test_cache_invalidated_on_commit_not_flush(run_db):
+    async def test():
+        await CachedItem.bulk_insert([{"id": 1, "active": True, "name": "a"}])
+        async with get_db_session_manager().request_session() as session:
+            item = await session.get(CachedItem, 1)
+            item.name = "b"
+            await session.flush()
+            # A read between the flush and the commit caches the committed row.
+            stale = await read_outside_request(lambda: CachedItem.get_by_id(1))
+            assert stale.name == "a"
+        return await CachedItem.get_by_id(1)
+
+    assert run_db(test).name == "b"
+
+
+def test_cache_kept_on_rollback(run_db):
+    async def test():
+        await CachedItem.bulk_insert([{"id": 1, "active": True, "name": "a"}])
+        cached = await CachedItem.get_by_id(1)
+        with pytest.raises(RuntimeError):
+            async with get_db_session_manager().request_session() as session:
+                item = await session.get(CachedItem, 1)
+                item.name = "b"
+                await session.flush()
+                raise RuntimeError()
+        assert "invalidate_model_caches" not in session.info
+        return cached, await CachedItem.get_by_id(1)
+
+    cached, item = run_db(test)
+    assert item is cached
+    assert item.name == "a"
+
+
+def test_bulk_writes_invalidate_on_commit(run_db):
+    async def test():
+        await CachedItem.bulk_insert([{"id": 1, "active": True, "name": "a"}])
+        assert len(await CachedItem.get_all()) == 1
+        async with get_db_session_manager().request_session():
+            await CachedItem.bulk_upsert([{"id": 2, "active": True, "name": "b"}])
+            # Not committed yet, so still cached.
+            assert len(CachedItem.get_cache()) == 1
+        return await CachedItem.get_all()
+
+    assert [item.name for item in run_db(test)] == ["a", "b"]
+
+
+def test_bulk_insert_and_get_by_ids(run_db):
+    async def test():
+        inserted = await TimedItem.bulk_insert(
+            [{"id": i, "active": i != 3, "name": str(i)} for i in range(1, 6)],
+            chunk_size=2,
+        )
+        items = await TimedItem.bulk_get_by_ids([5, 1, 3, 1, 9], chunk_size=2)
+        return inserted, items
+
+    inserted, items = run_db(test)
+    assert inserted == 5
+    assert [item.id for item in items] == [1, 5]
+    assert all(item.created_at == item.updated_at for item in items)
+
+
+def test_bulk_upsert(run_db):
+    async def test():
+        await TimedItem.bulk_insert(
+            [{"id": 1, "active": True, "name": "a", "count": 1}]
+        )
+        created_at = (await TimedItem.get_by_id(1)).created_at
+        upserted = await TimedItem.bulk_upsert(
+            [
+                {"id": 1, "active": True, "name": "b"},
+                {"id": 2, "active": True, "name": "c"},
+            ],
+            chunk_size=1,
+        )
+        await TimedItem.bulk_upsert(
+            [{"id": 2, "active": True, "name": "d"}], update_columns=[]
+        )
+        return upserted, created_at, await TimedItem.get_all()
+
+    upserted, created_at, items = run_db(test)
+    assert upserted == 2
+    assert [(item.id, item.name, item.count) for item in items] == [
+        (1, "b", 1),
+        (2, "c", 0),
+    ]
+    # created_at is preserved, updated_at is set on update.
+    assert items[0].created_at == created_at
+    assert items[0].updated_at > created_at
+
+
+def test_bulk_upsert_empty(run_db):
+    async def test():
+        return await TimedItem.bulk_upsert([])
+
+    assert run_db(test) == 0
+
+
+def test_get_page_keyset_pagination(run_db):
+    async def test():
+        await TimedItem.bulk_insert(
+            [{"id": i, "active": i % 4 != 0, "name": str(i)} for i in range(1, 11)]
+        )
+        pages = []
+        after_id = None
+        while True:
+            rows, after_id = await TimedItem.get_page(after_id=after_id, limit=3)
+            pages.append([row.id for row in rows])
+            if after_id is None:
+                break
+        inactive, cursor = await TimedItem.get_page(active=False)
+        return pages, [row.id for row in inactive], cursor
+
+    pages, inactive, cursor = run_db(test)
+    assert pages == [[1, 2, 3], [5, 6, 7], [9, 10]]
+    assert inactive == [4, 8]
+    assert cursor is None
+
+
+def test_get_page_exact_multiple_of_limit(run_db):
+    async def test():
+        await TimedItem.bulk_insert(
+            [{"id": i, "active": True, "name": str(i)} for i in range(1, 5)]
+        )
+        first, after_id = await TimedItem.get_page(limit=2)
+        second, last_cursor = await TimedItem.get_page(after_id=after_id, limit=2)
+        return after_id, [row.id for row in second], last_cursor
+
+    assert run_db(test) == (2, [3, 4], None)
+
+
+def test_iter_all(run_db):
+    async def test():
+        await TimedItem.bulk_insert(
+            [{"id": i, "active": True, "name": str(i)} for i in range(1, 8)]
+        )
+        return [row.id async for row in TimedItem.iter_all(page_size=3)]
+
+    assert run_db(test) == list(range(1, 8))
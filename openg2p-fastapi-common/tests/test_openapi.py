@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from openg2p_fastapi_common.config import Settings
+from pydantic import ValidationError
+
+# Run in a new interpreter, as the Initializer can only set up logging once per process.
+# The server itself is replaced, to see what the run command built before starting it.
+OPENAPI_CODE = """
+import asyncio
+import json
+import sys
+
+import httpx
+import uvicorn
+
+sys.argv = ["main", *sys.argv[1:]]
+from openg2p_fastapi_common.context import app_registry
+from openg2p_fastapi_common.ping import Initializer, PingInitializer
+
+result = {"built_before_run": None}
+
+
+def run(app, **kwargs):
+    result["built_before_run"] = list(app.state.openapi_json)
+
+
+uvicorn.run = run
+main_init = Initializer()
+PingInitializer()
+main_init.main()
+app = app_registry.get()
+
+
+async def get(path):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://t"
+    ) as client:
+        response = await client.get(path)
+        return response.status_code, response.text
+
+
+result["built_before_request"] = list(app.state.openapi_json)
+result["openapi"] = asyncio.run(get("/openapi.json"))
+result["built_after_request"] = list(app.state.openapi_json)
+result["docs_status"] = asyncio.run(get("/docs"))[0]
+print(json.dumps(result))
+"""
+
+
+def run_app(mode, *argv, openapi_file=None) -> dict:
+    env = {**os.environ, "COMMON_OPENAPI_MODE": mode, "COMMON_METRICS_ENABLED": "0"}
+    if openapi_file:
+        env["COMMON_OPENAPI_FILE"] = str(openapi_file)
+    result = subprocess.run(
+        [sys.executable, "-c", OPENAPI_CODE, *argv],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    # Logs are written to stdout too, before the result.
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_lazy_mode_builds_on_first_request():
+    result = run_app("lazy", "run")
+    assert result["built_before_run"] == []
+    assert result["built_before_request"] == []
+    status, body = result["openapi"]
+    assert status == 200
+    assert "/ping" in json.loads(body)["paths"]
+    assert result["built_after_request"] == [""]
+    assert result["docs_status"] == 200
+
+
+def test_eager_mode_builds_before_server_starts():
+    result = run_app("eager", "run")
+    assert result["built_before_run"] == [""]
+    status, body = result["openapi"]
+    assert status == 200
+    assert "/ping" in json.loads(body)["paths"]
+
+
+def test_file_mode_serves_file(tmp_path):
+    openapi_file = tmp_path / "openapi.json"
+    run_app("lazy", "getOpenAPI", str(openapi_file))
+    schema = json.loads(openapi_file.read_bytes())
+    schema["info"]["title"] = "From file"
+    openapi_file.write_text(json.dumps(schema))
+
+    result = run_app(
+        "file", "getOpenAPI", str(tmp_path / "out.json"), openapi_file=openapi_file
+    )
+    assert result["built_before_request"] == [""]
+    status, body = result["openapi"]
+    assert status == 200
+    assert json.loads(body) == schema
+
+
+def test_disabled_mode_removes_routes(tmp_path):
+    result = run_app("disabled", "getOpenAPI", str(tmp_path / "out.json"))
+    assert result["openapi"][0] == 404
+    assert result["docs_status"] == 404
+    assert result["built_after_request"] == []
+
+
+def test_invalid_mode_rejected():
+    with pytest.raises(ValidationError, match="Invalid openapi_mode"):
+        Settings(openapi_mode="sometimes")
+    with pytest.raises(ValidationError, match="openapi_file must be set"):
+        Settings(openapi_mode="file")
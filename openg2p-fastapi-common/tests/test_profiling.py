@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from openg2p_fastapi_common import profiling
+from openg2p_fastapi_common.context import app_registry
+from openg2p_fastapi_common.exception import BaseExceptionHandler
+from openg2p_fastapi_common.profiling import (
+    ProfilingController,
+    ProfilingMiddleware,
+    RequestProfiler,
+)
+from starlette.middleware import Middleware
+
+SECRET = "s3crét"
+SECRET_HEADER = {"X-Profile": SECRET.encode()}
+
+
+@pytest.fixture(autouse=True)
+def profiling_config(monkeypatch):
+    monkeypatch.setattr(profiling._config, "profiling_secret", SECRET)
+    monkeypatch.setattr(profiling._config, "profiling_sample_fraction", 0)
+    monkeypatch.setattr(profiling._config, "profiling_slow_threshold_ms", 1000)
+
+
+def get_app():
+    app = FastAPI()
+    token = app_registry.set(app)
+    try:
+        BaseExceptionHandler()
+        profiler = RequestProfiler(interval_ms=1)
+        ProfilingController().post_init()
+    finally:
+        app_registry.reset(token)
+
+    async def work():
+        # Busy for a while, so that the sampler catches this frame.
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+        await asyncio.sleep(0.01)
+        return "done"
+
+    app.add_api_route("/work", work)
+    app.add_api_route("/admin/profiles-export", work)
+    app.user_middleware.append(Middleware(ProfilingMiddleware, profiler=profiler))
+    return app, profiler
+
+
+async def get(app, path, headers=None, params=None):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://t"
+    ) as client:
+        return await client.get(path, headers=headers, params=params)
+
+
+def test_profiles_requests_with_secret():
+    app, profiler = get_app()
+    asyncio.run(get(app, "/work", headers=SECRET_HEADER))
+    asyncio.run(get(app, "/work", params={"profile": SECRET}))
+
+    assert len(profiler.reports) == 2
+    profile = profiler.reports[0]
+    assert (profile.method, profile.path) == ("GET", "/work")
+    assert profile.samples > 0
+    assert "work (test_profiling.py:" in profile.to_folded()
+    assert profiler.active == []
+
+    # Unquoted secrets are compared as the raw bytes sent too.
+    middleware = ProfilingMiddleware(app, profiler)
+    scope = {"headers": [], "query_string": b"profile=" + SECRET.encode()}
+    assert middleware.is_requested(scope)
+
+
+def test_ignores_wrong_secret():
+    app, profiler = get_app()
+    asyncio.run(get(app, "/work", headers={"X-Profile": "wrong"}))
+    asyncio.run(get(app, "/work", params={"profile": "wrong"}))
+    # Same chars as the secret, but not in the encoding of the secret.
+    asyncio.run(get(app, "/work?profile=s3cr%E9t"))
+    assert len(profiler.reports) == 0
+
+
+def test_profiles_paths_next_to_the_admin_path():
+    app, profiler = get_app()
+    asyncio.run(get(app, "/admin/profiles-export", headers=SECRET_HEADER))
+    assert [profile.path for profile in profiler.reports] == ["/admin/profiles-export"]
+
+    middleware = ProfilingMiddleware(app, profiler)
+    assert middleware.is_admin_path("/admin/profiles")
+    assert middleware.is_admin_path("/admin/profiles/abc")
+    assert not middleware.is_admin_path("/admin/profiles-export")
+    assert not middleware.is_admin_path("/api/admin/profiles")
+
+
+def test_admin_routes_require_secret():
+    app, profiler = get_app()
+    asyncio.run(get(app, "/work", headers=SECRET_HEADER))
+    profile_id = profiler.reports[0].id
+
+    assert asyncio.run(get(app, "/admin/profiles")).status_code == 401
+    response = asyncio.run(get(app, "/admin/profiles", headers={"X-Profile": "wrong"}))
+    assert response.status_code == 401
+    response = asyncio.run(get(app, f"/admin/profiles/{profile_id}"))
+    assert response.status_code == 401
+
+    response = asyncio.run(get(app, "/admin/profiles", headers=SECRET_HEADER))
+    assert [profile["id"] for profile in response.json()] == [profile_id]
+    response = asyncio.run(
+        get(app, f"/admin/profiles/{profile_id}", headers=SECRET_HEADER)
+    )
+    assert response.text == profiler.reports[0].to_folded()
+    response = asyncio.run(get(app, "/admin/profiles/missing", headers=SECRET_HEADER))
+    assert response.status_code == 404
+    # Admin requests are never profiled themselves.
+    assert len(profiler.reports) == 1
+
+
+def test_sampled_requests_kept_only_if_slow(monkeypatch):
+    monkeypatch.setattr(profiling._config, "profiling_sample_fraction", 1)
+    app, profiler = get_app()
+    asyncio.run(get(app, "/work"))
+    assert len(profiler.reports) == 0
+
+    monkeypatch.setattr(profiling._config, "profiling_slow_threshold_ms", 10)
+    app, profiler = get_app()
+    asyncio.run(get(app, "/work"))
+    assert len(profiler.reports) == 1
+    assert profiler.active == []
+
+    # The sampler thread stops once no request is being profiled.
+    deadline = time.monotonic() + 5
+    while profiler._thread is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert profiler._thread is None
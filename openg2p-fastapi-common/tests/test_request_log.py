@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import random
+
+import httpx
+import json_logging
+import pytest
+from fastapi import FastAPI, Response
+from json_logging.framework.fastapi import FastAPIRequestAdapter, FastAPIResponseAdapter
+from json_logging.util import RequestUtil
+from openg2p_fastapi_common import request_log
+from openg2p_fastapi_common.request_log import (
+    RequestLogPolicy,
+    SampledRequestLogMiddleware,
+)
+
+
+@pytest.fixture(autouse=True)
+def request_log_config(monkeypatch):
+    # As set up by json_logging.init_fastapi, which can only be called once per process.
+    request_util = RequestUtil(
+        request_adapter_class=FastAPIRequestAdapter,
+        response_adapter_class=FastAPIResponseAdapter,
+    )
+    monkeypatch.setattr(json_logging, "_request_util", request_util)
+    config = request_log._config
+    monkeypatch.setattr(
+        config, "logging_request_sample_rates", {"/skip": 0, "/half": 0.5}
+    )
+    monkeypatch.setattr(config, "logging_request_levels", {"/quiet.*": "DEBUG"})
+    monkeypatch.setattr(config, "logging_request_default_level", "INFO")
+    monkeypatch.setattr(config, "logging_request_always_log_status", 500)
+    monkeypatch.setattr(config, "logging_request_slow_threshold_ms", 30)
+
+
+def get_app():
+    async def endpoint(status: int = 200, sleep: float = 0):
+        await asyncio.sleep(sleep)
+        return Response(status_code=status)
+
+    app = FastAPI()
+    for path in ["/ok", "/skip", "/half", "/quiet", "/quiet/more", "/excluded"]:
+        app.add_api_route(path, endpoint)
+    app.add_middleware(SampledRequestLogMiddleware, exclude_url_patterns=["/excluded"])
+    return app
+
+
+def get_logged(caplog, *paths):
+    """
+    Requests the paths in order, and returns the (path, level) of the logged requests.
+    """
+
+    async def main():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=get_app()), base_url="http://t"
+        ) as client:
+            for path in paths:
+                await client.get(path)
+
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG, logger="fastapi-request-logger"):
+        asyncio.run(main())
+    return [
+        (record.request_info.request.url.path, record.levelname)
+        for record in caplog.records
+        if record.name == "fastapi-request-logger"
+    ]
+
+
+def test_logs_requests_at_path_levels(caplog):
+    assert get_logged(caplog, "/ok", "/quiet", "/quiet/more", "/excluded") == [
+        ("/ok", "INFO"),
+        ("/quiet", "DEBUG"),
+        ("/quiet/more", "DEBUG"),
+    ]
+
+
+def test_always_logs_errors_and_slow_requests(caplog):
+    assert get_logged(
+        caplog, "/skip", "/skip?status=404", "/skip?status=503", "/skip?sleep=0.05"
+    ) == [("/skip", "ERROR"), ("/skip", "WARNING")]
+    # Raised to the level of the outcome, never lowered.
+    assert get_logged(caplog, "/quiet?status=500", "/quiet?sleep=0.05") == [
+        ("/quiet", "ERROR"),
+        ("/quiet", "WARNING"),
+    ]
+
+
+def test_samples_requests(caplog, monkeypatch):
+    samples = iter([0.4, 0.6, 0.1])
+    monkeypatch.setattr(request_log.random, "random", lambda: next(samples))
+    assert get_logged(caplog, "/half", "/half", "/half") == [
+        ("/half", "INFO"),
+        ("/half", "INFO"),
+    ]
+
+
+def test_policy_sample_rate():
+    policy = RequestLogPolicy(sample_rates={"/half": 0.5, "/tenth": 0.1})
+    random.seed(0)
+    logged = sum(
+        policy.get_log_level("/half", 200, 0) is not None for _ in range(10000)
+    )
+    assert 4700 < logged < 5300
+    logged = sum(
+        policy.get_log_level("/tenth", 200, 0) is not None for _ in range(10000)
+    )
+    assert 800 < logged < 1200
+    assert policy.get_log_level("/other", 200, 0) == logging.INFO
+
+
+def test_policy_path_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(RequestLogPolicy, "MAX_CACHED_PATHS", 2)
+    policy = RequestLogPolicy(levels={"/items/.*": "WARNING"})
+    for i in range(5):
+        assert policy.get_log_level(f"/items/{i}", 200, 0) == logging.WARNING
+    assert list(policy._path_cache) == ["/items/0", "/items/1"]
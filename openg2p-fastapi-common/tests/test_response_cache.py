@@ -0,0 +1,154 @@
+import asyncio
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from openg2p_fastapi_common.response_cache import (
+    CachedAPIRoute,
+    cached_response,
+    get_response_cache,
+)
+
+VALID_TOKENS = {"Bearer a", "Bearer b"}
+
+
+def get_app():
+    calls = {"items": 0, "profile": 0, "sync": 0}
+
+    def authenticate(request: Request):
+        if request.headers.get("authorization") not in VALID_TOKENS:
+            raise HTTPException(status_code=401)
+
+    @cached_response(ttl=60)
+    async def items(page: int = 1):
+        calls["items"] += 1
+        return {"page": page, "calls": calls["items"]}
+
+    @cached_response(ttl=60, vary_auth=True)
+    async def profile(request: Request):
+        calls["profile"] += 1
+        return {"token": request.headers["authorization"]}
+
+    @cached_response(ttl=60)
+    def sync_items():
+        calls["sync"] += 1
+        return {"calls": calls["sync"]}
+
+    router = APIRouter(route_class=CachedAPIRoute)
+    router.add_api_route("/items", items, methods=["GET"])
+    router.add_api_route(
+        "/protected", items, methods=["GET"], dependencies=[Depends(authenticate)]
+    )
+    router.add_api_route(
+        "/profile", profile, methods=["GET"], dependencies=[Depends(authenticate)]
+    )
+    router.add_api_route("/sync", sync_items, methods=["GET"])
+    router.add_api_route("/items", items, methods=["POST"])
+    app = FastAPI()
+    app.include_router(router)
+    return app, calls
+
+
+async def request(app, method, path, headers=None):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://t"
+    ) as client:
+        return await client.request(method, path, headers=headers)
+
+
+def test_cache_hit_skips_endpoint():
+    app, calls = get_app()
+
+    async def main():
+        first = await request(app, "GET", "/items?page=2")
+        second = await request(app, "GET", "/items?page=2")
+        other = await request(app, "GET", "/items?page=3")
+        return first, second, other
+
+    first, second, other = asyncio.run(main())
+    assert first.json() == second.json() == {"page": 2, "calls": 1}
+    assert other.json() == {"page": 3, "calls": 2}
+    assert calls["items"] == 2
+    assert first.headers["etag"] == second.headers["etag"]
+    assert get_response_cache().stats()["hits"] == 1
+
+
+def test_sync_endpoint_cached():
+    app, calls = get_app()
+
+    async def main():
+        return [await request(app, "GET", "/sync") for _ in range(2)]
+
+    responses = asyncio.run(main())
+    assert [r.json() for r in responses] == [{"calls": 1}, {"calls": 1}]
+    assert calls["sync"] == 1
+
+
+def test_etag_not_modified():
+    app, _ = get_app()
+
+    async def main():
+        first = await request(app, "GET", "/items")
+        etag = first.headers["etag"]
+        matching = await request(app, "GET", "/items", {"If-None-Match": etag})
+        stale = await request(app, "GET", "/items", {"If-None-Match": '"stale"'})
+        return etag, matching, stale
+
+    etag, matching, stale = asyncio.run(main())
+    assert matching.status_code == 304
+    assert matching.content == b""
+    assert matching.headers["etag"] == etag
+    assert stale.status_code == 200
+    assert stale.json()["calls"] == 1
+
+
+def test_dependencies_run_on_cache_hit():
+    app, calls = get_app()
+
+    async def main():
+        authorized = await request(
+            app, "GET", "/protected", {"Authorization": "Bearer a"}
+        )
+        unauthenticated = await request(app, "GET", "/protected")
+        revoked = await request(app, "GET", "/protected", {"Authorization": "Bearer x"})
+        return authorized, unauthenticated, revoked
+
+    authorized, unauthenticated, revoked = asyncio.run(main())
+    assert authorized.status_code == 200
+    assert unauthenticated.status_code == 401
+    assert revoked.status_code == 401
+    assert calls["items"] == 1
+
+
+def test_vary_auth():
+    app, calls = get_app()
+
+    async def main():
+        a = await request(app, "GET", "/profile", {"Authorization": "Bearer a"})
+        b = await request(app, "GET", "/profile", {"Authorization": "Bearer b"})
+        a_again = await request(app, "GET", "/profile", {"Authorization": "Bearer a"})
+        VALID_TOKENS.discard("Bearer a")
+        try:
+            revoked = await request(
+                app, "GET", "/profile", {"Authorization": "Bearer a"}
+            )
+        finally:
+            VALID_TOKENS.add("Bearer a")
+        return a, b, a_again, revoked
+
+    a, b, a_again, revoked = asyncio.run(main())
+    assert a.json() == a_again.json() == {"token": "Bearer a"}
+    assert b.json() == {"token": "Bearer b"}
+    assert a.headers["vary"] == "Authorization, Cookie"
+    assert revoked.status_code == 401
+    assert calls["profile"] == 2
+
+
+def test_only_get_cached():
+    app, calls = get_app()
+
+    async def main():
+        for _ in range(2):
+            await request(app, "POST", "/items")
+
+    asyncio.run(main())
+    assert calls["items"] == 2
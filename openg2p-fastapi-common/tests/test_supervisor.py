@@ -0,0 +1,78 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+# Run in a new interpreter, as the supervisor installs signal handlers and forks.
+SUPERVISOR_CODE = """
+import gc
+import os
+import sys
+
+import uvicorn
+from openg2p_fastapi_common.supervisor import WorkerSupervisor
+
+events = sys.argv[1]
+
+
+def record(*values):
+    with open(events, "a") as f:
+        f.write(" ".join(str(value) for value in values) + "\\n")
+
+
+async def app(scope, receive, send):
+    pass
+
+
+WorkerSupervisor(
+    uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="error"),
+    2,
+    post_fork=lambda: record("started", os.getpid(), gc.get_freeze_count()),
+    on_worker_exit=lambda pid: record("exited", pid),
+    restart_delay=0,
+).run()
+record("stopped", os.getpid())
+"""
+
+
+def read_events(path, name):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.split()[1:] for line in f if line.split()[0] == name]
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError()
+        time.sleep(0.05)
+
+
+def test_restarts_dead_workers_and_shuts_down(tmp_path):
+    events = str(tmp_path / "events")
+    supervisor = subprocess.Popen([sys.executable, "-c", SUPERVISOR_CODE, events])
+    try:
+        wait_for(lambda: len(read_events(events, "started")) == 2)
+        started = read_events(events, "started")
+        # Objects allocated before forking are frozen out of the workers' gc.
+        assert all(int(freeze_count) > 0 for _, freeze_count in started)
+
+        dead_pid = int(started[0][0])
+        os.kill(dead_pid, signal.SIGKILL)
+        wait_for(lambda: len(read_events(events, "started")) == 3)
+        assert read_events(events, "exited") == [[str(dead_pid)]]
+
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(timeout=20) == 0
+    finally:
+        if supervisor.poll() is None:
+            supervisor.kill()
+            supervisor.wait()
+
+    worker_pids = {pid for pid, _ in read_events(events, "started")}
+    # All workers exited and were reaped, before the supervisor stopped.
+    assert {pid for pid, in read_events(events, "exited")} == worker_pids
+    assert read_events(events, "stopped") == [[str(supervisor.pid)]]
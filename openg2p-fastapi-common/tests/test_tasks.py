@@ -0,0 +1,125 @@
+import asyncio
+import gc
+import warnings
+
+import pytest
+from openg2p_fastapi_common.context import dbsession
+from openg2p_fastapi_common.metrics import MetricsManager
+from openg2p_fastapi_common.tasks import TaskGroup, TaskGroupMetrics, TaskRejected
+
+
+def get_group(limit=1, queue_size=1):
+    metrics = MetricsManager(namespace="test")
+    return TaskGroup("g", limit, queue_size, TaskGroupMetrics(metrics)), metrics
+
+
+def get_sample(metrics, name, **labels):
+    return metrics.registry.get_sample_value(f"test_{name}", {"group": "g", **labels})
+
+
+def test_concurrency_limit_and_queue():
+    group, metrics = get_group(limit=2, queue_size=1)
+
+    async def main():
+        release = asyncio.Event()
+        running = []
+
+        async def work(i):
+            running.append(i)
+            await release.wait()
+
+        tasks = [group.submit(work(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        state = (list(running), group.running, group.pending)
+        pending_gauge = get_sample(metrics, "background_tasks_pending")
+        release.set()
+        await asyncio.gather(*tasks)
+        return state, pending_gauge
+
+    (running, running_count, pending), pending_gauge = asyncio.run(main())
+    assert running == [0, 1]
+    assert (running_count, pending) == (2, 1)
+    assert pending_gauge == 1
+    assert group.stats()["completed"] == 3
+    assert get_sample(metrics, "background_tasks_pending") == 0
+    assert get_sample(metrics, "background_tasks_running") == 0
+
+
+def test_rejected_when_queue_full():
+    group, metrics = get_group(limit=1, queue_size=1)
+
+    async def main():
+        release = asyncio.Event()
+        tasks = [group.submit(release.wait()) for _ in range(2)]
+        rejected = release.wait()
+        with pytest.raises(TaskRejected):
+            group.submit(rejected)
+        # The rejected coroutine is closed, not left to warn it was never awaited.
+        assert rejected.cr_frame is None
+        release.set()
+        await asyncio.gather(*tasks)
+        # Slots are freed once tasks finish.
+        await group.submit(asyncio.sleep(0))
+
+    asyncio.run(main())
+    assert group.rejected == 1
+    assert group.completed == 3
+    assert get_sample(metrics, "background_tasks_total", status="rejected") == 1
+
+
+def test_failed_task_counted():
+    group, metrics = get_group()
+
+    async def fail():
+        raise ValueError()
+
+    async def main():
+        await group.submit(fail())
+
+    asyncio.run(main())
+    assert group.failed == 1
+    assert get_sample(metrics, "background_tasks_total", status="failed") == 1
+
+
+@pytest.mark.parametrize("yield_first", [False, True])
+def test_cancelled_while_pending(yield_first):
+    """
+    Cancelled before _run started (yield_first False), or while waiting for its turn.
+    """
+    group, metrics = get_group(limit=1, queue_size=1)
+
+    async def main():
+        release = asyncio.Event()
+        first = group.submit(release.wait())
+        queued = release.wait()
+        second = group.submit(queued)
+        if yield_first:
+            await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        assert queued.cr_frame is None
+        release.set()
+        await first
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        asyncio.run(main())
+        gc.collect()
+    assert (group.completed, group.cancelled) == (1, 1)
+    assert not group.tasks and not group.started_tasks
+    assert get_sample(metrics, "background_tasks_pending") == 0
+    assert get_sample(metrics, "background_tasks_total", status="cancelled") == 1
+
+
+def test_task_does_not_inherit_request_session():
+    group, _ = get_group()
+
+    async def main():
+        dbsession.set("request session")
+
+        async def get_session():
+            return dbsession.get()
+
+        return await group.submit(get_session()), dbsession.get()
+
+    assert asyncio.run(main()) == (None, "request session")